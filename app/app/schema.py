@@ -0,0 +1,239 @@
+"""
+Precomputed OpenAPI schema.
+
+Generating the schema introspects every view and serializer, so it is built
+once per format (at deploy time with ``manage.py build_schema``, or lazily
+once per process) and served from memory with a content-hash ETag and a
+pre-gzipped body. Artifacts on disk carry a fingerprint of the code they
+were generated from and are rebuilt when it no longer matches.
+"""
+import gzip
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+
+import django
+import drf_spectacular
+import rest_framework
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+
+from drf_spectacular.plumbing import set_query_parameters
+from drf_spectacular.renderers import OpenApiJsonRenderer, OpenApiYamlRenderer
+from drf_spectacular.settings import spectacular_settings
+from drf_spectacular.utils import extend_schema
+from drf_spectacular.views import (
+    SCHEMA_KWARGS,
+    SpectacularAPIView,
+    SpectacularSwaggerView,
+)
+
+
+DEFAULT_SCHEMA_CACHE = {
+    'ENABLED': True,
+    'DIR': None,
+}
+
+RENDERERS = {
+    'yaml': OpenApiYamlRenderer,
+    'json': OpenApiJsonRenderer,
+}
+
+MANIFEST = 'manifest.json'
+
+
+def _get_config():
+    return {**DEFAULT_SCHEMA_CACHE, **getattr(settings, 'SCHEMA_CACHE', {})}
+
+
+class SchemaArtifact:
+    """A rendered schema body with its gzipped copy and content hash."""
+
+    def __init__(self, body, gzipped=None, digest=None):
+        self.body = body
+        self.gzipped = gzipped if gzipped is not None else gzip.compress(
+            body, compresslevel=9, mtime=0)
+        self.digest = digest or hashlib.sha256(body).hexdigest()
+
+    @property
+    def etag(self):
+        return f'"{self.digest[:32]}"'
+
+
+def source_fingerprint():
+    """
+    Return a hash of what the schema is generated from: the project's
+    Python sources, SPECTACULAR_SETTINGS and the Django, DRF and
+    drf-spectacular versions.
+    """
+    digest = hashlib.sha256()
+    for version in (django.__version__, rest_framework.VERSION,
+                    drf_spectacular.__version__):
+        digest.update(f'{version}\n'.encode())
+    digest.update(repr(sorted(
+        getattr(settings, 'SPECTACULAR_SETTINGS', {}).items())).encode())
+    base_dir = Path(settings.BASE_DIR)
+    for path in sorted(base_dir.rglob('*.py')):
+        digest.update(path.relative_to(base_dir).as_posix().encode())
+        digest.update(path.read_bytes())
+    return digest.hexdigest()
+
+
+def render_schema(fmt):
+    """Generate the public schema and render it as yaml or json bytes."""
+    generator = spectacular_settings.DEFAULT_GENERATOR_CLASS()
+    schema = generator.get_schema(request=None, public=True)
+    return RENDERERS[fmt]().render(schema, renderer_context={})
+
+
+def build_artifacts():
+    """Return freshly generated artifacts for every format."""
+    return {fmt: SchemaArtifact(render_schema(fmt)) for fmt in RENDERERS}
+
+
+def _write_file(path, data):
+    # Replace the file in one step, so readers never see half of it.
+    tmp = path.with_name(f'.{path.name}.{os.getpid()}.tmp')
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+def write_artifacts(artifacts, directory, fingerprint=None):
+    """
+    Write artifacts and a manifest of their hashes to directory.
+
+    :param fingerprint: source_fingerprint() of the code the artifacts were
+        generated from, computed when not given
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    manifest = {
+        'fingerprint': fingerprint or source_fingerprint(),
+        'digests': {},
+    }
+    for fmt, artifact in artifacts.items():
+        _write_file(directory / f'schema.{fmt}', artifact.body)
+        _write_file(directory / f'schema.{fmt}.gz', artifact.gzipped)
+        manifest['digests'][fmt] = artifact.digest
+    _write_file(directory / MANIFEST, json.dumps(manifest, indent=2).encode())
+
+
+def read_artifacts(directory, fingerprint=None):
+    """
+    Load artifacts written by write_artifacts.
+
+    :param fingerprint: Expected source_fingerprint(), computed when not
+        given
+    :return: Artifacts, or None if absent, incomplete or built from other
+        code
+    """
+    directory = Path(directory)
+    try:
+        manifest = json.loads((directory / MANIFEST).read_text())
+        if manifest.get('fingerprint') != (fingerprint or source_fingerprint()):
+            return None
+        artifacts = {
+            fmt: SchemaArtifact(
+                (directory / f'schema.{fmt}').read_bytes(),
+                (directory / f'schema.{fmt}.gz').read_bytes(),
+                digest,
+            )
+            for fmt, digest in manifest['digests'].items()
+        }
+    except (OSError, ValueError, KeyError, AttributeError):
+        return None
+    for artifact in artifacts.values():
+        if hashlib.sha256(artifact.body).hexdigest() != artifact.digest:
+            return None
+    return artifacts
+
+
+_artifacts = None
+_artifacts_lock = threading.Lock()
+
+
+def get_artifacts():
+    """
+    Return the schema artifacts, loading or building them once.
+
+    Artifacts in ``SCHEMA_CACHE['DIR']`` that are missing or stale are
+    rebuilt and written back, so the other processes can load them.
+    """
+    global _artifacts
+    if _artifacts is None:
+        with _artifacts_lock:
+            if _artifacts is None:
+                _artifacts = _load_or_build(_get_config()['DIR'])
+    return _artifacts
+
+
+def _load_or_build(directory):
+    if not directory:
+        return build_artifacts()
+    fingerprint = source_fingerprint()
+    artifacts = read_artifacts(directory, fingerprint)
+    if artifacts is None:
+        artifacts = build_artifacts()
+        try:
+            write_artifacts(artifacts, directory, fingerprint)
+        except OSError:
+            pass
+    return artifacts
+
+
+def reset_artifacts():
+    """Forget the loaded artifacts."""
+    global _artifacts
+    with _artifacts_lock:
+        _artifacts = None
+
+
+def schema_version():
+    """Return a short hash identifying the current schema."""
+    return get_artifacts()['json'].digest[:16]
+
+
+class CachedSchemaView(SpectacularAPIView):
+    """SpectacularAPIView serving the precomputed schema."""
+
+    @extend_schema(**SCHEMA_KWARGS)
+    def get(self, request, *args, **kwargs):
+        if (not _get_config()['ENABLED'] or self.custom_settings
+                or request.GET.get('lang') or request.GET.get('version')):
+            return super().get(request, *args, **kwargs)
+
+        renderer = request.accepted_renderer
+        artifact = get_artifacts()[renderer.format]
+        if_none_match = request.headers.get('If-None-Match')
+        if if_none_match and artifact.etag in parse_etags(if_none_match):
+            response = HttpResponseNotModified()
+        elif 'gzip' in request.headers.get('Accept-Encoding', ''):
+            response = HttpResponse(
+                artifact.gzipped, content_type=renderer.media_type)
+            response['Content-Encoding'] = 'gzip'
+        else:
+            response = HttpResponse(
+                artifact.body, content_type=renderer.media_type)
+
+        response['ETag'] = artifact.etag
+        if request.GET.get('v') == schema_version():
+            response['Cache-Control'] = 'public, max-age=31536000, immutable'
+        else:
+            response['Cache-Control'] = 'no-cache'
+        patch_vary_headers(response, ['Accept', 'Accept-Encoding'])
+        return response
+
+
+class CachedSwaggerView(SpectacularSwaggerView):
+    """Swagger UI pointing at the versioned, cacheable schema URL."""
+
+    def _get_schema_url(self, request):
+        url = super()._get_schema_url(request)
+        if not _get_config()['ENABLED']:
+            return url
+        return set_query_parameters(url, v=schema_version())
@@ -10,11 +10,18 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.1/ref/settings/
 """
 
+import os
+import sys
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+# database/ sits next to the project and is imported as database.<name>.
+REPO_DIR = BASE_DIR.parent
+if str(REPO_DIR) not in sys.path:
+    sys.path.append(str(REPO_DIR))
+
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/4.1/howto/deployment/checklist/
@@ -46,6 +53,9 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'core.middleware.AdmissionControlMiddleware',
+    'core.middleware.ReplicaPinningMiddleware',
+    'database.manager.QueryOptimizationMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -85,6 +95,24 @@ DATABASES = {
     }
 }
 
+# Read replicas, e.g. DATABASE_REPLICAS=replica1,replica2. Locally each one
+# is a SQLite copy of the primary, refreshed with `manage.py sync_replicas`.
+
+REPLICA_ALIASES = [
+    name for name in os.environ.get('DATABASE_REPLICAS', '').split(',') if name
+]
+for _name in REPLICA_ALIASES:
+    DATABASES[_name] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / f'db.{_name}.sqlite3',
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = [
+    'core.sharding.ShardRouter',
+    'core.routers.ReplicaRouter',
+]
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
@@ -131,4 +159,173 @@ AUTH_USER_MODEL = 'core.User'
 
 REST_FRAMEWORK = {
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
-}
\ No newline at end of file
+    'EXCEPTION_HANDLER': 'core.views.exception_handler',
+}
+
+
+# Token authentication cache used by user.authentication.CachedTokenAuthentication.
+# Entries live in a per-process LRU; set CACHE_ALIAS to a shared cache (e.g.
+# redis/memcached) so token/user invalidation reaches every worker.
+
+TOKEN_AUTH_CACHE = {
+    'MAX_SIZE': 10000,
+    'TTL': 60,
+    'CACHE_ALIAS': None,
+}
+
+
+# Run password hashing/verification in a bounded process pool instead of on
+# the request thread. When WORKERS + MAX_QUEUE jobs are already in flight,
+# signup/login fail fast with 503 and a Retry-After header. Bulk imports use
+# BULK_WORKERS processes of their own (default: half of WORKERS).
+
+PASSWORD_HASHING_POOL = {
+    'ENABLED': os.environ.get('PASSWORD_HASHING_POOL', '0') == '1',
+    'WORKERS': None,
+    'BULK_WORKERS': None,
+    'MAX_QUEUE': 32,
+    'TIMEOUT': 10,
+    'RETRY_AFTER': 1,
+}
+
+
+# Bulk user import (POST /api/user/bulk/ and manage.py import_users).
+# Passwords are hashed in PASSWORD_HASHING_POOL's bulk processes when the
+# pool is enabled, inline otherwise; import_users --workers N uses a pool of
+# its own instead.
+
+USER_IMPORT = {
+    'CHUNK_SIZE': 1000,
+}
+
+
+# Streaming user export (GET /api/user/export/ and manage.py export_users).
+
+USER_EXPORT = {
+    'CHUNK_SIZE': 2000,
+}
+
+
+# Precomputed OpenAPI schema served at /api/schema/. `manage.py build_schema`
+# writes it to DIR at deploy time; without it the schema is built once per
+# process on first request. Artifacts built from other code or package
+# versions are rebuilt and written back to DIR.
+
+SCHEMA_CACHE = {
+    'ENABLED': True,
+    'DIR': BASE_DIR / 'openapi',
+}
+
+
+# Adaptive (AIMD) concurrency limits per URL name, enforced by
+# core.middleware.AdmissionControlMiddleware. Requests over a route's limit
+# get a 503 with Retry-After; /api/admission/ shows limits and rejections.
+# Limits are counted per process, so they only bite when a process serves
+# requests concurrently: gunicorn with --threads, or the uvicorn workers of
+# scripts/gunicorn-asgi.service. Plain sync workers (scripts/gunicorn.service)
+# run one request at a time and never reach a limit, so it is off here.
+
+ADMISSION_CONTROL = {
+    'ENABLED': False,
+    'DEFAULT': None,
+    'RETRY_AFTER': 1,
+    'ROUTES': {
+        'user:create': {
+            'INITIAL_LIMIT': 8, 'MAX_LIMIT': 32, 'TARGET_LATENCY': 1.0,
+        },
+        'user:token': {
+            'INITIAL_LIMIT': 8, 'MAX_LIMIT': 32, 'TARGET_LATENCY': 1.0,
+        },
+        'user:me': {
+            'INITIAL_LIMIT': 32, 'MAX_LIMIT': 256, 'TARGET_LATENCY': 0.2,
+        },
+    },
+}
+
+
+# Users looked up by pk or email (session auth, User.cached) are served
+# from a per-process LRU in front of CACHE_ALIAS; login always reads the
+# database. Writes invalidate both levels; other processes may serve their
+# local copy for LOCAL_TTL.
+
+USER_CACHE = {
+    'LOCAL_MAX_SIZE': 10000,
+    'LOCAL_TTL': 5,
+    'TTL': 300,
+    'NEGATIVE_TTL': 30,
+    'CACHE_ALIAS': 'default',
+}
+
+AUTHENTICATION_BACKENDS = ['core.backends.CachedModelBackend']
+
+
+# Query results cached with database.query_cache are tagged with the models
+# they read. Saving or deleting a row of a WATCH_MODELS model invalidates
+# its tags now and again on commit (connected in CoreConfig.ready).
+
+QUERY_CACHE = {
+    'CACHE_ALIAS': 'default',
+    'TIMEOUT': 300,
+    'WATCH_MODELS': ['core.User'],
+}
+
+
+# Statements slower than THRESHOLD_MS (timed by
+# database.manager.QueryOptimizationMiddleware) are appended to PATH, with
+# EXPLAIN output for the worst shapes. Read it with `manage.py slow_queries`.
+
+SLOW_QUERY_LOG = {
+    'ENABLED': True,
+    'THRESHOLD_MS': 100,
+    'EXPLAIN_TOP': 20,
+    'PATH': BASE_DIR / 'slow_queries.jsonl',
+}
+
+
+# Reads go to healthy replicas (core.routers.ReplicaRouter). After a write a
+# client reads from the primary for PIN_SECONDS. Replicas failing their
+# probe or lagging more than MAX_LAG seconds are ejected for EJECT_SECONDS.
+# Browsers are pinned with a cookie; token clients by an entry in
+# CACHE_ALIAS. With more than one worker process that must be a cache shared
+# by all of them (e.g. redis/memcached): on the default LocMemCache a token
+# client's next read may land on a worker that never saw the pin and read
+# its own write from a lagging replica.
+
+DATABASE_REPLICAS = {
+    'ALIASES': REPLICA_ALIASES,
+    'MAX_LAG': 5,
+    'CHECK_INTERVAL': 5,
+    'EJECT_SECONDS': 30,
+    'PIN_SECONDS': 5,
+    'CACHE_ALIAS': 'default',
+}
+
+
+# Consistent-hash shard map (core.sharding). SHARDS maps a shard name to its
+# database ALIAS and TABLE_SUFFIX; MODELS maps a model label to the field
+# used as its shard key, e.g. {'core.User': 'email'}. Empty means unsharded.
+# A rebalance publishes its new map under CACHE_KEY; processes re-read it at
+# most every REFRESH_INTERVAL seconds. CACHE_ALIAS must be a cache shared by
+# every worker (e.g. redis/memcached): publishing or freezing writes on a
+# per-process LocMemCache raises ImproperlyConfigured.
+
+SHARDING = {
+    'VNODES': 128,
+    'SHARDS': {},
+    'MODELS': {},
+    'CACHE_ALIAS': 'default',
+    'CACHE_KEY': 'sharding:map',
+    'REFRESH_INTERVAL': 1,
+}
+
+
+# Rolling partition maintenance (celery maintain_partitions_task), run every
+# SCHEDULE seconds. Each policy is a PartitionPolicy, e.g.
+# {'TABLE': 'events', 'COLUMN': 'created_at', 'STRATEGY': 'range',
+#  'INTERVAL': 'month', 'PREMAKE': 3, 'RETENTION': 12, 'EXPIRE': 'drop'}.
+
+PARTITION_MAINTENANCE = {
+    'CONNECTION_STRING': os.environ.get('PARTITION_MAINTENANCE_DSN'),
+    'SCHEDULE': 3600,
+    'POLICIES': [],
+}
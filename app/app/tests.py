@@ -1,11 +1,105 @@
 """Sample tests"""
 
-from django.test import SimpleTestCase
-from app import calc
+import gzip
+import json
+import tempfile
+from unittest.mock import patch
+
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+
+from app import calc, schema
+
+
+SCHEMA_URL = reverse('api-schema')
 
 class CalcTests(SimpleTestCase):
     "test the calc module"
 
     def test_add_numbers(self):
         res = calc.add(1,2)
-        self.assertEqual(res, 3)
\ No newline at end of file
+        self.assertEqual(res, 3)
+
+@override_settings(SCHEMA_CACHE={'ENABLED': True, 'DIR': None})
+class SchemaCacheTests(SimpleTestCase):
+    "test the precomputed OpenAPI schema"
+
+    def setUp(self):
+        schema.reset_artifacts()
+        self.addCleanup(schema.reset_artifacts)
+
+    def test_schema_generated_once(self):
+        "schema is generated once and served with a stable etag"
+        with patch('app.schema.render_schema',
+                   wraps=schema.render_schema) as render:
+            first = self.client.get(SCHEMA_URL)
+            second = self.client.get(SCHEMA_URL)
+
+        self.assertEqual(render.call_count, len(schema.RENDERERS))
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first['ETag'], second['ETag'])
+        self.assertIn(b'openapi', first.content)
+
+    def test_schema_not_modified(self):
+        "matching If-None-Match returns 304 without a body"
+        etag = self.client.get(SCHEMA_URL)['ETag']
+
+        res = self.client.get(SCHEMA_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res.content, b'')
+
+    def test_schema_gzipped(self):
+        "gzip-capable clients get the precompressed body"
+        plain = self.client.get(SCHEMA_URL)
+        res = self.client.get(SCHEMA_URL, HTTP_ACCEPT_ENCODING='gzip')
+
+        self.assertEqual(res['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(res.content), plain.content)
+        self.assertIn('Accept-Encoding', res['Vary'])
+
+    def test_schema_json(self):
+        "json is served through content negotiation"
+        res = self.client.get(
+            SCHEMA_URL, HTTP_ACCEPT='application/vnd.oai.openapi+json')
+
+        self.assertEqual(json.loads(res.content)['info']['title'], '')
+
+    def test_schema_loaded_from_build_dir(self):
+        "artifacts written at deploy time are served as-is"
+        with tempfile.TemporaryDirectory() as directory:
+            artifacts = {
+                fmt: schema.SchemaArtifact(b'openapi: prebuilt\n')
+                for fmt in schema.RENDERERS
+            }
+            schema.write_artifacts(artifacts, directory)
+            with self.settings(SCHEMA_CACHE={'DIR': directory}):
+                res = self.client.get(SCHEMA_URL)
+
+        self.assertEqual(res.content, b'openapi: prebuilt\n')
+        self.assertEqual(res['ETag'], artifacts['yaml'].etag)
+
+    def test_stale_build_dir_regenerated(self):
+        "artifacts built from other code are regenerated and rewritten"
+        with tempfile.TemporaryDirectory() as directory:
+            artifacts = {
+                fmt: schema.SchemaArtifact(b'openapi: stale\n')
+                for fmt in schema.RENDERERS
+            }
+            schema.write_artifacts(artifacts, directory, fingerprint='old')
+            with self.settings(SCHEMA_CACHE={'DIR': directory}):
+                res = self.client.get(SCHEMA_URL)
+            fresh = schema.read_artifacts(directory)
+
+        self.assertNotEqual(res.content, b'openapi: stale\n')
+        self.assertIn(b'openapi', res.content)
+        self.assertEqual(fresh['yaml'].body, res.content)
+
+    def test_docs_reference_versioned_schema(self):
+        "swagger ui loads the schema url pinned to its content hash"
+        res = self.client.get(reverse('api-docs'))
+        version = schema.schema_version()
+
+        self.assertIn(version, res.content.decode())
+        res = self.client.get(SCHEMA_URL, {'v': version})
+        self.assertIn('immutable', res['Cache-Control'])
@@ -15,18 +15,23 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path, include
-from drf_spectacular.views import (
-    SpectacularAPIView,
-    SpectacularSwaggerView,)
+
+from app.schema import CachedSchemaView, CachedSwaggerView
+from core.views import AdmissionStatsView
 
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/user/', include('user.urls')),
-    path('api/schema/', SpectacularAPIView.as_view(), name='api-schema'),
+    path(
+        'api/admission/',
+        AdmissionStatsView.as_view(),
+        name='admission-stats',
+    ),
+    path('api/schema/', CachedSchemaView.as_view(), name='api-schema'),
     path(
         'api/docs/',
-        SpectacularSwaggerView.as_view(url_name='api-schema'),
+        CachedSwaggerView.as_view(url_name='api-schema'),
         name='api-docs',
     ),
 ]
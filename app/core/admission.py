@@ -0,0 +1,160 @@
+"""
+Adaptive admission control.
+
+Each configured route gets a concurrency limit that follows AIMD: every
+request that finishes under the route's target latency raises the limit by
+1/limit (about +1 per limit's worth of requests), and every slow or failed
+request multiplies it by BACKOFF. Requests beyond the limit are rejected
+before any work is done, so a slow database sheds load instead of piling up
+blocked workers.
+"""
+import threading
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+
+DEFAULT_LIMITER = {
+    'INITIAL_LIMIT': 20,
+    'MIN_LIMIT': 1,
+    'MAX_LIMIT': 200,
+    'TARGET_LATENCY': 0.5,
+    'BACKOFF': 0.9,
+}
+
+DEFAULT_ADMISSION_CONTROL = {
+    'ENABLED': False,
+    'DEFAULT': None,
+    'ROUTES': {},
+    'RETRY_AFTER': 1,
+}
+
+
+class AdaptiveLimiter:
+    """AIMD concurrency limit for one route."""
+
+    def __init__(self, name, initial_limit=20, min_limit=1, max_limit=200,
+                 target_latency=0.5, backoff=0.9):
+        self.name = name
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.target_latency = target_latency
+        self.backoff = backoff
+        self.in_flight = 0
+        self.accepted = 0
+        self.rejected = 0
+        self.latency = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, name, config):
+        config = {**DEFAULT_LIMITER, **config}
+        return cls(
+            name,
+            initial_limit=config['INITIAL_LIMIT'],
+            min_limit=config['MIN_LIMIT'],
+            max_limit=config['MAX_LIMIT'],
+            target_latency=config['TARGET_LATENCY'],
+            backoff=config['BACKOFF'],
+        )
+
+    def try_acquire(self):
+        """Take a slot, or return False if the route is at its limit."""
+        with self._lock:
+            if self.in_flight >= int(self.limit):
+                self.rejected += 1
+                return False
+            self.in_flight += 1
+            self.accepted += 1
+            return True
+
+    def release(self, latency, failed=False):
+        """Give back a slot and adapt the limit to how the request went."""
+        with self._lock:
+            self.in_flight -= 1
+            self.latency = latency if self.latency is None else (
+                0.8 * self.latency + 0.2 * latency)
+            if failed or latency > self.target_latency:
+                self.limit = max(self.min_limit, self.limit * self.backoff)
+            else:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'limit': int(self.limit),
+                'in_flight': self.in_flight,
+                'accepted': self.accepted,
+                'rejected': self.rejected,
+                'latency_ms': round(self.latency * 1000, 2)
+                if self.latency is not None else None,
+                'target_latency_ms': self.target_latency * 1000,
+            }
+
+
+class LimiterRegistry:
+    """Limiters per route name, created from ADMISSION_CONTROL."""
+
+    def __init__(self, config):
+        self.config = {**DEFAULT_ADMISSION_CONTROL, **config}
+        self._limiters = {}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.config['ENABLED']
+
+    @property
+    def retry_after(self):
+        return self.config['RETRY_AFTER']
+
+    def get(self, route):
+        """Return the limiter for route, or None if it isn't limited."""
+        limiter = self._limiters.get(route)
+        if limiter is not None:
+            return limiter
+        route_config = self.config['ROUTES'].get(route, self.config['DEFAULT'])
+        if route_config is None:
+            return None
+        with self._lock:
+            if route not in self._limiters:
+                self._limiters[route] = AdaptiveLimiter.from_config(
+                    route, route_config)
+            return self._limiters[route]
+
+    def stats(self):
+        return {
+            route: limiter.stats()
+            for route, limiter in sorted(self._limiters.items())
+        }
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry():
+    """Return the process-wide limiter registry."""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = LimiterRegistry(
+                    getattr(settings, 'ADMISSION_CONTROL', {}))
+    return _registry
+
+
+def reset_registry():
+    """Forget every limiter (used when settings change)."""
+    global _registry
+    with _registry_lock:
+        _registry = None
+
+
+@receiver(setting_changed)
+def reload_admission_control(setting, **kwargs):
+    """Rebuild the limiters when their settings are overridden."""
+    if setting == 'ADMISSION_CONTROL':
+        reset_registry()
@@ -0,0 +1,17 @@
+"""
+Authentication backends.
+"""
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+
+
+class CachedModelBackend(ModelBackend):
+    """ModelBackend that loads the session user through the user cache."""
+
+    def get_user(self, user_id):
+        user_model = get_user_model()
+        try:
+            user = user_model.cached.get(pk=user_id)
+        except user_model.DoesNotExist:
+            return None
+        return user if self.user_can_authenticate(user) else None
@@ -0,0 +1,60 @@
+"""
+Helpers shared by the benchmark management commands.
+"""
+import json
+import urllib.error
+import urllib.request
+from contextlib import contextmanager
+
+from django.db import connection
+
+from database.slowlog import percentile
+
+
+def summarize(samples):
+    """Return a dict of latency percentiles in milliseconds."""
+    return {
+        'count': len(samples),
+        'p50': percentile(samples, 50) * 1000,
+        'p95': percentile(samples, 95) * 1000,
+        'p99': percentile(samples, 99) * 1000,
+        'max': (max(samples) if samples else 0.0) * 1000,
+    }
+
+
+def format_summary(label, samples):
+    """Format a latency summary as a single line."""
+    stats = summarize(samples)
+    return (
+        f"{label}: n={stats['count']} p50={stats['p50']:.1f}ms "
+        f"p95={stats['p95']:.1f}ms p99={stats['p99']:.1f}ms "
+        f"max={stats['max']:.1f}ms"
+    )
+
+
+@contextmanager
+def temporary_database():
+    """Run the body against a throwaway test database."""
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+def http_request(url, data=None, token=None, method=None, timeout=30):
+    """Send a JSON request, returning (status, body); status 0 on error."""
+    headers = {'Content-Type': 'application/json'}
+    if token:
+        headers['Authorization'] = f'Token {token}'
+    body = json.dumps(data).encode() if data is not None else None
+    req = urllib.request.Request(
+        url, data=body, headers=headers, method=method)
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as res:
+            return res.status, res.read()
+    except urllib.error.HTTPError as exc:
+        return exc.code, exc.read()
+    except (urllib.error.URLError, OSError):
+        return 0, b''
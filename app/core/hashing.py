@@ -0,0 +1,234 @@
+"""
+Password hashing offloaded to a bounded process pool.
+
+PBKDF2 is pure CPU work; running it on the request thread pins a worker for
+the whole hash. With ``PASSWORD_HASHING_POOL['ENABLED']`` on, hashing and
+verification run in a process pool instead, and requests that arrive while
+the pool and its queue are full are rejected straight away with
+HashingPoolBusy, which the API answers with a 503. Bulk imports hash in
+a separate set of BULK_WORKERS processes, so a large import never queues
+in front of a login.
+"""
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+
+import django
+from asgiref.sync import sync_to_async
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth import hashers
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.translation import gettext_lazy as _
+
+
+DEFAULT_HASHING_POOL = {
+    'ENABLED': False,
+    'WORKERS': None,
+    'BULK_WORKERS': None,
+    'MAX_QUEUE': 32,
+    'TIMEOUT': 10,
+    'RETRY_AFTER': 1,
+}
+
+
+class HashingPoolBusy(Exception):
+    """
+    Raised when the hashing pool has no free slot.
+
+    ``wait`` is the number of seconds to suggest in a Retry-After header;
+    core.views.exception_handler turns it into a 503 response.
+    """
+
+    def __init__(self, wait=1):
+        super().__init__(_('Server is busy, please retry shortly.'))
+        self.wait = wait
+
+
+def _init_worker(settings_module):
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+    if not settings.configured or not apps.ready:
+        django.setup()
+
+
+def _make_password(raw_password):
+    return hashers.make_password(raw_password)
+
+
+def _check_password(raw_password, encoded):
+    needs_update = []
+    valid = hashers.check_password(
+        raw_password, encoded, setter=lambda raw: needs_update.append(True))
+    return valid, bool(needs_update)
+
+
+class PasswordHashingPool:
+    """Process pool with a fixed number of slots for hashing jobs."""
+
+    def __init__(self, workers=None, max_queue=32, timeout=10,
+                 retry_after=1, bulk_workers=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.bulk_workers = bulk_workers or max(1, self.workers // 2)
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self._slots = threading.BoundedSemaphore(self.workers + max_queue)
+        self._executor = None
+        self._bulk_executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self.rejected = 0
+
+    def make_password(self, raw_password):
+        """Hash a password in the pool."""
+        return self._run(_make_password, raw_password)
+
+    def check_password(self, raw_password, encoded):
+        """Return (valid, needs_update) for a password checked in the pool."""
+        return self._run(_check_password, raw_password, encoded)
+
+    def hash_passwords(self, raw_passwords, chunksize=16):
+        """
+        Hash many passwords in the bulk processes, in order.
+
+        They are separate from the processes serving signup and login, so
+        those never wait behind an import.
+        """
+        return hash_passwords(raw_passwords, self._get_executor(bulk=True),
+                              chunksize)
+
+    def shutdown(self):
+        """Stop the worker processes."""
+        with self._lock:
+            if self._pid == os.getpid():
+                for executor in (self._executor, self._bulk_executor):
+                    if executor is not None:
+                        executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = self._bulk_executor = None
+
+    def _get_executor(self, bulk=False):
+        with self._lock:
+            # A forked gunicorn worker must not reuse its parent's pools.
+            if self._pid != os.getpid():
+                self._executor = self._bulk_executor = None
+                self._pid = os.getpid()
+            if bulk:
+                if self._bulk_executor is None:
+                    self._bulk_executor = hashing_executor(self.bulk_workers)
+                return self._bulk_executor
+            if self._executor is None:
+                self._executor = hashing_executor(self.workers)
+            return self._executor
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise HashingPoolBusy(wait=self.retry_after)
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda f: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            future.cancel()
+            raise HashingPoolBusy(wait=self.retry_after)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_config():
+    return {
+        **DEFAULT_HASHING_POOL,
+        **getattr(settings, 'PASSWORD_HASHING_POOL', {}),
+    }
+
+
+def pool_enabled():
+    """Return True if hashing should go through the process pool."""
+    return _get_config()['ENABLED']
+
+
+def get_pool():
+    """Return the process-wide hashing pool built from settings."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                config = _get_config()
+                _pool = PasswordHashingPool(
+                    workers=config['WORKERS'],
+                    max_queue=config['MAX_QUEUE'],
+                    timeout=config['TIMEOUT'],
+                    retry_after=config['RETRY_AFTER'],
+                    bulk_workers=config['BULK_WORKERS'],
+                )
+    return _pool
+
+
+def reset_pool():
+    """Shut down and forget the process-wide hashing pool."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+        _pool = None
+
+
+def hashing_executor(workers=None):
+    """Return a new process pool that can run hashing jobs."""
+    return ProcessPoolExecutor(
+        max_workers=workers or os.cpu_count() or 1,
+        initializer=_init_worker,
+        initargs=(os.environ.get('DJANGO_SETTINGS_MODULE', 'app.settings'),),
+    )
+
+
+def hash_passwords(raw_passwords, executor=None, chunksize=16):
+    """Hash many passwords, spread over the executor's processes."""
+    if executor is None:
+        return [hashers.make_password(raw) for raw in raw_passwords]
+    return list(executor.map(_make_password, raw_passwords,
+                             chunksize=chunksize))
+
+
+def make_password(raw_password):
+    """Hash a password, in the pool when it is enabled."""
+    if not pool_enabled():
+        return hashers.make_password(raw_password)
+    return get_pool().make_password(raw_password)
+
+
+def check_password(raw_password, encoded, setter=None):
+    """Check a password, in the pool when it is enabled."""
+    if not pool_enabled():
+        return hashers.check_password(raw_password, encoded, setter)
+    valid, needs_update = get_pool().check_password(raw_password, encoded)
+    if valid and needs_update and setter:
+        setter(raw_password)
+    return valid
+
+
+async def amake_password(raw_password):
+    """Hash a password without blocking the event loop."""
+    return await sync_to_async(make_password, thread_sensitive=False)(
+        raw_password)
+
+
+async def acheck_password(raw_password, encoded, setter=None):
+    """Check a password without blocking the event loop."""
+    return await sync_to_async(check_password, thread_sensitive=False)(
+        raw_password, encoded, setter)
+
+
+@receiver(setting_changed)
+def reload_hashing_pool(setting, **kwargs):
+    """Rebuild the pool when its settings are overridden."""
+    if setting == 'PASSWORD_HASHING_POOL':
+        reset_pool()
@@ -0,0 +1,31 @@
+"""
+Django command to precompute the OpenAPI schema served at /api/schema/.
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from app.schema import build_artifacts, write_artifacts
+
+
+class Command(BaseCommand):
+    """Django command to build the schema artifacts at deploy time."""
+
+    help = 'Write the yaml/json schema, gzipped copies and content hashes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', default=None)
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        directory = options['dir'] or getattr(
+            settings, 'SCHEMA_CACHE', {}).get('DIR')
+        if not directory:
+            raise CommandError('Set SCHEMA_CACHE["DIR"] or pass --dir.')
+
+        artifacts = build_artifacts()
+        write_artifacts(artifacts, directory)
+        for fmt, artifact in artifacts.items():
+            self.stdout.write(
+                f'schema.{fmt}: {len(artifact.body)} bytes, '
+                f'{len(artifact.gzipped)} gzipped, sha256 {artifact.digest}')
+        self.stdout.write(self.style.SUCCESS(f'Schema written to {directory}'))
@@ -0,0 +1,88 @@
+"""
+Django command to show the slowest query shapes from the slow query log.
+"""
+import json
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from database.slowlog import percentile
+
+
+SORT_KEYS = {'total': 'total_ms', 'count': 'count', 'p95': 'p95_ms'}
+
+
+def read_log(path):
+    """Yield the records and plans of a JSONL slow query log."""
+    # The rotated file holds the older half of the history.
+    for name in (f'{path}.1', path):
+        if not os.path.exists(name):
+            continue
+        with open(name, encoding='utf-8') as log_file:
+            for line in log_file:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+
+def aggregate(records):
+    """Group records by shape with count, total and p95 time."""
+    shapes = {}
+    plans = {}
+    for record in records:
+        if record.get('type') == 'plan':
+            plans[record['shape']] = record['plan']
+            continue
+        shape = shapes.setdefault(record['shape'], {
+            'shape': record['shape'],
+            'alias': record['alias'],
+            'durations': [],
+        })
+        shape['durations'].append(record['duration_ms'])
+
+    for shape in shapes.values():
+        durations = shape.pop('durations')
+        shape['count'] = len(durations)
+        shape['total_ms'] = sum(durations)
+        shape['p95_ms'] = percentile(durations, 95)
+        shape['plan'] = plans.get(shape['shape'])
+    return list(shapes.values())
+
+
+class Command(BaseCommand):
+    """Django command to dump the top offenders of the slow query log."""
+
+    help = 'Show the slowest query shapes by total time, count or p95.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default=None)
+        parser.add_argument('--sort', choices=SORT_KEYS, default='total')
+        parser.add_argument('--limit', type=int, default=10)
+        parser.add_argument('--plans', action='store_true',
+                            help='Also print the captured EXPLAIN output.')
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        path = options['path'] or getattr(
+            settings, 'SLOW_QUERY_LOG', {}).get('PATH')
+        if not path:
+            raise CommandError('Set SLOW_QUERY_LOG["PATH"] or pass --path.')
+
+        shapes = sorted(aggregate(read_log(path)),
+                        key=lambda shape: shape[SORT_KEYS[options['sort']]],
+                        reverse=True)[:options['limit']]
+        if not shapes:
+            self.stdout.write('No slow queries logged.')
+            return
+
+        for rank, shape in enumerate(shapes, 1):
+            self.stdout.write(
+                f"{rank:>3}. total {shape['total_ms']:.1f}ms  "
+                f"count {shape['count']}  p95 {shape['p95_ms']:.1f}ms  "
+                f"[{shape['alias']}]")
+            self.stdout.write(f"     {shape['shape']}")
+            if options['plans'] and shape['plan']:
+                for line in shape['plan'].splitlines():
+                    self.stdout.write(f'       {line}')
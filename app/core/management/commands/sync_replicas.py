@@ -0,0 +1,37 @@
+"""
+Django command to copy the primary SQLite database over the local replicas.
+"""
+import sqlite3
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class Command(BaseCommand):
+    """Django command to refresh SQLite replicas from the primary."""
+
+    help = 'Copy the primary SQLite file into each replica alias.'
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        aliases = getattr(settings, 'DATABASE_REPLICAS', {}).get('ALIASES')
+        if not aliases:
+            raise CommandError('No replicas configured (DATABASE_REPLICAS).')
+        primary = connections[DEFAULT_DB_ALIAS].settings_dict
+        if primary['ENGINE'] != 'django.db.backends.sqlite3':
+            raise CommandError('Only SQLite replicas can be synced locally.')
+
+        source = sqlite3.connect(primary['NAME'])
+        try:
+            for alias in aliases:
+                connections[alias].close()
+                target = sqlite3.connect(connections[alias].settings_dict['NAME'])
+                try:
+                    source.backup(target)
+                finally:
+                    target.close()
+                self.stdout.write(f'{alias} synced')
+        finally:
+            source.close()
+        self.stdout.write(self.style.SUCCESS('Replicas up to date.'))
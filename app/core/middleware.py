@@ -0,0 +1,174 @@
+"""
+Middleware for the app.
+"""
+import hashlib
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.core.cache import caches
+from django.http import JsonResponse
+from django.utils.translation import gettext as _
+
+from core import routers
+from core.admission import get_registry
+
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class AdmissionControlMiddleware:
+    """Shed requests to routes that are over their adaptive limit.
+
+    The check runs in process_view, after URL resolution but before the view
+    (and its authentication) does any work. Works in both sync and async
+    mode, so async views under ASGI stay on the event loop. Limits are per
+    process: they need threaded or async workers to have any effect.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+            # Awaited by the handler instead of run in a thread.
+            self.process_view = self._aprocess_view
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        response = self.get_response(request)
+        _release(request, response)
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        _release(request, response)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        return _admit(request)
+
+    async def _aprocess_view(self, request, view_func, view_args, view_kwargs):
+        return _admit(request)
+
+
+def _admit(request):
+    registry = get_registry()
+    if not registry.enabled:
+        return None
+    limiter = registry.get(request.resolver_match.view_name)
+    if limiter is None:
+        return None
+    if not limiter.try_acquire():
+        response = JsonResponse(
+            {'detail': _('Server is busy, please retry shortly.')},
+            status=503,
+        )
+        response['Retry-After'] = str(registry.retry_after)
+        return response
+
+    request._admission_limiter = limiter
+    request._admission_start = time.perf_counter()
+    return None
+
+
+def _release(request, response):
+    limiter = getattr(request, '_admission_limiter', None)
+    if limiter is not None:
+        limiter.release(
+            time.perf_counter() - request._admission_start,
+            failed=response.status_code >= 500,
+        )
+
+
+class ReplicaPinningMiddleware:
+    """Keep clients on the primary database for a while after they write.
+
+    Browser clients are pinned with a cookie; clients sending an
+    Authorization header are pinned by an entry in CACHE_ALIAS keyed on its
+    hash, which only reaches other workers if that cache is shared.
+    Requests with unsafe methods always read from the primary. Works in
+    both sync and async mode.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        config = routers.get_config()
+        if not config['ALIASES']:
+            return self.get_response(request)
+
+        cache = caches[config['CACHE_ALIAS']]
+        pin_key = _pin_key(request, config['CACHE_PREFIX'])
+        pinned = _request_pinned(request, config) or (
+            pin_key is not None and cache.get(pin_key) is not None)
+
+        state, token = routers.start_request(pinned)
+        try:
+            response = self.get_response(request)
+        finally:
+            routers.end_request(token)
+
+        if _pin_client(request, response, state, config) and pin_key:
+            cache.set(pin_key, 1, timeout=config['PIN_SECONDS'])
+        return response
+
+    async def __acall__(self, request):
+        config = routers.get_config()
+        if not config['ALIASES']:
+            return await self.get_response(request)
+
+        cache = caches[config['CACHE_ALIAS']]
+        pin_key = _pin_key(request, config['CACHE_PREFIX'])
+        pinned = _request_pinned(request, config) or (
+            pin_key is not None and await cache.aget(pin_key) is not None)
+
+        state, token = routers.start_request(pinned)
+        try:
+            response = await self.get_response(request)
+        finally:
+            routers.end_request(token)
+
+        if _pin_client(request, response, state, config) and pin_key:
+            await cache.aset(pin_key, 1, timeout=config['PIN_SECONDS'])
+        return response
+
+
+def _request_pinned(request, config):
+    return (request.method not in SAFE_METHODS
+            or _cookie_active(request.COOKIES.get(config['COOKIE_NAME'])))
+
+
+def _pin_client(request, response, state, config):
+    # Sets the pin cookie when the request wrote; returns whether it did.
+    if not state.wrote and request.method in SAFE_METHODS:
+        return False
+    seconds = config['PIN_SECONDS']
+    response.set_cookie(
+        config['COOKIE_NAME'], str(int(time.time() + seconds)),
+        max_age=seconds, httponly=True, samesite='Lax')
+    return True
+
+
+def _pin_key(request, prefix):
+    authorization = request.headers.get('Authorization')
+    if not authorization:
+        return None
+    return prefix + hashlib.sha256(authorization.encode()).hexdigest()
+
+
+def _cookie_active(value):
+    try:
+        return value is not None and float(value) > time.time()
+    except ValueError:
+        return False
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
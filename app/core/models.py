@@ -6,14 +6,60 @@ import os
 
 from django.conf import settings
 from django.db import models
+from django.db.models import F
 from django.contrib.auth.models import (
     AbstractBaseUser,
     BaseUserManager,
     PermissionsMixin,
 )
 
+from core import hashing, routers
+from core.user_cache import get_user_cache
 
-class UserManager(BaseUserManager):
+
+def _token_cache():
+    # Imported late: the user app builds on core, not the other way round.
+    from user.authentication import get_token_cache
+    return get_token_cache()
+
+
+class UserQuerySet(models.QuerySet):
+    """Queryset that keeps the user cache in step with bulk writes.
+
+    Bulk writes don't load the rows they change; they drop every cached
+    user at once by moving the cache to a new generation. Cached auth
+    tokens carry their user too and are dropped the same way.
+    """
+
+    def update(self, **kwargs):
+        token_cache = _token_cache()
+        token_keys = token_cache.keys_for_users(self)
+        count = super().update(**kwargs)
+        get_user_cache().invalidate_all()
+        token_cache.invalidate_keys(token_keys)
+        return count
+
+    update.alters_data = True
+
+    def delete(self):
+        token_cache = _token_cache()
+        token_keys = token_cache.keys_for_users(self)
+        result = super().delete()
+        get_user_cache().invalidate_all()
+        token_cache.invalidate_keys(token_keys)
+        return result
+
+    delete.alters_data = True
+    delete.queryset_only = True
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = super().bulk_create(objs, *args, **kwargs)
+        # New addresses may be cached as missing.
+        get_user_cache().invalidate(emails=[obj.email for obj in objs])
+        return objs
+
+
+class UserManager(BaseUserManager.from_queryset(UserQuerySet)):
     """Manager for users."""
 
     def create_user(self, email, password=None, **extra_fields):
@@ -36,13 +82,90 @@ class UserManager(BaseUserManager):
         return user
 
 
+class CachedUserManager(UserManager):
+    """
+    Manager that serves ``get(pk=...)`` and ``get(email=...)`` from the
+    user cache. Any other lookup goes to the database as usual. Misses are
+    read from the primary, so a lagging replica can't refill the cache with
+    a row that was just changed.
+    """
+
+    def get(self, *args, **kwargs):
+        if args or len(kwargs) != 1 or self._db not in (None, 'default'):
+            return super().get(*args, **kwargs)
+        (lookup, value), = kwargs.items()
+        if lookup in ('pk', 'id', 'pk__exact', 'id__exact'):
+            return get_user_cache().get_by_pk(value, self._load_by_pk)
+        if lookup in ('email', 'email__exact'):
+            user = get_user_cache().get_by_email(value, self._load_by_email)
+            if user is None:
+                raise self.model.DoesNotExist(
+                    f'{self.model._meta.object_name} matching query does '
+                    'not exist.')
+            return user
+        return super().get(*args, **kwargs)
+
+    def _load_by_pk(self, pk):
+        with routers.pinned_to_primary():
+            return super().get(pk=pk)
+
+    def _load_by_email(self, email):
+        with routers.pinned_to_primary():
+            return self.filter(email=email).first()
+
+    def stats(self):
+        """Return the user cache hit/miss counters."""
+        return get_user_cache().stats()
+
+
 class User(AbstractBaseUser, PermissionsMixin):
     """User in the system."""
     email       = models.EmailField(max_length=255, unique=True)
     name        = models.CharField(max_length=255)
     is_active   = models.BooleanField(default=True)
     is_staff    = models.BooleanField(default=False)
+    version     = models.PositiveIntegerField(default=0, editable=False)
 
     objects     = UserManager()
+    cached      = CachedUserManager()
 
     USERNAME_FIELD = 'email'
+
+    def save(self, *args, **kwargs):
+        """Save the user, bumping its row version."""
+        if self._state.adding:
+            self.version = 1
+        else:
+            # Increment in the database so concurrent saves of stale copies
+            # can't end up sharing a version.
+            self.version = F('version') + 1
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, 'version'}
+        super().save(*args, **kwargs)
+        if not isinstance(self.version, int):
+            self.refresh_from_db(fields=['version'])
+        get_user_cache().invalidate(pks=[self.pk], emails=[self.email])
+
+    def delete(self, *args, **kwargs):
+        """Delete the user and drop it from the user cache."""
+        pk = self.pk
+        result = super().delete(*args, **kwargs)
+        get_user_cache().invalidate(pks=[pk], emails=[self.email])
+        return result
+
+    def set_password(self, raw_password):
+        """Hash the password, in the hashing pool when it is enabled."""
+        self.password = hashing.make_password(raw_password)
+        self._password = raw_password
+
+    def check_password(self, raw_password):
+        """Check the password, in the hashing pool when it is enabled."""
+
+        def setter(raw_password):
+            self.set_password(raw_password)
+            # Password hash upgrades shouldn't be considered password changes.
+            self._password = None
+            self.save(update_fields=['password'])
+
+        return hashing.check_password(raw_password, self.password, setter)
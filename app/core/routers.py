@@ -0,0 +1,257 @@
+"""
+Read replica routing.
+
+``ReplicaRouter`` sends writes to ``default`` and spreads reads over the
+aliases in ``DATABASE_REPLICAS['ALIASES']``. Reads go to the primary while
+the current request is pinned (see
+``core.middleware.ReplicaPinningMiddleware``) and when no replica is
+healthy.
+
+Replicas are probed at most every CHECK_INTERVAL seconds. A replica whose
+probe fails or reports more than MAX_LAG seconds of lag is ejected for
+EJECT_SECONDS, then probed again.
+"""
+import itertools
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.dispatch import receiver
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DATABASE_REPLICAS = {
+    'ALIASES': [],
+    'MAX_LAG': 5,
+    'CHECK_INTERVAL': 5,
+    'EJECT_SECONDS': 30,
+    'PIN_SECONDS': 5,
+    'COOKIE_NAME': 'db_pin',
+    'CACHE_ALIAS': 'default',
+    'CACHE_PREFIX': 'db-pin:',
+}
+
+
+class _Pin:
+    """Whether a request reads from the primary, and whether it wrote."""
+    __slots__ = ('pinned', 'wrote')
+
+    def __init__(self, pinned):
+        self.pinned = pinned
+        self.wrote = False
+
+
+# Mutable so that writes made in sync_to_async threads, which run in a copy
+# of the context, still pin the request they belong to.
+_pin = ContextVar('db_pin', default=None)
+
+
+def start_request(pinned):
+    """Track pinning for a request; returns (state, token for end_request)."""
+    state = _Pin(pinned)
+    return state, _pin.set(state)
+
+
+def end_request(token):
+    _pin.reset(token)
+
+
+def is_pinned():
+    """Return True if reads in this context must go to the primary."""
+    state = _pin.get()
+    return state is not None and state.pinned
+
+
+@contextmanager
+def pinned_to_primary():
+    """Read from the primary inside the block."""
+    token = _pin.set(_Pin(True))
+    try:
+        yield
+    finally:
+        _pin.reset(token)
+
+
+def default_probe(alias):
+    """Check a replica and return its replication lag in seconds."""
+    connection = connections[alias]
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(
+                'SELECT COALESCE(EXTRACT(EPOCH FROM now() - '
+                'pg_last_xact_replay_timestamp()), 0)')
+            return float(cursor.fetchone()[0])
+        cursor.execute('SELECT 1')
+    if connection.vendor == 'sqlite':
+        # Local replicas are copies of the primary file (sync_replicas);
+        # how far the copy is behind stands in for replication lag.
+        primary = connections[DEFAULT_DB_ALIAS].settings_dict['NAME']
+        replica = connection.settings_dict['NAME']
+        if os.path.exists(primary) and os.path.exists(replica):
+            return max(0.0, os.path.getmtime(primary) - os.path.getmtime(replica))
+    return 0.0
+
+
+class ReplicaSet:
+    """Health state of the read replicas."""
+
+    def __init__(self, aliases, max_lag=5, check_interval=5, eject_seconds=30,
+                 probe=default_probe, clock=time.monotonic):
+        self.aliases = list(aliases)
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.eject_seconds = eject_seconds
+        self.probe = probe
+        self.clock = clock
+        self.ejected_until = {}
+        self.lag = {}
+        self._checked_at = None
+        self._cycle = itertools.cycle(self.aliases)
+        self._lock = threading.Lock()
+
+    def healthy(self):
+        """Return the replicas currently serving reads."""
+        self._maybe_check()
+        now = self.clock()
+        return [alias for alias in self.aliases
+                if self.ejected_until.get(alias, 0) <= now]
+
+    def choose(self):
+        """Return the next healthy replica, or None if there is none."""
+        healthy = set(self.healthy())
+        if not healthy:
+            return None
+        with self._lock:
+            for _ in range(len(self.aliases)):
+                alias = next(self._cycle)
+                if alias in healthy:
+                    return alias
+        return None
+
+    def check(self):
+        """Probe every replica and eject the failing or lagging ones."""
+        now = self.clock()
+        for alias in self.aliases:
+            if self.ejected_until.get(alias, 0) > now:
+                continue
+            try:
+                lag = self.probe(alias)
+            except Exception as exc:
+                self._eject(alias, now, f'probe failed: {exc}')
+                continue
+            self.lag[alias] = lag
+            if lag > self.max_lag:
+                self._eject(alias, now, f'lag {lag:.1f}s over {self.max_lag}s')
+            else:
+                self.ejected_until.pop(alias, None)
+
+    def stats(self):
+        now = self.clock()
+        return {
+            alias: {
+                'healthy': self.ejected_until.get(alias, 0) <= now,
+                'lag': self.lag.get(alias),
+            }
+            for alias in self.aliases
+        }
+
+    def _maybe_check(self):
+        now = self.clock()
+        if self._checked_at is not None and (
+                now - self._checked_at < self.check_interval):
+            return
+        # One thread probes; the others keep using the last known state.
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            if self._checked_at is not None and (
+                    now - self._checked_at < self.check_interval):
+                return
+            self._checked_at = now
+        finally:
+            self._lock.release()
+        self.check()
+
+    def _eject(self, alias, now, reason):
+        self.ejected_until[alias] = now + self.eject_seconds
+        logger.warning('Ejecting replica %r for %ss: %s',
+                       alias, self.eject_seconds, reason)
+
+
+_replica_set = None
+_replica_set_lock = threading.Lock()
+
+
+def get_config():
+    return {
+        **DEFAULT_DATABASE_REPLICAS,
+        **getattr(settings, 'DATABASE_REPLICAS', {}),
+    }
+
+
+def get_replica_set():
+    """Return the process-wide replica set built from settings."""
+    global _replica_set
+    if _replica_set is None:
+        with _replica_set_lock:
+            if _replica_set is None:
+                config = get_config()
+                _replica_set = ReplicaSet(
+                    config['ALIASES'],
+                    max_lag=config['MAX_LAG'],
+                    check_interval=config['CHECK_INTERVAL'],
+                    eject_seconds=config['EJECT_SECONDS'],
+                )
+    return _replica_set
+
+
+def reset_replica_set():
+    """Forget the replica health state (used when settings change)."""
+    global _replica_set
+    with _replica_set_lock:
+        _replica_set = None
+
+
+@receiver(setting_changed)
+def reload_replica_set(setting, **kwargs):
+    """Rebuild the replica set when its settings are overridden."""
+    if setting == 'DATABASE_REPLICAS':
+        reset_replica_set()
+
+
+class ReplicaRouter:
+    """Route reads to healthy replicas and writes to the primary."""
+
+    def db_for_read(self, model, **hints):
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            return instance._state.db
+        if is_pinned():
+            return DEFAULT_DB_ALIAS
+        return get_replica_set().choose() or DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        state = _pin.get()
+        if state is not None:
+            # Reads later in this request must see the write.
+            state.pinned = state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = {DEFAULT_DB_ALIAS, *get_config()['ALIASES']}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema from the primary.
+        if db in get_config()['ALIASES']:
+            return False
+        return None
@@ -0,0 +1,318 @@
+"""
+Consistent-hash shard map.
+
+Every shard owns VNODES points on a 64-bit hash ring; a key belongs to the
+shard owning the first point at or after the key's hash. Adding a shard
+only takes over the arcs in front of its own points, so about 1/N of the
+keys move.
+
+Lookups are a hash plus ``bisect`` over a sorted list (O(log n)). Integer
+keys are hashed with splitmix64 so the hot path does no string or bytes
+work; other keys go through blake2b. CPython still creates a few int
+objects per lookup, so it is allocation-light rather than allocation-free.
+
+A rebalance publishes its new shard map to the cache CACHE_ALIAS
+(``publish_shard_map``) and every process picks it up within
+REFRESH_INTERVAL seconds. While the cutover copies the last rows,
+``freeze_writes`` makes writes to sharded models fail with
+``ShardMapFrozen`` instead of landing on the old shard. Both only reach
+other processes if CACHE_ALIAS is a shared cache (redis/memcached); with
+the default per-process LocMemCache a rebalance is invisible to the web
+workers, so ``publish_shard_map`` and ``freeze_writes`` refuse to run on
+a process-local cache.
+"""
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from collections import namedtuple
+from hashlib import blake2b
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from django.dispatch import receiver
+
+
+DEFAULT_SHARDING = {
+    'VNODES': 128,
+    'SHARDS': {},
+    'MODELS': {},
+    'CACHE_ALIAS': 'default',
+    'CACHE_KEY': 'sharding:map',
+    'REFRESH_INTERVAL': 1,
+}
+
+MASK = (1 << 64) - 1
+
+Shard = namedtuple('Shard', 'name alias table_suffix')
+
+
+class ShardMapFrozen(DatabaseError):
+    """Raised for writes to sharded models during a rebalance cutover."""
+
+
+def hash_key(key):
+    """Return the 64-bit ring position of a key."""
+    if type(key) is int:
+        # splitmix64 finalizer.
+        z = (key + 0x9E3779B97F4A7C15) & MASK
+        z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & MASK
+        z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & MASK
+        return z ^ (z >> 31)
+    if not isinstance(key, bytes):
+        key = str(key).encode()
+    return int.from_bytes(blake2b(key, digest_size=8).digest(), 'big')
+
+
+class HashRing:
+    """Immutable consistent-hash ring of shard names."""
+
+    def __init__(self, shards, vnodes=128):
+        self.shards = tuple(shards)
+        self.vnodes = vnodes
+        points = sorted(
+            (hash_key(f'{shard}#{index}'), shard)
+            for shard in self.shards
+            for index in range(vnodes)
+        )
+        self._points = [point for point, _shard in points]
+        self._owners = [shard for _point, shard in points]
+
+    def lookup(self, key):
+        """Return the name of the shard owning key."""
+        index = bisect_left(self._points, hash_key(key))
+        if index == len(self._points):
+            index = 0
+        return self._owners[index]
+
+    def with_shard(self, shard):
+        """Return a new ring with shard added."""
+        return HashRing(self.shards + (shard,), self.vnodes)
+
+    def without_shard(self, shard):
+        """Return a new ring with shard removed."""
+        return HashRing([s for s in self.shards if s != shard], self.vnodes)
+
+
+class ShardMap:
+    """Maps entity keys to shards (database alias and table suffix)."""
+
+    def __init__(self, shards, vnodes=128, models=None, version=None):
+        self.config = dict(shards)
+        self.version = version
+        self.frozen = False
+        self.shards = {
+            name: Shard(name, config.get('ALIAS', DEFAULT_DB_ALIAS),
+                        config.get('TABLE_SUFFIX', name))
+            for name, config in shards.items()
+        }
+        self.models = dict(models or {})
+        self.ring = HashRing(self.shards, vnodes) if self.shards else None
+
+    def shard_for(self, key):
+        """Return the Shard for key."""
+        if self.ring is None:
+            raise LookupError('No shards configured in SHARDING["SHARDS"].')
+        return self.shards[self.ring.lookup(key)]
+
+    def table_for(self, base_table, key):
+        """Return the physical table holding key's rows of base_table."""
+        return f'{base_table}_{self.shard_for(key).table_suffix}'
+
+    def key_field(self, model):
+        """Return the shard key field of a model, or None if unsharded."""
+        return self.models.get(model._meta.label)
+
+
+_shard_map = None
+_shard_map_lock = threading.Lock()
+_checked_at = None
+_config = None
+
+
+def get_config():
+    global _config
+    if _config is None:
+        _config = {
+            **DEFAULT_SHARDING,
+            **getattr(settings, 'SHARDING', {}),
+        }
+    return _config
+
+
+def _cache():
+    return caches[get_config()['CACHE_ALIAS']]
+
+
+def _shared_cache():
+    cache = _cache()
+    if isinstance(cache, (LocMemCache, DummyCache)):
+        raise ImproperlyConfigured(
+            f"SHARDING['CACHE_ALIAS'] ({get_config()['CACHE_ALIAS']!r}) is "
+            'local to this process; other processes would never see the '
+            'published shard map or the write freeze.')
+    return cache
+
+
+def get_shard_map():
+    """Return the process-wide shard map, following published rebalances."""
+    global _shard_map
+    if _shard_map is None:
+        with _shard_map_lock:
+            if _shard_map is None:
+                config = get_config()
+                _shard_map = ShardMap(
+                    config['SHARDS'], config['VNODES'], config['MODELS'])
+    _maybe_refresh()
+    return _shard_map
+
+
+def _maybe_refresh():
+    global _checked_at, _shard_map
+    config = get_config()
+    now = time.monotonic()
+    if _checked_at is not None and now - _checked_at < config['REFRESH_INTERVAL']:
+        return
+    _checked_at = now
+    key = config['CACHE_KEY']
+    published = _cache().get_many([key, f'{key}:frozen'])
+    shard_map = _shard_map
+    if shard_map is None:
+        return
+    current = published.get(key)
+    if current is not None and current['version'] != shard_map.version:
+        shard_map = ShardMap(current['SHARDS'], current['VNODES'],
+                             config['MODELS'], version=current['version'])
+    shard_map.frozen = bool(published.get(f'{key}:frozen'))
+    with _shard_map_lock:
+        _shard_map = shard_map
+
+
+def set_shard_map(shard_map):
+    """Swap in a new shard map in this process only."""
+    global _shard_map, _checked_at
+    with _shard_map_lock:
+        _shard_map = shard_map
+        _checked_at = None
+
+
+def reset_shard_map():
+    """Forget the shard map (used when settings change)."""
+    set_shard_map(None)
+
+
+def publish_shard_map(shards, vnodes=None):
+    """
+    Make shards (same format as SHARDING['SHARDS']) the shard map of every
+    process sharing the cache; returns the new map's version.
+    """
+    config = get_config()
+    version = uuid.uuid4().hex
+    _shared_cache().set(config['CACHE_KEY'], {
+        'version': version,
+        'SHARDS': shards,
+        'VNODES': vnodes or config['VNODES'],
+    }, None)
+    set_shard_map(None)
+    return version
+
+
+def freeze_writes(timeout=60):
+    """Reject writes to sharded models for up to timeout seconds."""
+    _shared_cache().set(f"{get_config()['CACHE_KEY']}:frozen", True, timeout)
+    set_shard_map(_shard_map)
+
+
+def extend_freeze(timeout=60):
+    """
+    Keep rejecting writes for another timeout seconds; returns False if
+    the freeze already expired (or was never set).
+    """
+    return _shared_cache().touch(f"{get_config()['CACHE_KEY']}:frozen", timeout)
+
+
+def thaw_writes():
+    """Accept writes to sharded models again."""
+    _cache().delete(f"{get_config()['CACHE_KEY']}:frozen")
+    set_shard_map(_shard_map)
+
+
+@receiver(setting_changed)
+def reload_shard_map(setting, **kwargs):
+    """Rebuild the shard map when its settings are overridden."""
+    global _config
+    if setting == 'SHARDING':
+        _config = None
+        reset_shard_map()
+
+
+def shard_for(key):
+    """Return the Shard owning key."""
+    return get_shard_map().shard_for(key)
+
+
+def execute_on_shard(key, sql, params=None):
+    """
+    Run raw SQL on key's shard and return the rows, if any.
+
+    ``{table}`` placeholders in sql are formatted as ``<name>_<suffix>`` of
+    the shard, quoted, e.g. ``SELECT * FROM {core_user} WHERE id = %s``.
+    """
+    shard = shard_for(key)
+    connection = connections[shard.alias]
+    tables = _ShardTables(connection, shard)
+    with connection.cursor() as cursor:
+        cursor.execute(sql.format_map(tables), params)
+        if cursor.description is not None:
+            return cursor.fetchall()
+    return None
+
+
+class _ShardTables(dict):
+    def __init__(self, connection, shard):
+        super().__init__()
+        self.connection = connection
+        self.shard = shard
+
+    def __missing__(self, table):
+        return self.connection.ops.quote_name(
+            f'{table}_{self.shard.table_suffix}')
+
+
+class ShardRouter:
+    """
+    Send reads and writes of sharded models to their shard's alias.
+
+    The shard key comes from the ``shard_key`` hint, e.g.
+    ``User.objects.db_manager(hints={'shard_key': email})``, or from the
+    instance being saved. Unsharded models fall through to the next router.
+    """
+
+    def _db_for(self, model, hints):
+        shard_map = get_shard_map()
+        field = shard_map.key_field(model)
+        if field is None or shard_map.ring is None:
+            return None
+        if 'shard_key' in hints:
+            return shard_map.shard_for(hints['shard_key']).alias
+        instance = hints.get('instance')
+        if instance is not None and isinstance(instance, model):
+            key = getattr(instance, field, None)
+            if key is not None:
+                return shard_map.shard_for(key).alias
+        return None
+
+    def db_for_read(self, model, **hints):
+        return self._db_for(model, hints)
+
+    def db_for_write(self, model, **hints):
+        shard_map = get_shard_map()
+        if shard_map.frozen and shard_map.key_field(model) is not None:
+            raise ShardMapFrozen(
+                f'{model._meta.label} is being rebalanced; retry shortly.')
+        return self._db_for(model, hints)
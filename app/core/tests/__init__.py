@@ -0,0 +1,11 @@
+import sys
+from pathlib import Path
+
+
+# database/ and celery/ sit next to the Django project. Make them importable
+# the way they are deployed: database modules as ``database.<name>``, celery
+# modules by bare name (they import their siblings that way).
+REPO_DIR = Path(__file__).resolve().parents[3]
+for directory in (REPO_DIR, REPO_DIR / 'celery'):
+    if str(directory) not in sys.path:
+        sys.path.append(str(directory))
@@ -0,0 +1,167 @@
+"""
+Tests for adaptive admission control.
+"""
+from django.contrib.auth import get_user_model
+from django.core.handlers.base import BaseHandler
+from django.test import AsyncClient, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.admission import AdaptiveLimiter, get_registry, reset_registry
+
+
+ME_URL = reverse('user:me')
+ASYNC_ME_URL = reverse('user:async-me')
+STATS_URL = reverse('admission-stats')
+
+ADMISSION_SETTINGS = {
+    'ENABLED': True,
+    'RETRY_AFTER': 3,
+    'ROUTES': {
+        'user:me': {'INITIAL_LIMIT': 1, 'TARGET_LATENCY': 60},
+    },
+}
+
+
+class AdaptiveLimiterTests(SimpleTestCase):
+    """Test the AIMD limiter on its own."""
+
+    def test_rejects_over_limit(self):
+        """Test acquiring beyond the limit is refused and counted."""
+        limiter = AdaptiveLimiter('test', initial_limit=2)
+
+        self.assertTrue(limiter.try_acquire())
+        self.assertTrue(limiter.try_acquire())
+        self.assertFalse(limiter.try_acquire())
+        self.assertEqual(limiter.stats()['rejected'], 1)
+        self.assertEqual(limiter.stats()['in_flight'], 2)
+
+    def test_fast_requests_grow_limit(self):
+        """Test requests under the target latency raise the limit."""
+        limiter = AdaptiveLimiter('test', initial_limit=4, target_latency=1)
+
+        for _ in range(8):
+            limiter.try_acquire()
+            limiter.release(0.01)
+
+        self.assertEqual(limiter.stats()['limit'], 5)
+
+    def test_slow_or_failed_requests_shrink_limit(self):
+        """Test slow and failed requests back the limit off."""
+        limiter = AdaptiveLimiter(
+            'test', initial_limit=10, min_limit=2, target_latency=0.1,
+            backoff=0.5)
+
+        limiter.try_acquire()
+        limiter.release(1.0)
+        self.assertEqual(limiter.stats()['limit'], 5)
+        limiter.try_acquire()
+        limiter.release(0.01, failed=True)
+        self.assertEqual(limiter.stats()['limit'], 2)
+        limiter.try_acquire()
+        limiter.release(1.0)
+        self.assertEqual(limiter.stats()['limit'], 2)
+
+
+@override_settings(ADMISSION_CONTROL=ADMISSION_SETTINGS)
+class AdmissionMiddlewareTests(TestCase):
+    """Test shedding requests through the middleware."""
+
+    def setUp(self):
+        reset_registry()
+        self.user = get_user_model().objects.create_user(
+            email='test@example.com',
+            password='testpass123',
+            name='Test Name',
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_request_within_limit(self):
+        """Test requests are served and release their slot."""
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        stats = get_registry().get('user:me').stats()
+        self.assertEqual(stats['accepted'], 1)
+        self.assertEqual(stats['in_flight'], 0)
+
+    def test_sheds_over_limit(self):
+        """Test a request over the limit gets 503 with Retry-After."""
+        limiter = get_registry().get('user:me')
+        limiter.try_acquire()
+
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(res['Retry-After'], '3')
+        self.assertEqual(limiter.stats()['rejected'], 1)
+
+    def test_unconfigured_route_not_limited(self):
+        """Test routes without a limit are left alone."""
+        get_registry().get('user:me').try_acquire()
+
+        res = self.client.get(reverse('user:list'))
+
+        self.assertNotEqual(
+            res.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+
+    def test_stats_requires_staff(self):
+        """Test the stats view is only for staff users."""
+        res = self.client.get(STATS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_stats(self):
+        """Test staff can see limits and rejections per route."""
+        self.user.is_staff = True
+        self.user.save()
+        limiter = get_registry().get('user:me')
+        limiter.try_acquire()
+        self.client.get(ME_URL)
+
+        res = self.client.get(STATS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(res.data['enabled'])
+        self.assertEqual(res.data['routes']['user:me']['rejected'], 1)
+        self.assertEqual(res.data['routes']['user:me']['limit'], 1)
+        self.assertEqual(res.data['routes']['user:me']['in_flight'], 1)
+
+
+@override_settings(ADMISSION_CONTROL={
+    'ENABLED': True,
+    'RETRY_AFTER': 3,
+    'ROUTES': {'user:async-me': {'INITIAL_LIMIT': 1}},
+})
+class AsyncAdmissionMiddlewareTests(TestCase):
+    """Test the middleware in an async (ASGI) handler."""
+
+    def setUp(self):
+        reset_registry()
+
+    @override_settings(DEBUG=True)
+    def test_middleware_chain_not_adapted(self):
+        """Test the async chain runs without thread adapters."""
+        with self.assertNoLogs('django.request', 'DEBUG'):
+            BaseHandler().load_middleware(is_async=True)
+
+    async def test_async_request_released(self):
+        """Test an async view is admitted and releases its slot."""
+        res = await AsyncClient().get(ASYNC_ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+        stats = get_registry().get('user:async-me').stats()
+        self.assertEqual(stats['accepted'], 1)
+        self.assertEqual(stats['in_flight'], 0)
+
+    async def test_async_sheds_over_limit(self):
+        """Test an async request over the limit gets 503."""
+        get_registry().get('user:async-me').try_acquire()
+
+        res = await AsyncClient().get(ASYNC_ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(res['Retry-After'], '3')
@@ -1,6 +1,10 @@
 """
 Test custom Django management commands.
 """
+import json
+import os
+import tempfile
+from io import StringIO
 from unittest.mock import patch
 
 # from psycopg2 import OperationalError as Psycopg2OpError
@@ -31,4 +35,41 @@ class CommandTests(SimpleTestCase):
         call_command('wait_for_db')
 
         self.assertEqual(patched_check.call_count, 6)
-        patched_check.assert_called_with(databases=['default'])
\ No newline at end of file
+        patched_check.assert_called_with(databases=['default'])
+
+
+class SlowQueriesCommandTests(SimpleTestCase):
+    """Test the slow_queries command."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'slow.jsonl')
+        lines = [
+            {'alias': 'default', 'shape': 'SELECT a', 'duration_ms': 150},
+            {'alias': 'default', 'shape': 'SELECT a', 'duration_ms': 250},
+            {'alias': 'default', 'shape': 'SELECT b', 'duration_ms': 900},
+            {'type': 'plan', 'shape': 'SELECT b', 'plan': 'SCAN core_user'},
+        ]
+        with open(self.path, 'w') as log_file:
+            log_file.writelines(json.dumps(line) + '\n' for line in lines)
+
+    def test_sorted_by_total(self):
+        """Test shapes are listed worst total time first, with plans."""
+        out = StringIO()
+
+        call_command('slow_queries', path=self.path, plans=True, stdout=out)
+
+        output = out.getvalue()
+        self.assertLess(output.index('SELECT b'), output.index('SELECT a'))
+        self.assertIn('count 2', output)
+        self.assertIn('SCAN core_user', output)
+
+    def test_sorted_by_count(self):
+        """Test shapes can be sorted by how often they ran."""
+        out = StringIO()
+
+        call_command('slow_queries', path=self.path, sort='count', stdout=out)
+
+        output = out.getvalue()
+        self.assertLess(output.index('SELECT a'), output.index('SELECT b'))
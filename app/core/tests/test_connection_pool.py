@@ -0,0 +1,205 @@
+"""
+Tests for the shared psycopg2 connection pool.
+"""
+import os
+import threading
+from unittest import mock
+
+import psycopg2
+from psycopg2 import extensions
+from django.test import SimpleTestCase
+
+from connection_pool import ConnectionPool, PoolTimeout
+
+
+class FakeCursor:
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def execute(self, sql, params=None):
+        if self.conn.broken:
+            raise psycopg2.OperationalError('server closed the connection')
+        self.conn.executed.append(sql)
+
+
+class FakeConnection:
+    """Stands in for a psycopg2 connection; tests flip its state."""
+
+    def __init__(self, dsn):
+        self.dsn = dsn
+        self.closed = 0
+        self.broken = False
+        self.status = extensions.TRANSACTION_STATUS_IDLE
+        self.rollbacks = 0
+        self.executed = []
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def get_transaction_status(self):
+        return self.status
+
+    def rollback(self):
+        if self.broken:
+            raise psycopg2.OperationalError('server closed the connection')
+        self.rollbacks += 1
+        self.status = extensions.TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = 1
+
+
+class Clock:
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class ConnectionPoolTests(SimpleTestCase):
+    """Test checkout, reuse, expiry and fork handling."""
+
+    def setUp(self):
+        self.clock = Clock()
+        patcher = mock.patch('connection_pool.time.monotonic', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _pool(self, **options):
+        pool = ConnectionPool('dbname=test', connect=FakeConnection, **options)
+        self.addCleanup(pool.close)
+        return pool
+
+    def test_checkout_times_out(self):
+        """Test waiting past the timeout with max_size checked out raises."""
+        pool = self._pool(max_size=1)
+        pool.getconn()
+
+        with mock.patch.object(pool._cond, 'wait',
+                               side_effect=lambda t: setattr(self.clock, 'now', 2000)):
+            with self.assertRaises(PoolTimeout):
+                pool.getconn(timeout=0.5)
+        self.assertEqual(pool.stats()['size'], 1)
+
+    def test_returned_connection_wakes_waiter(self):
+        """Test a waiting checkout gets the connection put back."""
+        pool = self._pool(max_size=1)
+        conn = pool.getconn()
+        got = []
+        waiter = threading.Thread(target=lambda: got.append(pool.getconn(timeout=5)))
+
+        waiter.start()
+        pool.putconn(conn)
+        waiter.join(5)
+
+        self.assertEqual(got, [conn])
+        self.assertEqual(pool.connects, 1)
+
+    def test_lifo_reuse(self):
+        """Test the most recently returned connection is handed out first."""
+        pool = self._pool()
+        first, second = pool.getconn(), pool.getconn()
+        pool.putconn(first)
+        pool.putconn(second)
+
+        self.assertIs(pool.getconn(), second)
+        self.assertIs(pool.getconn(), first)
+        self.assertEqual(pool.connects, 2)
+
+    def test_expired_connection_replaced(self):
+        """Test a connection older than max_lifetime is closed, not reused."""
+        pool = self._pool(max_lifetime=60)
+        old = pool.getconn()
+        pool.putconn(old)
+
+        self.clock.now += 61
+        new = pool.getconn()
+
+        self.assertIsNot(new, old)
+        self.assertTrue(old.closed)
+        self.assertEqual(pool.stats()['size'], 1)
+
+    def test_expired_on_return_discarded(self):
+        """Test a connection expiring while checked out isn't pooled."""
+        pool = self._pool(max_lifetime=60)
+        conn = pool.getconn()
+
+        self.clock.now += 61
+        pool.putconn(conn)
+
+        self.assertTrue(conn.closed)
+        self.assertEqual(pool.stats(), {'size': 0, 'idle': 0, 'in_use': 0,
+                                        'connects': 1})
+
+    def test_stale_connection_pinged(self):
+        """Test an idle connection failing its ping is replaced."""
+        pool = self._pool(health_check_after=5)
+        conn = pool.getconn()
+        pool.putconn(conn)
+        conn.broken = True
+
+        self.clock.now += 6
+        new = pool.getconn()
+
+        self.assertIsNot(new, conn)
+        self.assertTrue(conn.closed)
+
+    def test_putconn_rolls_back(self):
+        """Test an open transaction is rolled back before reuse."""
+        pool = self._pool()
+        conn = pool.getconn()
+        conn.status = extensions.TRANSACTION_STATUS_INTRANS
+
+        pool.putconn(conn)
+
+        self.assertEqual(conn.rollbacks, 1)
+        self.assertIs(pool.getconn(), conn)
+
+    def test_failed_rollback_discards(self):
+        """Test a connection that can't roll back is closed."""
+        pool = self._pool()
+        conn = pool.getconn()
+        conn.status = extensions.TRANSACTION_STATUS_INERROR
+        conn.broken = True
+
+        pool.putconn(conn)
+
+        self.assertTrue(conn.closed)
+        self.assertEqual(pool.stats()['size'], 0)
+
+    def test_connection_block_rolls_back_on_error(self):
+        """Test connection() rolls back and returns the connection on error."""
+        pool = self._pool()
+
+        with self.assertRaises(ValueError):
+            with pool.connection() as conn:
+                raise ValueError('boom')
+
+        self.assertEqual(conn.rollbacks, 1)
+        self.assertEqual(pool.stats()['idle'], 1)
+
+    def test_after_fork_discards_parent_connections(self):
+        """Test a child never reuses or closes the parent's connections."""
+        pool = self._pool()
+        idle, in_use = pool.getconn(), pool.getconn()
+        pool.putconn(idle)
+
+        pool._pid = os.getpid() + 1
+        child = pool.getconn()
+        pool.putconn(in_use)
+
+        self.assertNotIn(child, (idle, in_use))
+        self.assertFalse(idle.closed)
+        self.assertFalse(in_use.closed)
+        self.assertIn(idle, pool._orphans)
+        self.assertEqual(pool.stats(), {'size': 1, 'idle': 0, 'in_use': 1,
+                                        'connects': 1})
@@ -0,0 +1,96 @@
+"""
+Tests for batched DDL plans.
+"""
+from contextlib import contextmanager
+
+from django.test import SimpleTestCase
+
+from ddl_plan import DDLPlan, index_sql
+
+
+class StubCursor:
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def execute(self, sql, params=None):
+        self.conn.executed.append((sql, self.conn.autocommit))
+
+    def fetchall(self):
+        return self.conn.catalog
+
+
+class StubConnection:
+
+    def __init__(self, catalog):
+        self.catalog = catalog
+        self.executed = []
+        self.autocommit = False
+
+    def cursor(self):
+        return StubCursor(self)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+
+class StubPool:
+    """Single-connection pool answering the catalog query with catalog."""
+
+    max_size = 1
+
+    def __init__(self, catalog):
+        self.conn = StubConnection(catalog)
+
+    @contextmanager
+    def connection(self):
+        yield self.conn
+
+
+class DDLPlanTests(SimpleTestCase):
+    """Test skipping existing objects and repairing invalid indexes."""
+
+    def test_index_built_concurrently_by_default(self):
+        """Test the plan and the statement helper share one default."""
+        plan = DDLPlan().create_index('orders', 'orders_customer_idx', 'customer')
+
+        op = plan.operations['orders_customer_idx']
+        self.assertTrue(op.concurrent)
+        self.assertEqual(op.sql, index_sql('orders', 'orders_customer_idx', 'customer')[1])
+        self.assertIn('CONCURRENTLY', op.sql)
+
+    def test_valid_objects_skipped(self):
+        """Test objects found in the catalog are not created again."""
+        pool = StubPool([('orders_t1', True), ('orders_t1_customer_idx', True)])
+        plan = (DDLPlan().create_shard('orders', 't1')
+                .create_index('orders_t1', 'orders_t1_customer_idx', 'customer'))
+
+        result = plan.execute(pool)
+
+        self.assertEqual(result['skipped'], 2)
+        self.assertEqual(result['created'], [])
+        self.assertEqual(len(pool.conn.executed), 1)
+
+    def test_invalid_index_rebuilt(self):
+        """Test an INVALID index is dropped and built again, outside a transaction."""
+        pool = StubPool([('orders_t1_customer_idx', False)])
+        plan = DDLPlan().create_index('orders_t1', 'orders_t1_customer_idx', 'customer')
+
+        result = plan.execute(pool)
+
+        self.assertEqual(result['skipped'], 0)
+        self.assertEqual(result['created'], ['orders_t1_customer_idx'])
+        self.assertEqual(pool.conn.executed[1:], [
+            ('DROP INDEX CONCURRENTLY IF EXISTS orders_t1_customer_idx;', True),
+            ('CREATE INDEX CONCURRENTLY IF NOT EXISTS orders_t1_customer_idx '
+             'ON orders_t1 (customer);', True),
+        ])
@@ -0,0 +1,87 @@
+"""
+Tests for the password hashing pool.
+"""
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core import hashing
+
+
+CREATE_USER_URL = reverse('user:create')
+TOKEN_URL = reverse('user:token')
+
+POOL_SETTINGS = {
+    'ENABLED': True,
+    'WORKERS': 1,
+    'MAX_QUEUE': 0,
+    'TIMEOUT': 30,
+    'RETRY_AFTER': 2,
+}
+
+
+@override_settings(PASSWORD_HASHING_POOL=POOL_SETTINGS)
+class HashingPoolTests(TestCase):
+    """Test signup and login with hashing in the process pool."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.payload = {
+            'email': 'test@example.com',
+            'password': 'testpass123',
+            'name': 'Test Name',
+        }
+
+    def tearDown(self):
+        hashing.reset_pool()
+
+    def test_signup_and_login_use_pool(self):
+        """Test users created through the pool can log in."""
+        res = self.client.post(CREATE_USER_URL, self.payload)
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+
+        user = get_user_model().objects.get(email=self.payload['email'])
+        self.assertTrue(user.password.startswith('pbkdf2_'))
+        self.assertTrue(user.check_password(self.payload['password']))
+        self.assertFalse(user.check_password('wrong-password'))
+
+        res = self.client.post(TOKEN_URL, {
+            'email': self.payload['email'],
+            'password': self.payload['password'],
+        })
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIn('token', res.data)
+
+    def test_full_pool_returns_503(self):
+        """Test requests are shed with Retry-After when the pool is full."""
+        pool = hashing.get_pool()
+        self.assertTrue(pool._slots.acquire(blocking=False))
+        try:
+            res = self.client.post(CREATE_USER_URL, self.payload)
+        finally:
+            pool._slots.release()
+
+        self.assertEqual(res.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(res['Retry-After'], '2')
+        self.assertEqual(pool.rejected, 1)
+        self.assertFalse(get_user_model().objects.exists())
+
+    def test_legacy_hash_upgraded(self):
+        """Test a valid password on an outdated hash is rehashed."""
+        user = get_user_model().objects.create_user(
+            email='old@example.com', name='Old')
+        user.password = hashing.hashers.MD5PasswordHasher().encode(
+            'testpass123', 'salt')
+        user.save()
+
+        with self.settings(PASSWORD_HASHERS=[
+            'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+            'django.contrib.auth.hashers.MD5PasswordHasher',
+        ], PASSWORD_HASHING_POOL=POOL_SETTINGS):
+            self.assertTrue(user.check_password('testpass123'))
+
+        user.refresh_from_db()
+        self.assertTrue(user.password.startswith('pbkdf2_'))
@@ -0,0 +1,156 @@
+"""
+Tests for the index advisor.
+"""
+from django.test import SimpleTestCase
+
+from index_advisor import (
+    ExistingIndex, IndexAdvisor, QueryShape, Recommendation, column_usage,
+    improvement, workload_delta,
+)
+
+
+def index(name, table, columns, scans=10, unique=False, partial=False):
+    return ExistingIndex(table, name, list(columns), scans, 8192, unique, partial)
+
+
+class ColumnUsageTests(SimpleTestCase):
+    """Test finding the indexable columns of a statement."""
+
+    def test_equality_range_and_order(self):
+        """Test equality columns lead, then the range column."""
+        usage = column_usage(
+            'SELECT * FROM orders WHERE customer_id = ? AND created_at > ? '
+            'ORDER BY created_at')['orders']
+
+        self.assertEqual(usage.equality, ['customer_id'])
+        self.assertEqual(usage.range, ['created_at'])
+        self.assertEqual(usage.candidates(), [('customer_id', 'created_at')])
+
+    def test_order_columns_follow_equality(self):
+        """Test sort columns extend the index when nothing is a range."""
+        usage = column_usage(
+            'SELECT * FROM orders WHERE status = ? ORDER BY created_at DESC')
+
+        self.assertEqual(usage['orders'].candidates(), [('status', 'created_at')])
+
+    def test_join_resolves_aliases(self):
+        """Test qualified columns go to their table, join columns apart."""
+        usage = column_usage(
+            'SELECT o.id FROM orders o JOIN customers c ON c.id = o.customer_id '
+            'WHERE c.email = ? AND o.status IN (?)')
+
+        self.assertEqual(usage['customers'].candidates(), [('email',), ('id',)])
+        self.assertEqual(usage['orders'].candidates(),
+                         [('status',), ('customer_id',)])
+
+    def test_function_calls_ignored(self):
+        """Test a column wrapped in a function isn't indexable."""
+        self.assertEqual(column_usage('SELECT * FROM users WHERE lower(email) = ?'), {})
+
+
+class IndexAdvisorTests(SimpleTestCase):
+    """Test ranking recommendations and flagging wasteful indexes."""
+
+    def test_recommend_ranks_by_benefit(self):
+        """Test slower queries and more selective columns rank higher."""
+        advisor = IndexAdvisor(
+            n_distinct={('orders', 'status'): 3, ('orders', 'customer_id'): -0.5},
+            table_rows={'orders': 100000})
+        shapes = [
+            QueryShape('q1', 'SELECT * FROM orders WHERE status = ?', 10, 1000.0),
+            QueryShape('q2', 'SELECT * FROM orders WHERE customer_id = ?', 4, 1000.0),
+        ]
+
+        ranked = advisor.recommend(shapes)
+
+        self.assertEqual([r.columns for r in ranked],
+                         [('customer_id',), ('status',)])
+        self.assertAlmostEqual(ranked[0].benefit_ms, 1000 * (1 - 1 / 50000))
+        self.assertAlmostEqual(ranked[1].benefit_ms, 1000 * (1 - 1 / 3))
+        self.assertEqual(ranked[0].queries, {'q2': 250.0})
+
+    def test_prefix_merged_into_wider_index(self):
+        """Test a recommendation whose columns prefix another's is merged."""
+        advisor = IndexAdvisor()
+        shapes = [
+            QueryShape('q1', 'SELECT * FROM orders WHERE status = ?', 1, 100.0),
+            QueryShape('q2', 'SELECT * FROM orders WHERE status = ? '
+                             'ORDER BY created_at', 1, 300.0),
+        ]
+
+        ranked = advisor.recommend(shapes)
+
+        self.assertEqual(len(ranked), 1)
+        self.assertEqual(ranked[0].columns, ('status', 'created_at'))
+        self.assertEqual(ranked[0].benefit_ms, 200.0)
+        self.assertEqual(set(ranked[0].queries), {'q1', 'q2'})
+
+    def test_small_and_covered_tables_skipped(self):
+        """Test small tables and columns already indexed get nothing."""
+        advisor = IndexAdvisor(
+            existing=[index('orders_status_idx', 'orders', ['status', 'id'])],
+            table_rows={'orders': 100000, 'flags': 10})
+        shapes = [
+            QueryShape('q1', 'SELECT * FROM orders WHERE status = ?', 1, 100.0),
+            QueryShape('q2', 'SELECT * FROM flags WHERE name = ?', 1, 100.0),
+            QueryShape('q3', 'not sql at all (', 1, 100.0),
+        ]
+
+        self.assertEqual(advisor.recommend(shapes), [])
+
+    def test_long_names_truncated(self):
+        """Test index names fit PostgreSQL's 63 character limit."""
+        name = Recommendation('orders', ['a' * 30, 'b' * 30]).name
+
+        self.assertEqual(len(name), 63)
+        self.assertTrue(name.endswith('_idx'))
+
+    def test_unused_skips_unique(self):
+        """Test unused lists never-scanned indexes but keeps unique ones."""
+        unused = index('orders_note_idx', 'orders', ['note'], scans=0)
+        advisor = IndexAdvisor(existing=[
+            unused,
+            index('orders_pkey', 'orders', ['id'], scans=0, unique=True),
+            index('orders_status_idx', 'orders', ['status']),
+        ])
+
+        self.assertEqual(advisor.unused(), [unused])
+
+    def test_duplicates(self):
+        """Test prefix indexes and exact copies are redundant."""
+        prefix = index('orders_status_idx', 'orders', ['status'])
+        wider = index('orders_status_created_idx', 'orders', ['status', 'created_at'])
+        copy_a = index('orders_a_idx', 'orders', ['customer_id'])
+        copy_b = index('orders_b_idx', 'orders', ['customer_id'])
+        partial = index('orders_open_idx', 'orders', ['status'], partial=True)
+        advisor = IndexAdvisor(existing=[prefix, wider, copy_a, copy_b, partial])
+
+        self.assertEqual(advisor.duplicates(), [(prefix, wider), (copy_b, copy_a)])
+
+
+class ImprovementTests(SimpleTestCase):
+    """Test measuring what a built index changed."""
+
+    def test_workload_delta(self):
+        """Test only statements run between the readings are kept."""
+        before = {'q1': QueryShape('q1', 'sql', 10, 100.0),
+                  'q2': QueryShape('q2', 'sql', 5, 50.0)}
+        after = {'q1': QueryShape('q1', 'sql', 14, 112.0),
+                 'q2': QueryShape('q2', 'sql', 5, 50.0),
+                 'q3': QueryShape('q3', 'sql', 2, 8.0)}
+
+        self.assertEqual(workload_delta(before, after), {
+            'q1': QueryShape('q1', 'sql', 4, 12.0),
+            'q3': QueryShape('q3', 'sql', 2, 8.0),
+        })
+
+    def test_improvement(self):
+        """Test mean time per query before and after, and the speedup."""
+        report = improvement(
+            {'q1': 30.0, 'q2': 10.0},
+            {'q1': QueryShape('q1', 'sql', 4, 12.0)})
+
+        self.assertEqual(report, {
+            'q1': {'before_ms': 30.0, 'after_ms': 3.0, 'speedup': 10.0},
+            'q2': {'before_ms': 10.0, 'after_ms': None, 'speedup': None},
+        })
@@ -0,0 +1,150 @@
+"""
+Tests for per-request query profiling.
+"""
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+
+from database.manager import (
+    AliasQueryRecorder, LatencyHistogram, RequestQueryStats, get_route_metrics,
+    record_request, reset_route_metrics,
+)
+
+
+class StubSlowLog:
+
+    def __init__(self, threshold):
+        self.threshold = threshold
+        self.records = []
+
+    def record(self, alias, sql, params, elapsed):
+        self.records.append((alias, sql, params))
+
+
+def run(recorder, sql, params=None):
+    return recorder(lambda *args: 'result', sql, params, False, {})
+
+
+class AliasQueryRecorderTests(SimpleTestCase):
+    """Test timing the statements of one alias."""
+
+    def test_counts_and_keeps_slowest(self):
+        """Test every statement is counted and the slowest remembered."""
+        recorder = AliasQueryRecorder('default')
+
+        self.assertEqual(run(recorder, 'SELECT 1'), 'result')
+        run(recorder, 'SELECT 2')
+
+        self.assertEqual(recorder.count, 2)
+        self.assertGreater(recorder.duration, 0)
+        self.assertIn(recorder.slowest_sql, ('SELECT 1', 'SELECT 2'))
+        self.assertLessEqual(recorder.slowest_duration, recorder.duration)
+
+    def test_failed_statement_counted(self):
+        """Test a statement that raises is still timed."""
+        recorder = AliasQueryRecorder('default')
+
+        def execute(*args):
+            raise ValueError('syntax error')
+
+        with self.assertRaises(ValueError):
+            recorder(execute, 'SELEC 1', None, False, {})
+        self.assertEqual(recorder.count, 1)
+
+    def test_slow_statements_logged(self):
+        """Test statements over the threshold go to the slow log."""
+        slow_log = StubSlowLog(threshold=0)
+        recorder = AliasQueryRecorder('replica', slow_log)
+
+        run(recorder, 'SELECT %s', [1])
+
+        self.assertEqual(slow_log.records, [('replica', 'SELECT %s', [1])])
+        slow_log.threshold = 60
+        run(recorder, 'SELECT 2')
+        self.assertEqual(len(slow_log.records), 1)
+
+
+class RequestQueryStatsTests(SimpleTestCase):
+    """Test combining the recorders of every alias."""
+
+    def test_server_timing(self):
+        """Test the header has the total, each used alias and the request."""
+        stats = RequestQueryStats(['default', 'replica', 'unused'])
+        stats.recorders['default'].count = 2
+        stats.recorders['default'].duration = 0.003
+        stats.recorders['replica'].count = 1
+        stats.recorders['replica'].duration = 0.0015
+
+        self.assertEqual(stats.count, 3)
+        self.assertEqual(stats.server_timing(0.01), (
+            'db;dur=4.50;desc="3 queries", '
+            'db-default;dur=3.00;desc="2 queries", '
+            'db-replica;dur=1.50;desc="1 queries", '
+            'total;dur=10.00'
+        ))
+
+    def test_slowest_across_aliases(self):
+        """Test the slowest statement is picked over every alias."""
+        stats = RequestQueryStats(['default', 'replica'])
+        stats.recorders['replica'].slowest_duration = 0.2
+        stats.recorders['replica'].slowest_sql = 'SELECT slow'
+
+        self.assertEqual(stats.slowest, ('replica', 0.2, 'SELECT slow'))
+
+
+class HistogramTests(SimpleTestCase):
+    """Test latency histograms."""
+
+    def setUp(self):
+        reset_route_metrics()
+        self.addCleanup(reset_route_metrics)
+
+    def test_buckets(self):
+        """Test latencies land in the first bucket at or above them."""
+        histogram = LatencyHistogram(buckets=(1, 10))
+        for seconds in (0.0005, 0.001, 0.005, 2):
+            histogram.observe(seconds)
+
+        self.assertEqual(histogram.as_dict(), {
+            'count': 4,
+            'sum_ms': 2006.5,
+            'buckets': {'le_1': 2, 'le_10': 1, 'inf': 1},
+        })
+
+    def test_record_request_per_url_name(self):
+        """Test requests are aggregated by URL name."""
+        stats = RequestQueryStats(['default'])
+        stats.recorders['default'].count = 2
+        stats.recorders['default'].slowest_duration = 0.004
+        stats.recorders['default'].slowest_sql = 'SELECT 1'
+
+        record_request('user:me', stats, 0.01)
+        record_request('user:me', stats, 0.02)
+        metrics = get_route_metrics()
+
+        self.assertEqual(list(metrics), ['user:me'])
+        self.assertEqual(metrics['user:me']['requests']['count'], 2)
+        self.assertEqual(metrics['user:me']['queries'], 4)
+        self.assertEqual(metrics['user:me']['slowest_sql'], 'SELECT 1')
+
+
+class QueryOptimizationMiddlewareTests(TestCase):
+    """Test the middleware profiles real requests."""
+
+    def setUp(self):
+        reset_route_metrics()
+        self.addCleanup(reset_route_metrics)
+        self.user = get_user_model().objects.create_user(
+            email='test@example.com', password='testpass123')
+
+    def test_headers_and_metrics(self):
+        """Test a request gets Server-Timing and is counted under its view."""
+        response = self.client.post(reverse('user:token'), {
+            'email': 'test@example.com', 'password': 'testpass123'})
+
+        self.assertIn('db;dur=', response['Server-Timing'])
+        self.assertIn('total;dur=', response['Server-Timing'])
+        self.assertIn('X-Query-Time', response)
+        metrics = get_route_metrics()['user:token']
+        self.assertEqual(metrics['requests']['count'], 1)
+        self.assertGreater(metrics['queries'], 0)
@@ -42,4 +42,18 @@ class ModelTests(TestCase):
         )
 
         self.assertTrue(user.is_superuser)
-        self.assertTrue(user.is_staff)
\ No newline at end of file
+        self.assertTrue(user.is_staff)
+
+    def test_save_bumps_version(self):
+        """Test every save increments the user's row version."""
+        user = get_user_model().objects.create_user(
+            'test@example.com', 'test123')
+        self.assertEqual(user.version, 1)
+
+        stale = get_user_model().objects.get(pk=user.pk)
+        user.name = 'New'
+        user.save()
+        stale.save(update_fields=['name'])
+
+        self.assertEqual(user.version, 2)
+        self.assertEqual(stale.version, 3)
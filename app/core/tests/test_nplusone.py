@@ -0,0 +1,68 @@
+"""
+Tests for N+1 query detection.
+"""
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
+from django.db.models.query import QuerySet
+from django.test import TestCase
+
+from database.nplusone import (
+    NPlusOneError, assert_no_n_plus_one, detect_n_plus_one, get_fixes,
+    reset_fixes,
+)
+
+
+class NPlusOneTests(TestCase):
+    """Test detecting and auto-fixing N+1 queries."""
+
+    def setUp(self):
+        reset_fixes()
+        self.addCleanup(reset_fixes)
+        group = Group.objects.create(name='staff')
+        for index in range(3):
+            user = get_user_model().objects.create_user(
+                email=f'user{index}@example.com', password='testpass123')
+            user.groups.add(group)
+
+    def _walk_groups(self):
+        return [[group.name for group in user.groups.all()]
+                for user in get_user_model().objects.order_by('pk')]
+
+    def test_detects_n_plus_one(self):
+        """Test a relation walked per row is reported."""
+        with self.assertRaises(NPlusOneError) as cm:
+            with assert_no_n_plus_one():
+                self._walk_groups()
+
+        self.assertIn("prefetch_related('groups')", str(cm.exception))
+
+    def test_auto_fix_prefetches(self):
+        """Test the next queryset with the same SQL gets the fix."""
+        with detect_n_plus_one(auto_fix=True, log=False):
+            self._walk_groups()
+            with self.assertNumQueries(2):
+                groups = self._walk_groups()
+
+        self.assertEqual(groups, [['staff']] * 3)
+        self.assertEqual(
+            list(get_fixes().values()), [[('prefetch_related', 'groups')]])
+
+    def test_empty_queryset_in_auto_fix_scope(self):
+        """Test querysets that can't match anything still evaluate."""
+        with detect_n_plus_one(auto_fix=True, log=False):
+            users = list(get_user_model().objects.filter(pk__in=[]))
+
+        self.assertEqual(users, [])
+
+    def test_queryset_patched_only_in_scope(self):
+        """Test QuerySet._fetch_all is restored when the last scope exits."""
+        original = QuerySet._fetch_all
+
+        with detect_n_plus_one(auto_fix=True, log=False):
+            with detect_n_plus_one(auto_fix=True, log=False):
+                self.assertIsNot(QuerySet._fetch_all, original)
+            self.assertIsNot(QuerySet._fetch_all, original)
+        with detect_n_plus_one(log=False):
+            self.assertIs(QuerySet._fetch_all, original)
+
+        self.assertIs(QuerySet._fetch_all, original)
@@ -0,0 +1,115 @@
+"""
+Tests for partition maintenance policies.
+"""
+from datetime import date
+
+from django.test import SimpleTestCase
+
+from partition_maintenance import PartitionPolicy
+
+
+TODAY = date(2024, 5, 15)
+
+
+class RangePolicyTests(SimpleTestCase):
+    """Test planning monthly/weekly RANGE partitions."""
+
+    def setUp(self):
+        self.policy = PartitionPolicy.from_config({
+            'TABLE': 'events', 'COLUMN': 'created_at', 'STRATEGY': 'range',
+            'INTERVAL': 'month', 'PREMAKE': 2, 'RETENTION': 3,
+        })
+
+    def test_wanted_premakes_ahead(self):
+        """Test the current partition and PREMAKE more are wanted."""
+        self.assertEqual(self.policy.wanted(TODAY), {
+            'events_p20240501': (date(2024, 5, 1), date(2024, 6, 1)),
+            'events_p20240601': (date(2024, 6, 1), date(2024, 7, 1)),
+            'events_p20240701': (date(2024, 7, 1), date(2024, 8, 1)),
+        })
+
+    def test_wanted_weeks_start_on_monday(self):
+        """Test weekly partitions are aligned to Mondays."""
+        policy = PartitionPolicy('events', 'created_at', interval='week',
+                                 premake=1)
+
+        self.assertEqual(list(policy.wanted(TODAY).values()), [
+            (date(2024, 5, 13), date(2024, 5, 20)),
+            (date(2024, 5, 20), date(2024, 5, 27)),
+        ])
+
+    def test_expired_past_retention(self):
+        """Test partitions ending RETENTION intervals ago expire."""
+        existing = {
+            f'events_p2024{month:02}01': (
+                f"FOR VALUES FROM ('2024-{month:02}-01 00:00:00+00') "
+                f"TO ('2024-{month + 1:02}-01 00:00:00+00')")
+            for month in range(1, 6)
+        }
+        existing['events_default'] = 'DEFAULT'
+
+        self.assertEqual(self.policy.expired(existing, TODAY),
+                         ['events_p20240101'])
+
+    def test_expired_without_retention(self):
+        """Test nothing expires when RETENTION is None."""
+        policy = PartitionPolicy('events', 'created_at')
+
+        self.assertEqual(policy.expired({
+            'events_p20000101': "FOR VALUES FROM ('2000-01-01') TO ('2000-02-01')",
+        }, TODAY), [])
+
+    def test_predicate_prunable(self):
+        """Test the predicate compares the bare column."""
+        self.assertEqual(
+            self.policy.predicate(date(2024, 5, 1), date(2024, 6, 1), alias='e'),
+            ('e.created_at >= %s AND e.created_at < %s',
+             [date(2024, 5, 1), date(2024, 6, 1)]))
+        self.assertEqual(self.policy.predicate(end=date(2024, 6, 1)),
+                         ('created_at < %s', [date(2024, 6, 1)]))
+        with self.assertRaises(ValueError):
+            self.policy.predicate()
+
+
+class ListPolicyTests(SimpleTestCase):
+    """Test planning LIST partitions."""
+
+    def test_wanted_one_per_value(self):
+        """Test every value gets its own partition."""
+        policy = PartitionPolicy('tenants', 'tenant_id', strategy='list',
+                                 values=[1, 2])
+
+        self.assertEqual(policy.wanted(), {'tenants_p1': 1, 'tenants_p2': 2})
+
+    def test_expired_unquoted_values(self):
+        """Test numeric bounds, which are not quoted, are parsed."""
+        policy = PartitionPolicy('t', 'tenant_id', strategy='list',
+                                 values=[1, 2])
+
+        self.assertEqual(policy.expired({
+            't_p1': 'FOR VALUES IN (1)',
+            't_p2': 'FOR VALUES IN (2, 5)',
+            't_p3': 'FOR VALUES IN (3)',
+            't_p4': 'FOR VALUES IN (-4, 6)',
+            't_default': 'DEFAULT',
+        }), ['t_p3', 't_p4'])
+
+    def test_expired_quoted_values(self):
+        """Test quoted bounds, with escapes, casts and NULL, are parsed."""
+        policy = PartitionPolicy('t', 'region', strategy='list',
+                                 values=['eu', "it's"])
+
+        self.assertEqual(policy.expired({
+            't_peu': "FOR VALUES IN ('eu'::text)",
+            't_pits': "FOR VALUES IN ('it''s')",
+            't_pus': "FOR VALUES IN ('us', NULL)",
+            't_pnull': 'FOR VALUES IN (NULL)',
+        }), ['t_pus'])
+
+    def test_predicate_any(self):
+        """Test LIST predicates accept one value or many."""
+        policy = PartitionPolicy('t', 'tenant_id', strategy='list')
+
+        self.assertEqual(policy.predicate(3), ('tenant_id = ANY(%s)', [[3]]))
+        self.assertEqual(policy.predicate([3, 4], alias='t'),
+                         ('t.tenant_id = ANY(%s)', [[3, 4]]))
@@ -0,0 +1,103 @@
+"""
+Tests for learned queryset projections.
+"""
+import inspect
+import pickle
+
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_save
+from django.test import TestCase
+
+from database.projection import (
+    RECORDER_ATTR, ProjectionLearner, TrackingAttribute,
+)
+
+
+class ProjectionLearnerTests(TestCase):
+    """Test learning and applying only() per call site."""
+
+    def setUp(self):
+        self.model = get_user_model()
+        for index in range(3):
+            self.model.objects.create_user(
+                email=f'user{index}@example.com',
+                password='testpass123',
+                name=f'User {index}',
+            )
+        self.learner = ProjectionLearner(sample_rate=0, min_samples=2)
+
+    def _read_emails(self):
+        queryset = self.learner.project(
+            self.model.objects.order_by('pk'), site='emails')
+        return [user.email for user in queryset]
+
+    def test_projection_learned_and_applied(self):
+        """Test the fields read while sampling become the only() fields."""
+        self._read_emails()
+        self._read_emails()
+
+        queryset = self.learner.project(self.model.objects.all(), site='emails')
+        users = list(queryset)
+
+        self.assertEqual(len(users), 3)
+        self.assertEqual(users[0].get_deferred_fields(), {
+            f.attname for f in self.model._meta.concrete_fields
+        } - {'id', 'email'})
+        report = self.learner.report()[0]
+        self.assertEqual(report['projected_fields'], ['email', 'id'])
+        self.assertEqual(report['rows_projected'], 3)
+
+    def test_miss_loads_result_set_and_widens(self):
+        """Test reading a left-out field loads it for every row at once."""
+        self._read_emails()
+        self._read_emails()
+        users = list(self.learner.project(
+            self.model.objects.order_by('pk'), site='emails'))
+
+        with self.assertNumQueries(1):
+            names = [user.name for user in users]
+
+        self.assertEqual(names, ['User 0', 'User 1', 'User 2'])
+        self.assertIn('name', self.learner.report()[0]['projected_fields'])
+
+    def test_other_instances_not_tracked(self):
+        """Test only instances of projected querysets are tracked."""
+        tracked = list(self.learner.project(
+            self.model.objects.all(), site='emails'))[0]
+        plain = self.model.objects.first()
+
+        self.assertIs(type(plain), self.model)
+        self.assertNotIsInstance(
+            inspect.getattr_static(self.model, 'email'), TrackingAttribute)
+        self.assertIsInstance(tracked, self.model)
+        self.assertIs(tracked._meta, self.model._meta)
+
+    def test_pickle_drops_tracking(self):
+        """Test a tracked instance pickles as a plain model instance."""
+        tracked = list(self.learner.project(
+            self.model.objects.order_by('pk'), site='emails'))[0]
+
+        restored = pickle.loads(pickle.dumps(tracked))
+
+        self.assertIs(type(restored), self.model)
+        self.assertNotIn(RECORDER_ATTR, restored.__dict__)
+        self.assertEqual(restored, tracked)
+        self.assertEqual(restored.email, 'user0@example.com')
+
+    def test_save_sends_model_signals(self):
+        """Test saving a tracked instance keeps the model as signal sender."""
+        senders = []
+
+        def receiver(sender, **kwargs):
+            senders.append(sender)
+
+        post_save.connect(receiver, sender=self.model)
+        self.addCleanup(post_save.disconnect, receiver, sender=self.model)
+        user = list(self.learner.project(
+            self.model.objects.order_by('pk'), site='emails'))[0]
+        user.name = 'Renamed'
+        user.save()
+
+        self.assertEqual(senders, [self.model])
+        self.assertIs(type(user), self.model)
+        self.assertEqual(self.model.objects.get(pk=user.pk).name, 'Renamed')
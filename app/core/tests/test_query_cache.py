@@ -0,0 +1,142 @@
+"""
+Tests for the query-result cache.
+"""
+import threading
+import time
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase
+
+from database.query_cache import (
+    CacheEntry, QueryCache, get_query_cache, model_tag, reset_query_cache,
+)
+
+
+class Counter:
+    """Compute function that counts its calls."""
+
+    def __init__(self, value=None):
+        self.value = value
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return self.value
+
+
+class QueryCacheTests(SimpleTestCase):
+    """Test single-flight computing, falsy values, XFetch and tags."""
+
+    def setUp(self):
+        cache.clear()
+        self.cache = QueryCache(poll_interval=0.005, wait_timeout=2)
+
+    def test_falsy_values_cached(self):
+        """Test empty and None results are served from the cache."""
+        for key, value in (('empty', []), ('zero', 0), ('none', None)):
+            compute = Counter(value)
+
+            self.assertEqual(self.cache.get_or_compute(key, compute), value)
+            self.assertEqual(self.cache.get_or_compute(key, compute), value)
+            self.assertEqual(compute.calls, 1)
+        self.assertEqual(self.cache.stats()['hits'], 3)
+
+    def test_single_flight(self):
+        """Test concurrent misses compute once and the rest wait for it."""
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def compute():
+            calls.append(1)
+            started.set()
+            release.wait(2)
+            return 'rows'
+
+        results = []
+        threads = [threading.Thread(
+            target=lambda: results.append(self.cache.get_or_compute('k', compute)))
+            for _ in range(5)]
+        threads[0].start()
+        started.wait(2)
+        for thread in threads[1:]:
+            thread.start()
+        time.sleep(0.02)
+        release.set()
+        for thread in threads:
+            thread.join(2)
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ['rows'] * 5)
+        self.assertEqual(self.cache.stats()['waits'], 4)
+
+    def test_early_refresh(self):
+        """Test XFetch recomputes before expiry when the draw says so."""
+        cache.set('qc:k', CacheEntry('old', time.time() + 5, 10.0, {}))
+        compute = Counter('new')
+
+        with mock.patch('database.query_cache.random.random', return_value=0.0):
+            self.assertEqual(self.cache.get_or_compute('k', compute), 'old')
+        with mock.patch('database.query_cache.random.random',
+                        return_value=0.999999):
+            self.assertEqual(self.cache.get_or_compute('k', compute), 'new')
+
+        self.assertEqual(compute.calls, 1)
+        self.assertEqual(self.cache.stats()['early_refreshes'], 1)
+
+    def test_refresh_in_progress_serves_old_value(self):
+        """Test a reader losing the refresh lock keeps the current value."""
+        cache.set('qc:k', CacheEntry('old', time.time() - 1, 0.1, {}))
+        cache.add('qc:k:lock', 'someone else')
+        compute = Counter('new')
+
+        self.assertEqual(self.cache.get_or_compute('k', compute), 'old')
+        self.assertEqual(compute.calls, 0)
+
+    def test_tag_invalidation(self):
+        """Test bumping a tag recomputes only the entries carrying it."""
+        users = Counter(['alice'])
+        orders = Counter([1])
+        self.cache.get_or_compute('users', users, tags=['core.user'])
+        self.cache.get_or_compute('orders', orders, tags=['shop.order'])
+
+        self.cache.invalidate_tags('core.user')
+        self.cache.get_or_compute('users', users, tags=['core.user'])
+        self.cache.get_or_compute('orders', orders, tags=['shop.order'])
+
+        self.assertEqual(users.calls, 2)
+        self.assertEqual(orders.calls, 1)
+
+
+class WatchedModelTests(TestCase):
+    """Test writes to watched models invalidate cached results."""
+
+    def setUp(self):
+        cache.clear()
+        reset_query_cache()
+        self.user = get_user_model().objects.create_user(
+            email='test@example.com', password='testpass123')
+        self.compute = Counter(['test@example.com'])
+
+    def _get(self):
+        return get_query_cache().get_or_compute(
+            'emails', self.compute, tags=[model_tag(get_user_model())])
+
+    def test_save_invalidates(self):
+        """Test saving a user makes results tagged with core.user stale."""
+        self._get()
+        self.user.save()
+        self._get()
+
+        self.assertEqual(self.compute.calls, 2)
+
+    def test_invalidated_again_on_commit(self):
+        """Test a result computed inside the writing transaction is dropped."""
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.delete()
+            self._get()
+        self._get()
+
+        self.assertEqual(self.compute.calls, 2)
@@ -0,0 +1,47 @@
+"""
+Tests for the database maintenance Celery tasks.
+"""
+from django.test import SimpleTestCase, override_settings
+
+import queryoptimiser
+
+
+class TaskRegistrationTests(SimpleTestCase):
+    """Test the tasks are registered on the module's Celery app."""
+
+    def test_tasks_registered(self):
+        """Test every task can be found by name."""
+        names = set(queryoptimiser.app.tasks)
+
+        for task in ('shard_table_task', 'rebalance_shard_task',
+                     'cutover_shard_task'):
+            self.assertIn(f'queryoptimiser.{task}', names)
+        self.assertIsNotNone(queryoptimiser.app.backend)
+
+
+class PartitionScheduleTests(SimpleTestCase):
+    """Test partition maintenance is put on the beat schedule."""
+
+    def setUp(self):
+        self.app = queryoptimiser.app
+        self.addCleanup(self.app.conf.beat_schedule.pop,
+                        'partition maintenance', None)
+
+    @override_settings(PARTITION_MAINTENANCE={
+        'SCHEDULE': 600,
+        'POLICIES': [{'TABLE': 'events', 'COLUMN': 'created_at'}],
+    })
+    def test_beat_entry_registered(self):
+        """Test configuring the app schedules maintain_partitions_task."""
+        self.app.on_after_configure.send(sender=self.app)
+
+        entry = self.app.conf.beat_schedule['partition maintenance']
+        self.assertEqual(entry['task'], 'queryoptimiser.maintain_partitions_task')
+        self.assertEqual(entry['schedule'], 600)
+
+    @override_settings(PARTITION_MAINTENANCE={'POLICIES': []})
+    def test_no_policies_no_entry(self):
+        """Test nothing is scheduled without policies."""
+        self.app.on_after_configure.send(sender=self.app)
+
+        self.assertNotIn('partition maintenance', self.app.conf.beat_schedule)
@@ -0,0 +1,135 @@
+"""
+Tests for copying rows between shards on SQLite.
+"""
+import os
+import sqlite3
+import tempfile
+from datetime import datetime, timedelta, timezone
+
+from django.test import SimpleTestCase
+
+from rebalance import Endpoint, Rebalancer
+
+
+STARTED_AT = datetime(2024, 5, 1, 12, 0, tzinfo=timezone.utc)
+
+
+def stored(moment):
+    """Format a datetime the way Django stores it on SQLite."""
+    return moment.astimezone(timezone.utc).replace(tzinfo=None).isoformat(' ')
+
+
+class RebalancerTests(SimpleTestCase):
+    """Test the resumable copy, catch-up and delete of moving rows."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.source_path = os.path.join(directory.name, 'source.sqlite3')
+        self.target_path = os.path.join(directory.name, 'target.sqlite3')
+        earlier = stored(STARTED_AT - timedelta(hours=1))
+        self._execute(self.source_path, [
+            'CREATE TABLE orders_0 (id integer PRIMARY KEY, customer integer, '
+            'updated_at text)',
+        ] + [
+            f"INSERT INTO orders_0 VALUES ({pk}, {pk % 10}, '{earlier}')"
+            for pk in range(1, 41)
+        ])
+        self._execute(self.target_path, [
+            'CREATE TABLE orders_1 (id integer PRIMARY KEY, customer integer, '
+            'updated_at text)',
+            f"INSERT INTO orders_1 VALUES (1000, 11, '{earlier}')",
+        ])
+
+    def _execute(self, path, statements):
+        conn = sqlite3.connect(path)
+        for sql in statements:
+            conn.execute(sql)
+        conn.commit()
+        conn.close()
+
+    def _ids(self, path, table):
+        conn = sqlite3.connect(path)
+        ids = [pk for pk, in conn.execute(f'SELECT id FROM {table} ORDER BY id')]
+        conn.close()
+        return ids
+
+    def _rebalancer(self, **options):
+        source = Endpoint(f'sqlite:///{self.source_path}')
+        target = Endpoint(f'sqlite:///{self.target_path}')
+        self.addCleanup(source.close)
+        self.addCleanup(target.close)
+        return Rebalancer(
+            source, target, 'orders_0', 'orders_1', 'customer',
+            lambda customer: customer % 2 == 1, 'job-1',
+            source_owns=lambda customer: customer < 10,
+            **{'chunk_size': 7, 'range_size': 16, **options})
+
+    def _moving(self):
+        return [pk for pk in range(1, 41) if pk % 10 % 2 == 1]
+
+    def test_run_copies_moving_rows(self):
+        """Test only rows whose key moves reach the target."""
+        reports = self._rebalancer().run()
+
+        self.assertEqual(self._ids(self.target_path, 'orders_1'),
+                         self._moving() + [1000])
+        self.assertEqual([report['range'] for report in reports],
+                         [[0, 16], [16, 32], [32, 48]])
+        self.assertEqual(sum(report['rows_copied'] for report in reports), 20)
+
+    def test_run_resumes_from_checkpoint(self):
+        """Test a restarted job continues after the last copied chunk."""
+        def crash(report):
+            if report['rows_scanned'] >= 14:
+                raise RuntimeError('worker lost')
+
+        with self.assertRaises(RuntimeError):
+            self._rebalancer(progress=crash).run()
+        scanned = []
+        self._rebalancer(
+            progress=lambda report: scanned.append(report['rows_scanned'])).run()
+
+        self.assertEqual(self._ids(self.target_path, 'orders_1'),
+                         self._moving() + [1000])
+        self.assertEqual(scanned[0], 1)
+        self.assertEqual(self._rebalancer().run()[0]['rows_scanned'], 0)
+
+    def test_catch_up_since_datetime(self):
+        """Test a datetime since matches Django's SQLite timestamps."""
+        self._rebalancer().run()
+        later = stored(STARTED_AT + timedelta(minutes=5))
+        self._execute(self.source_path, [
+            f"UPDATE orders_0 SET customer = 3, updated_at = '{later}' WHERE id = 2",
+            "UPDATE orders_0 SET customer = 5 WHERE id = 4",
+        ])
+
+        reports = self._rebalancer().catch_up(('updated_at', STARTED_AT))
+
+        self.assertIn(2, self._ids(self.target_path, 'orders_1'))
+        self.assertNotIn(4, self._ids(self.target_path, 'orders_1'))
+        self.assertEqual(sum(report['rows_copied'] for report in reports), 1)
+
+    def test_catch_up_deletes_rows_gone_from_source(self):
+        """Test copies of deleted rows go, the target's own rows stay."""
+        self._rebalancer().run()
+        self._execute(self.source_path, [
+            'DELETE FROM orders_0 WHERE id IN (3, 39)',
+        ])
+
+        reports = self._rebalancer().catch_up(('updated_at', STARTED_AT))
+
+        moving = [pk for pk in self._moving() if pk not in (3, 39)]
+        self.assertEqual(self._ids(self.target_path, 'orders_1'), moving + [1000])
+        self.assertEqual(sum(report['rows_deleted'] for report in reports), 2)
+
+    def test_delete_moved(self):
+        """Test moved rows are deleted from the source."""
+        rebalancer = self._rebalancer()
+        rebalancer.run()
+
+        deleted = rebalancer.delete_moved()
+
+        self.assertEqual(deleted, 20)
+        self.assertEqual(self._ids(self.source_path, 'orders_0'),
+                         [pk for pk in range(1, 41) if pk not in self._moving()])
@@ -0,0 +1,204 @@
+"""
+Tests for read replica routing.
+"""
+import time
+
+from asgiref.sync import iscoroutinefunction
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from core import routers
+from core.middleware import ReplicaPinningMiddleware
+
+
+REPLICA_SETTINGS = {
+    'ALIASES': ['replica1', 'replica2'],
+    'MAX_LAG': 5,
+    'CHECK_INTERVAL': 0,
+    'EJECT_SECONDS': 30,
+    'PIN_SECONDS': 5,
+}
+
+
+class FakeProbe:
+    """Probe returning canned lags, or raising for unreachable replicas."""
+
+    def __init__(self, **lags):
+        self.lags = lags
+
+    def __call__(self, alias):
+        lag = self.lags[alias]
+        if isinstance(lag, Exception):
+            raise lag
+        return lag
+
+
+class ReplicaSetTests(SimpleTestCase):
+    """Test replica health checks."""
+
+    def setUp(self):
+        self.now = 1000.0
+        self.probe = FakeProbe(replica1=0, replica2=0)
+        self.replicas = routers.ReplicaSet(
+            ['replica1', 'replica2'], max_lag=5, check_interval=0,
+            eject_seconds=30, probe=self.probe, clock=lambda: self.now)
+
+    def test_round_robin(self):
+        """Test reads alternate between healthy replicas."""
+        chosen = [self.replicas.choose() for _ in range(4)]
+
+        self.assertEqual(chosen, ['replica1', 'replica2'] * 2)
+
+    def test_lagging_replica_ejected(self):
+        """Test a replica over the lag threshold stops serving reads."""
+        self.probe.lags['replica2'] = 10
+
+        self.assertEqual(self.replicas.healthy(), ['replica1'])
+
+    def test_failing_replica_ejected_then_readmitted(self):
+        """Test an unreachable replica comes back after EJECT_SECONDS."""
+        self.probe.lags['replica1'] = ConnectionError('down')
+        self.assertEqual(self.replicas.healthy(), ['replica2'])
+
+        self.probe.lags['replica1'] = 0
+        self.now += 10
+        self.assertEqual(self.replicas.healthy(), ['replica2'])
+        self.now += 30
+        self.assertEqual(self.replicas.healthy(), ['replica1', 'replica2'])
+
+    def test_no_healthy_replica(self):
+        """Test choose() gives up when every replica is ejected."""
+        self.probe.lags.update(replica1=60, replica2=ConnectionError())
+
+        self.assertIsNone(self.replicas.choose())
+
+
+@override_settings(DATABASE_REPLICAS=REPLICA_SETTINGS)
+class ReplicaRouterTests(SimpleTestCase):
+    """Test routing reads and writes, and pinning clients."""
+
+    def setUp(self):
+        routers.reset_replica_set()
+        routers.get_replica_set().probe = FakeProbe(replica1=0, replica2=0)
+        self.router = routers.ReplicaRouter()
+        self.factory = RequestFactory()
+        self.model = get_user_model()
+
+    def _handle(self, request, write=False):
+        used = []
+
+        def view(request):
+            used.append(self.router.db_for_read(self.model))
+            if write:
+                self.router.db_for_write(self.model)
+                used.append(self.router.db_for_read(self.model))
+            return HttpResponse()
+
+        return ReplicaPinningMiddleware(view)(request), used
+
+    def test_reads_go_to_replicas(self):
+        """Test reads are spread over replicas and writes hit the primary."""
+        self.assertIn(self.router.db_for_read(self.model),
+                      REPLICA_SETTINGS['ALIASES'])
+        self.assertEqual(self.router.db_for_write(self.model), 'default')
+
+    def test_falls_back_to_primary(self):
+        """Test reads go to the primary when no replica is healthy."""
+        routers.get_replica_set().probe = FakeProbe(
+            replica1=ConnectionError(), replica2=ConnectionError())
+
+        self.assertEqual(self.router.db_for_read(self.model), 'default')
+
+    def test_pinned_context(self):
+        """Test reads inside pinned_to_primary() use the primary."""
+        with routers.pinned_to_primary():
+            self.assertEqual(self.router.db_for_read(self.model), 'default')
+
+    def test_replicas_not_migrated(self):
+        """Test migrations only run on the primary."""
+        self.assertFalse(self.router.allow_migrate('replica1', 'core'))
+        self.assertIsNone(self.router.allow_migrate('default', 'core'))
+
+    def test_write_pins_rest_of_request(self):
+        """Test a write sends later reads to the primary and sets a cookie."""
+        response, used = self._handle(self.factory.get('/'), write=True)
+
+        self.assertIn(used[0], REPLICA_SETTINGS['ALIASES'])
+        self.assertEqual(used[1], 'default')
+        self.assertIn('db_pin', response.cookies)
+
+    def test_unsafe_method_pinned(self):
+        """Test POST requests read from the primary."""
+        _response, used = self._handle(self.factory.post('/'))
+
+        self.assertEqual(used, ['default'])
+
+    def test_cookie_pins_client(self):
+        """Test a client with a live pin cookie reads from the primary."""
+        request = self.factory.get('/')
+        request.COOKIES['db_pin'] = str(time.time() + 5)
+
+        _response, used = self._handle(request)
+
+        self.assertEqual(used, ['default'])
+
+    def test_token_pins_client(self):
+        """Test a token client that wrote reads from the primary next time."""
+        headers = {'HTTP_AUTHORIZATION': 'Token abc'}
+        self._handle(self.factory.post('/', **headers))
+
+        _response, used = self._handle(self.factory.get('/', **headers))
+        _response, other = self._handle(
+            self.factory.get('/', HTTP_AUTHORIZATION='Token xyz'))
+
+        self.assertEqual(used, ['default'])
+        self.assertIn(other[0], REPLICA_SETTINGS['ALIASES'])
+
+    @override_settings(
+        CACHES={
+            'default': {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            },
+            'pins': {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                'LOCATION': 'pins',
+            },
+        },
+        DATABASE_REPLICAS={**REPLICA_SETTINGS, 'CACHE_ALIAS': 'pins'},
+    )
+    def test_token_pin_in_cache_alias(self):
+        """Test token pins are stored in the configured cache."""
+        routers.get_replica_set().probe = FakeProbe(replica1=0, replica2=0)
+        headers = {'HTTP_AUTHORIZATION': 'Token pins'}
+        self._handle(self.factory.post('/', **headers))
+
+        _response, used = self._handle(self.factory.get('/', **headers))
+        caches['pins'].clear()
+        _response, unpinned = self._handle(self.factory.get('/', **headers))
+
+        self.assertEqual(used, ['default'])
+        self.assertIn(unpinned[0], REPLICA_SETTINGS['ALIASES'])
+
+    async def test_async_write_pins_rest_of_request(self):
+        """Test pinning works the same under an async handler."""
+        used = []
+
+        async def view(request):
+            used.append(self.router.db_for_read(self.model))
+            self.router.db_for_write(self.model)
+            used.append(self.router.db_for_read(self.model))
+            return HttpResponse()
+
+        middleware = ReplicaPinningMiddleware(view)
+        response = await middleware(
+            self.factory.get('/', HTTP_AUTHORIZATION='Token async'))
+        _response, later = self._handle(
+            self.factory.get('/', HTTP_AUTHORIZATION='Token async'))
+
+        self.assertTrue(iscoroutinefunction(middleware))
+        self.assertIn(used[0], REPLICA_SETTINGS['ALIASES'])
+        self.assertEqual(used[1], 'default')
+        self.assertIn('db_pin', response.cookies)
+        self.assertEqual(later, ['default'])
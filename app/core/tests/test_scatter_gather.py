@@ -0,0 +1,210 @@
+"""
+Tests for scatter-gather queries over shards.
+"""
+import time
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from scatter_gather import ScatterGather, ShardQueryError, ShardTarget
+
+
+class StubCursor:
+
+    def __init__(self, shard):
+        self.shard = shard
+        self.position = 0
+        self.closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def execute(self, sql, params=None):
+        self.shard.executed.append(sql)
+
+    def fetchmany(self, size):
+        time.sleep(self.shard.delay)
+        self.shard.fetches += 1
+        if self.shard.fetches == self.shard.fail_at:
+            raise ConnectionError('connection lost')
+        rows = self.shard.rows[self.position:self.position + size]
+        self.position += len(rows)
+        return rows
+
+    def close(self):
+        self.closed = True
+
+
+class StubShard:
+    """Pool of one shard whose connection answers with rows."""
+
+    def __init__(self, rows, fail_at=None, delay=0):
+        self.rows = rows
+        self.fail_at = fail_at
+        self.delay = delay
+        self.executed = []
+        self.fetches = 0
+        self.checked_out = 0
+        self.cursors = []
+
+    def getconn(self, timeout=None):
+        self.checked_out += 1
+        return self
+
+    def putconn(self, conn, close=False):
+        self.checked_out -= 1
+
+    def cursor(self, name=None):
+        cursor = StubCursor(self)
+        if name is not None:
+            self.cursors.append(cursor)
+        return cursor
+
+
+class ScatterGatherTests(SimpleTestCase):
+    """Test merging, limiting and aggregating shard results."""
+
+    def _gather(self, policy='fail', fetch_size=3, timeout=5, **shards):
+        patcher = mock.patch('scatter_gather.get_pool', shards.__getitem__)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.shards = shards
+        gather = ScatterGather(
+            [ShardTarget(name, name, f'orders_{name}') for name in shards],
+            timeout=timeout, policy=policy, fetch_size=fetch_size)
+        self.addCleanup(gather.close)
+        return gather
+
+    def assertReleased(self):
+        for shard in self.shards.values():
+            self.assertEqual(shard.checked_out, 0)
+            self.assertTrue(all(cursor.closed for cursor in shard.cursors))
+
+    def test_ordered_merges_sorted_shards(self):
+        """Test the heap merge interleaves shard rows in order."""
+        gather = self._gather(
+            a=StubShard([(1,), (4,), (7,), (10,)]),
+            b=StubShard([(2,), (5,), (8,)]),
+            c=StubShard([(3,), (6,)]),
+        )
+
+        rows = list(gather.ordered('SELECT id FROM {table} ORDER BY id'))
+
+        self.assertEqual(rows, [(n,) for n in (1, 2, 3, 4, 5, 6, 7, 8, 10)])
+        self.assertEqual(self.shards['b'].executed[-1],
+                         'SELECT id FROM orders_b ORDER BY id')
+        self.assertReleased()
+
+    def test_ordered_reverse_with_key(self):
+        """Test descending merges by a key function."""
+        gather = self._gather(
+            a=StubShard([('x', 9), ('y', 3)]),
+            b=StubShard([('z', 7), ('w', 1)]),
+        )
+
+        rows = list(gather.ordered('SELECT ...', key=lambda row: row[1],
+                                   reverse=True))
+
+        self.assertEqual([row[0] for row in rows], ['x', 'z', 'y', 'w'])
+
+    def test_limit_stops_fetching(self):
+        """Test a LIMIT stops pulling rows and closes every shard cursor."""
+        gather = self._gather(
+            fetch_size=10,
+            a=StubShard([(n,) for n in range(0, 1000, 2)]),
+            b=StubShard([(n,) for n in range(1, 1000, 2)]),
+        )
+
+        rows = list(gather.ordered('SELECT ...', limit=5))
+
+        self.assertEqual(rows, [(n,) for n in range(5)])
+        self.assertEqual(self.shards['a'].fetches, 1)
+        self.assertEqual(self.shards['b'].fetches, 1)
+        self.assertReleased()
+
+    def test_aggregate_combines_partials(self):
+        """Test counts add up, min/max combine and AVG is SUM over COUNT."""
+        gather = self._gather(
+            a=StubShard([('paid', 2, 10, 15, 2), ('open', 1, 4, 4, 1)]),
+            b=StubShard([('paid', 3, 30, 45, 3)]),
+            c=StubShard([('paid', 1, None, None, 0)]),
+        )
+
+        result = gather.aggregate('SELECT ...', ['count', 'max', 'avg'],
+                                  group_by=1)
+
+        self.assertEqual(sorted(result), [
+            ('open', 1, 4, 4.0),
+            ('paid', 6, 30, 12.0),
+        ])
+        self.assertTrue(result.complete)
+
+    def test_aggregate_rejects_unknown(self):
+        """Test aggregates that can't be combined are refused."""
+        gather = self._gather(a=StubShard([]))
+
+        with self.assertRaises(ValueError):
+            gather.aggregate('SELECT ...', ['median'])
+
+    def test_partial_policy_keeps_rows_before_failure(self):
+        """Test a shard failing mid-stream is listed and the rest merged."""
+        gather = self._gather(
+            policy='partial',
+            a=StubShard([(n,) for n in range(0, 20, 2)]),
+            b=StubShard([(n,) for n in range(1, 20, 2)], fail_at=2),
+        )
+
+        result = gather.ordered('SELECT ...')
+        rows = list(result)
+
+        self.assertEqual(rows, [(n,) for n in (0, 1, 2, 3, 4, 5)]
+                         + [(n,) for n in range(6, 20, 2)])
+        self.assertEqual(result.failed, {'b': 'connection lost'})
+        self.assertFalse(result.complete)
+        self.assertReleased()
+
+    def test_fail_policy_raises_mid_stream(self):
+        """Test a shard failing mid-stream aborts the query."""
+        gather = self._gather(
+            a=StubShard([(n,) for n in range(0, 20, 2)]),
+            b=StubShard([(n,) for n in range(1, 20, 2)], fail_at=2),
+        )
+
+        with self.assertRaises(ShardQueryError) as cm:
+            list(gather.ordered('SELECT ...'))
+
+        self.assertEqual(cm.exception.shard, 'b')
+        self.assertReleased()
+
+    def test_timeout_per_round_trip(self):
+        """Test a slow consumer doesn't use up the shards' timeout."""
+        gather = self._gather(
+            timeout=0.1, fetch_size=2,
+            a=StubShard([(n,) for n in range(0, 12, 2)]),
+            b=StubShard([(n,) for n in range(1, 12, 2)]),
+        )
+        rows = []
+
+        for row in gather.ordered('SELECT ...'):
+            rows.append(row)
+            time.sleep(0.02)
+
+        self.assertEqual(rows, [(n,) for n in range(12)])
+        self.assertReleased()
+
+    def test_slow_round_trip_times_out(self):
+        """Test a single fetch slower than the timeout fails the shard."""
+        gather = self._gather(
+            policy='partial', timeout=0.05,
+            a=StubShard([(1,), (2,)]),
+            b=StubShard([(3,)], delay=0.2),
+        )
+
+        result = gather.ordered('SELECT ...')
+        rows = list(result)
+
+        self.assertEqual(rows, [(1,), (2,)])
+        self.assertEqual(result.failed, {'b': 'timed out after 0.05s'})
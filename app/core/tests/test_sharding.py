@@ -0,0 +1,193 @@
+"""
+Tests for the consistent-hash shard map.
+"""
+import tempfile
+from collections import Counter
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ImproperlyConfigured
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from core import sharding
+
+
+SHARDING_SETTINGS = {
+    'VNODES': 64,
+    'SHARDS': {
+        's0': {'ALIAS': 'default', 'TABLE_SUFFIX': '0'},
+        's1': {'ALIAS': 'shard1', 'TABLE_SUFFIX': '1'},
+    },
+    'MODELS': {'core.User': 'email'},
+}
+
+KEYS = range(20000)
+
+
+class HashRingTests(SimpleTestCase):
+    """Test key placement on the ring."""
+
+    def setUp(self):
+        self.ring = sharding.HashRing(['a', 'b', 'c', 'd'])
+
+    def test_lookup_is_stable(self):
+        """Test a key always maps to the same shard."""
+        for key in (1, 'user@example.com', b'raw'):
+            self.assertEqual(self.ring.lookup(key), self.ring.lookup(key))
+
+    def test_keys_spread_evenly(self):
+        """Test every shard gets close to 1/N of the keys."""
+        counts = Counter(self.ring.lookup(key) for key in KEYS)
+
+        for shard in self.ring.shards:
+            self.assertAlmostEqual(counts[shard] / len(KEYS), 0.25, delta=0.06)
+
+    def test_adding_shard_moves_one_nth(self):
+        """Test adding a fifth shard moves about 1/5 of keys, all to it."""
+        bigger = self.ring.with_shard('e')
+
+        moved = [key for key in KEYS
+                 if self.ring.lookup(key) != bigger.lookup(key)]
+
+        self.assertAlmostEqual(len(moved) / len(KEYS), 0.2, delta=0.05)
+        self.assertEqual({bigger.lookup(key) for key in moved}, {'e'})
+
+    def test_removing_shard_only_moves_its_keys(self):
+        """Test removing a shard leaves other shards' keys in place."""
+        smaller = self.ring.without_shard('d')
+
+        for key in range(2000):
+            if self.ring.lookup(key) != 'd':
+                self.assertEqual(smaller.lookup(key), self.ring.lookup(key))
+
+
+@override_settings(SHARDING=SHARDING_SETTINGS)
+class ShardRouterTests(SimpleTestCase):
+    """Test routing sharded models and naming shard tables."""
+
+    def setUp(self):
+        self.router = sharding.ShardRouter()
+        self.model = get_user_model()
+        self.shard_map = sharding.get_shard_map()
+
+    def test_hint_routes_to_shard_alias(self):
+        """Test the shard_key hint picks the shard's alias."""
+        for email in ('a@example.com', 'b@example.com', 'c@example.com'):
+            self.assertEqual(
+                self.router.db_for_read(self.model, shard_key=email),
+                sharding.shard_for(email).alias)
+
+    def test_instance_routes_by_key_field(self):
+        """Test saving an instance uses its shard key field."""
+        user = self.model(email='a@example.com')
+
+        self.assertEqual(
+            self.router.db_for_write(self.model, instance=user),
+            sharding.shard_for('a@example.com').alias)
+
+    def test_unsharded_model_falls_through(self):
+        """Test models without a shard key are left to other routers."""
+        from rest_framework.authtoken.models import Token
+
+        self.assertIsNone(self.router.db_for_read(Token, shard_key=1))
+
+    def test_table_for(self):
+        """Test raw SQL table names carry the shard's suffix."""
+        shard = sharding.shard_for(42)
+
+        self.assertEqual(self.shard_map.table_for('core_user', 42),
+                         f'core_user_{shard.table_suffix}')
+
+
+@override_settings(SHARDING={
+    'SHARDS': {'s0': {'ALIAS': 'default', 'TABLE_SUFFIX': 'shard0'}},
+})
+class ExecuteOnShardTests(TestCase):
+    """Test running raw SQL against a key's shard table."""
+
+    def test_execute_on_shard(self):
+        """Test {table} placeholders resolve to the shard's table."""
+        sharding.execute_on_shard(
+            7, 'CREATE TABLE {notes} (id integer, body text)')
+        sharding.execute_on_shard(
+            7, 'INSERT INTO {notes} VALUES (%s, %s)', [7, 'hello'])
+
+        rows = sharding.execute_on_shard(
+            7, 'SELECT body FROM {notes} WHERE id = %s', [7])
+
+        self.assertEqual(rows, [('hello',)])
+
+
+class PublishShardMapTests(SimpleTestCase):
+    """Test rebalances switching the shard map of every process."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        shared = override_settings(
+            CACHES={
+                'default': {
+                    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                },
+                'shared': {
+                    'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                    'LOCATION': directory.name,
+                },
+            },
+            SHARDING={**SHARDING_SETTINGS, 'REFRESH_INTERVAL': 0,
+                      'CACHE_ALIAS': 'shared'},
+        )
+        shared.enable()
+        self.addCleanup(shared.disable)
+        self.addCleanup(sharding.reset_shard_map)
+        self.router = sharding.ShardRouter()
+        self.model = get_user_model()
+
+    def test_published_map_is_picked_up(self):
+        """Test a published map replaces the one from settings."""
+        shards = {**SHARDING_SETTINGS['SHARDS'],
+                  's2': {'ALIAS': 'shard2', 'TABLE_SUFFIX': '2'}}
+        moved = next(f'{i}@example.com' for i in range(1000)
+                     if sharding.HashRing(shards, 64).lookup(f'{i}@example.com') == 's2')
+
+        version = sharding.publish_shard_map(shards)
+
+        self.assertEqual(sharding.get_shard_map().version, version)
+        self.assertEqual(self.router.db_for_read(self.model, shard_key=moved), 'shard2')
+
+    def test_frozen_writes_raise(self):
+        """Test writes to sharded models fail until the freeze is lifted."""
+        sharding.freeze_writes()
+
+        with self.assertRaises(sharding.ShardMapFrozen):
+            self.router.db_for_write(self.model, shard_key='a@example.com')
+        self.assertIsNotNone(self.router.db_for_read(self.model, shard_key='a@example.com'))
+
+        sharding.thaw_writes()
+        self.assertIsNotNone(
+            self.router.db_for_write(self.model, shard_key='a@example.com'))
+
+    def test_freeze_extended_only_while_frozen(self):
+        """Test an expired freeze can't be extended."""
+        sharding.freeze_writes()
+        self.assertTrue(sharding.extend_freeze())
+
+        sharding.thaw_writes()
+        self.assertFalse(sharding.extend_freeze())
+
+    def test_process_local_cache_refused(self):
+        """Test publishing through a per-process cache fails loudly."""
+        with self.settings(SHARDING={**SHARDING_SETTINGS,
+                                     'CACHE_ALIAS': 'default'}):
+            with self.assertRaises(ImproperlyConfigured):
+                sharding.publish_shard_map(SHARDING_SETTINGS['SHARDS'])
+            with self.assertRaises(ImproperlyConfigured):
+                sharding.freeze_writes()
+
+    def test_config_rebuilt_on_settings_change(self):
+        """Test the cached config follows overridden settings."""
+        config = sharding.get_config()
+
+        self.assertIs(sharding.get_config(), config)
+        with self.settings(SHARDING={**SHARDING_SETTINGS, 'VNODES': 8}):
+            self.assertEqual(sharding.get_config()['VNODES'], 8)
+        self.assertEqual(sharding.get_config()['VNODES'], 64)
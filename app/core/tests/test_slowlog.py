@@ -0,0 +1,79 @@
+"""
+Tests for the slow query log.
+"""
+import json
+import multiprocessing
+import os
+import tempfile
+
+from django.test import SimpleTestCase
+
+from database.slowlog import SlowQueryLog
+
+
+LINE = {'alias': 'default', 'shape': 'SELECT ?', 'duration_ms': 150.0}
+
+
+def _append(path, count, max_bytes):
+    log = SlowQueryLog(path=path, max_bytes=max_bytes)
+    for _ in range(count):
+        log._write(LINE)
+
+
+class SlowQueryLogTests(SimpleTestCase):
+    """Test aggregation and the JSONL file of the slow query log."""
+
+    def test_shapes_capped(self):
+        """Test new shapes evict the one with the least total time."""
+        # No EXPLAIN jobs: the tables don't exist and no worker is needed.
+        log = SlowQueryLog(max_shapes=2, explain_top=0)
+        self.addCleanup(log.close)
+
+        log.record('default', 'SELECT 1 FROM a', None, 0.3)
+        log.record('default', 'SELECT 1 FROM b', None, 0.1)
+        log.record('default', 'SELECT 1 FROM c', None, 0.2)
+
+        self.assertEqual(sorted(log.shapes), [
+            'SELECT ? FROM a', 'SELECT ? FROM c'])
+        self.assertEqual(log.evicted, 1)
+        self.assertIsNone(log._worker)
+
+    def test_close_stops_worker(self):
+        """Test close writes the queued records and ends the thread."""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'slow.jsonl')
+        log = SlowQueryLog(path=path, explain_top=0)
+
+        log.record('default', 'SELECT 1', None, 0.2)
+        log.close()
+
+        self.assertFalse(log._worker.is_alive())
+        with open(path, encoding='utf-8') as log_file:
+            self.assertEqual(json.loads(log_file.read())['shape'], 'SELECT ?')
+
+    def test_processes_share_rotated_file(self):
+        """Test concurrent writers rotate the file once per MAX_BYTES."""
+        line_bytes = len(json.dumps(LINE)) + 1
+        max_bytes = line_bytes * 5
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'slow.jsonl')
+            context = multiprocessing.get_context('fork')
+            workers = [context.Process(target=_append,
+                                       args=(path, 500, max_bytes))
+                       for _ in range(8)]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+
+            rotated = os.path.getsize(f'{path}.1')
+            current = os.path.getsize(path)
+            for name in (path, f'{path}.1'):
+                with open(name, encoding='utf-8') as log_file:
+                    for line in log_file:
+                        self.assertEqual(json.loads(line), LINE)
+
+        self.assertGreater(rotated, max_bytes)
+        self.assertLessEqual(rotated, max_bytes + line_bytes)
+        self.assertLessEqual(current, max_bytes + line_bytes)
@@ -0,0 +1,243 @@
+"""
+Tests for admission control and routing of Celery tasks.
+"""
+import asyncio
+import importlib.util
+import threading
+import time
+import uuid
+
+from celery import Celery, states
+from celery.exceptions import ImproperlyConfigured
+from celery.result import AsyncResult
+from django.test import SimpleTestCase
+
+from admission_queue import (
+    AdmissionCancelled, AdmissionQueue, AdmissionRejected, AdmissionTimeout,
+)
+
+from . import REPO_DIR
+
+
+_spec = importlib.util.spec_from_file_location(
+    'task_routing', REPO_DIR / 'celery' / 'task-routing.py')
+task_routing = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(task_routing)
+
+
+def wait_until(predicate, timeout=2):
+    """Poll predicate until it holds or timeout seconds have passed."""
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.005)
+    return True
+
+
+class FakeResult(AsyncResult):
+    """AsyncResult whose state is set by the test instead of a backend."""
+
+    def __init__(self):
+        self.id = uuid.uuid4().hex
+        self.error = None
+        self._state = states.PENDING
+
+    @property
+    def state(self):
+        if self.error is not None:
+            raise self.error
+        return self._state
+
+    def finish(self, state=states.SUCCESS):
+        self._state = state
+
+
+class AdmissionQueueTests(SimpleTestCase):
+    """Test bounded, fair admission of tasks."""
+
+    def setUp(self):
+        self.queue = AdmissionQueue(max_concurrency=1, max_queue=2)
+
+    def test_release_admits_next(self):
+        """Test a ticket waits until the slot is released."""
+        first = self.queue.acquire('scan')
+        second = self.queue.submit('scan')
+
+        self.assertFalse(second.admitted)
+        first.release()
+
+        self.assertTrue(second.admitted)
+        self.assertEqual(self.queue.in_flight, 1)
+
+    def test_priority_then_arrival(self):
+        """Test higher priority goes first, equal priority in order."""
+        queue = AdmissionQueue(max_concurrency=1)
+        held = queue.acquire('scan')
+        low = queue.submit('scan', priority=0)
+        high = queue.submit('scan', priority=5)
+        later = queue.submit('scan', priority=0)
+        order = []
+
+        for _ in range(3):
+            held.release()
+            held = next(t for t in (low, high, later) if t.admitted and t not in order)
+            order.append(held)
+
+        self.assertEqual(order, [high, low, later])
+
+    def test_task_names_take_turns(self):
+        """Test a burst of one task name doesn't starve another."""
+        queue = AdmissionQueue(max_concurrency=1)
+        held = queue.acquire('scan')
+        scans = [queue.submit('scan') for _ in range(3)]
+        resize = queue.submit('resize')
+
+        held.release()
+        scans[0].release()
+
+        self.assertTrue(resize.admitted)
+        self.assertFalse(scans[1].admitted)
+
+    def test_full_queue_rejects(self):
+        """Test a task name over max_queue waiting tickets is rejected."""
+        self.queue.acquire('scan')
+        self.queue.submit('scan')
+        self.queue.submit('scan')
+
+        with self.assertRaises(AdmissionRejected):
+            self.queue.submit('scan')
+        self.queue.submit('resize')
+        self.assertEqual(self.queue.stats()['tasks']['scan']['rejected'], 1)
+
+    def test_timeout_cancels_ticket(self):
+        """Test a ticket not admitted in time gives up its place."""
+        held = self.queue.acquire('scan')
+
+        with self.assertRaises(AdmissionTimeout):
+            self.queue.acquire('scan', timeout=0.01)
+        waiting = self.queue.submit('scan')
+        held.release()
+
+        self.assertTrue(waiting.admitted)
+        self.assertEqual(self.queue.stats()['tasks']['scan']['cancelled'], 1)
+
+    def test_cancel_wakes_waiter(self):
+        """Test a waiting thread learns its ticket was cancelled."""
+        self.queue.acquire('scan')
+        ticket = self.queue.submit('scan')
+        errors = []
+
+        def wait():
+            try:
+                ticket.wait(2)
+            except AdmissionCancelled as exc:
+                errors.append(exc)
+
+        waiter = threading.Thread(target=wait)
+        waiter.start()
+        ticket.cancel()
+        waiter.join(2)
+
+        self.assertEqual(len(errors), 1)
+
+    def test_acquire_async(self):
+        """Test waiting in an event loop for a slot freed by a thread."""
+        held = self.queue.acquire('scan')
+
+        async def acquire():
+            threading.Timer(0.01, held.release).start()
+            return await self.queue.acquire_async('scan', timeout=2)
+
+        ticket = asyncio.run(acquire())
+
+        self.assertTrue(ticket.admitted)
+
+    def test_cancelled_coroutine_cancels_ticket(self):
+        """Test cancelling the awaiting task gives the place back."""
+        held = self.queue.acquire('scan')
+
+        async def cancel():
+            waiter = asyncio.ensure_future(self.queue.acquire_async('scan'))
+            await asyncio.sleep(0.01)
+            waiter.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await waiter
+
+        asyncio.run(cancel())
+        held.release()
+
+        self.assertEqual(self.queue.in_flight, 0)
+        self.assertEqual(self.queue.stats()['tasks']['scan']['cancelled'], 1)
+
+
+class TaskRouterTests(SimpleTestCase):
+    """Test routing tasks through the admission queue."""
+
+    def setUp(self):
+        self.app = Celery('tests', broker='memory://', backend='cache+memory://')
+        self.router = task_routing.TaskRouter(
+            max_concurrency=1, admission_timeout=0.05, poll_interval=0.005,
+            celery_app=self.app)
+        self.results = []
+        self.router.add_task('scan', self._delay)
+
+    def _delay(self, *args, **kwargs):
+        result = FakeResult()
+        self.results.append(result)
+        return result
+
+    def test_requires_result_backend(self):
+        """Test a router for an app without result backend refuses to start."""
+        with self.assertRaises(ImproperlyConfigured):
+            task_routing.TaskRouter(celery_app=Celery('tests', broker='memory://'))
+
+    def test_slot_held_until_result_ready(self):
+        """Test the slot is freed when the worker finishes, not on dispatch."""
+        first = self.router.route_task('scan', '/tmp/a')
+
+        self.assertIs(first, self.results[0])
+        self.assertIsNone(self.router.route_task('scan', '/tmp/b'))
+        self.assertEqual(self.router.current_concurrency, 1)
+
+        first.finish()
+
+        self.assertTrue(wait_until(lambda: self.router.get_task_history('scan')))
+        self.assertEqual(self.router.current_concurrency, 0)
+        self.assertEqual(self.router.get_task_history('scan')[0][0], first)
+        self.assertEqual(self.router.performance_metrics['scan']['errors'], 0)
+        self.assertIsNotNone(self.router.route_task('scan', '/tmp/b'))
+
+    def test_unreadable_result_keeps_slot(self):
+        """Test a result that can't be checked isn't counted as finished."""
+        result = self.router.route_task('scan', '/tmp/a')
+        result.error = ConnectionError('backend down')
+
+        with self.assertLogs(task_routing.logger.name, 'WARNING'):
+            time.sleep(0.05)
+
+        self.assertEqual(self.router.current_concurrency, 1)
+        self.assertEqual(self.router.get_task_history('scan'), [])
+        result.error = None
+        result.finish(states.FAILURE)
+        self.assertTrue(wait_until(
+            lambda: self.router.performance_metrics['scan']['errors'] == 1))
+        self.assertEqual(self.router.current_concurrency, 0)
+
+    def test_plain_result_releases_immediately(self):
+        """Test a task run inline frees its slot on return."""
+        self.router.add_task('echo', lambda path: path)
+
+        self.assertEqual(self.router.route_task('echo', '/tmp/a'), '/tmp/a')
+        self.assertEqual(self.router.current_concurrency, 0)
+
+    def test_dispatch_error_releases(self):
+        """Test a task failing to dispatch frees its slot and counts an error."""
+        def broken(path):
+            raise ConnectionError('broker down')
+
+        self.router.task_queues['scan'] = [broken]
+
+        self.assertIsNone(self.router.route_task('scan', '/tmp/a'))
+        self.assertEqual(self.router.current_concurrency, 0)
+        self.assertEqual(self.router.performance_metrics['scan']['errors'], 1)
@@ -0,0 +1,145 @@
+"""
+Tests for the user cache.
+"""
+from django.contrib.auth import authenticate, get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+
+from core import routers
+from core.user_cache import get_user_cache
+
+
+class UserCacheTests(TestCase):
+    """Test looking users up through User.cached."""
+
+    def setUp(self):
+        cache.clear()
+        get_user_cache().clear()
+        self.user = get_user_model().objects.create_user(
+            email='test@example.com',
+            password='testpass123',
+            name='Test Name',
+        )
+        self.manager = get_user_model().cached
+
+    def test_get_by_pk_cached(self):
+        """Test a second lookup by pk doesn't hit the database."""
+        self.manager.get(pk=self.user.pk)
+
+        with self.assertNumQueries(0):
+            user = self.manager.get(pk=self.user.pk)
+
+        self.assertEqual(user.email, self.user.email)
+        self.assertEqual(self.manager.stats()['local_hits'], 1)
+
+    def test_get_by_email_cached(self):
+        """Test a second lookup by email doesn't hit the database."""
+        self.manager.get(email=self.user.email)
+
+        with self.assertNumQueries(0):
+            user = self.manager.get(email=self.user.email)
+
+        self.assertEqual(user.pk, self.user.pk)
+
+    def test_returns_copies(self):
+        """Test changes to a returned user don't leak into the cache."""
+        user = self.manager.get(pk=self.user.pk)
+        user.name = 'Changed'
+
+        self.assertEqual(self.manager.get(pk=self.user.pk).name, 'Test Name')
+
+    def test_missing_email_cached(self):
+        """Test missing emails are cached until a user takes them."""
+        email = 'new@example.com'
+        with self.assertRaises(get_user_model().DoesNotExist):
+            self.manager.get(email=email)
+        with self.assertNumQueries(0):
+            with self.assertRaises(get_user_model().DoesNotExist):
+                self.manager.get(email=email)
+
+        user = get_user_model().objects.create_user(email, 'testpass123')
+
+        self.assertEqual(self.manager.get(email=email).pk, user.pk)
+        self.assertEqual(self.manager.stats()['negative_hits'], 1)
+
+    def test_save_invalidates(self):
+        """Test saving a user drops the cached copy."""
+        self.manager.get(pk=self.user.pk)
+        self.manager.get(email=self.user.email)
+
+        self.user.email = 'other@example.com'
+        self.user.save()
+
+        self.assertEqual(
+            self.manager.get(pk=self.user.pk).email, 'other@example.com')
+        with self.assertRaises(get_user_model().DoesNotExist):
+            self.manager.get(email='test@example.com')
+
+    def test_queryset_update_invalidates(self):
+        """Test queryset update() drops the affected users."""
+        self.manager.get(pk=self.user.pk)
+        self.manager.get(email=self.user.email)
+
+        with self.assertNumQueries(1):
+            get_user_model().objects.filter(pk=self.user.pk).update(
+                name='Bulk', email='bulk@example.com')
+
+        self.assertEqual(self.manager.get(pk=self.user.pk).name, 'Bulk')
+        with self.assertRaises(get_user_model().DoesNotExist):
+            self.manager.get(email='test@example.com')
+
+    def test_queryset_delete_invalidates(self):
+        """Test queryset delete() drops the cached users."""
+        self.manager.get(pk=self.user.pk)
+
+        get_user_model().objects.filter(name='Test Name').delete()
+
+        with self.assertRaises(get_user_model().DoesNotExist):
+            self.manager.get(pk=self.user.pk)
+
+    def test_login_bypasses_cache(self):
+        """Test a password changed behind the cache's back works at once."""
+        self.manager.get(email=self.user.email)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'UPDATE core_user SET password = %s WHERE id = %s',
+                [make_password('newpass123'), self.user.pk])
+
+        user = authenticate(email=self.user.email, password='newpass123')
+
+        self.assertEqual(user.pk, self.user.pk)
+
+    @override_settings(DATABASE_REPLICAS={'ALIASES': ['replica1']})
+    def test_misses_read_from_primary(self):
+        """Test cache misses don't refill from a replica."""
+        # replica1 looks healthy but isn't a configured database, so any
+        # read routed to it fails.
+        routers.get_replica_set().probe = lambda alias: 0
+
+        self.assertEqual(self.manager.get(pk=self.user.pk).pk, self.user.pk)
+        self.assertEqual(
+            self.manager.get(email=self.user.email).pk, self.user.pk)
+
+    def test_delete_invalidates(self):
+        """Test deleting a user drops the cached copy."""
+        self.manager.get(email=self.user.email)
+
+        self.user.delete()
+
+        with self.assertRaises(get_user_model().DoesNotExist):
+            self.manager.get(email='test@example.com')
+
+    def test_other_lookups_not_cached(self):
+        """Test lookups other than pk or email go to the database."""
+        with self.assertNumQueries(2):
+            self.manager.get(name='Test Name')
+            self.manager.get(name='Test Name')
+
+    def test_hit_ratio(self):
+        """Test the hit ratio counts both cache levels."""
+        self.manager.get(pk=self.user.pk)
+        self.manager.get(pk=self.user.pk)
+
+        self.assertEqual(self.manager.stats()['hit_ratio'], 0.5)
@@ -0,0 +1,261 @@
+"""
+Two-level read-through cache for users looked up by pk or email.
+
+Users are kept in a small per-process LRU in front of a shared Django cache.
+Writes through ``User.save()``/``delete()`` invalidate the users they touch;
+bulk writes through ``User.objects`` querysets move the whole cache to a new
+generation, which every shared key includes. Both invalidate both levels in
+this process and the shared level everywhere; other processes can serve
+their local copy (and their view of the generation) for up to LOCAL_TTL
+seconds. Emails that don't exist are cached too, for NEGATIVE_TTL seconds.
+"""
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.dispatch import receiver
+
+
+DEFAULT_USER_CACHE = {
+    'LOCAL_MAX_SIZE': 10000,
+    'LOCAL_TTL': 5,
+    'TTL': 300,
+    'NEGATIVE_TTL': 30,
+    'CACHE_ALIAS': 'default',
+    'KEY_PREFIX': 'user:',
+}
+
+# Cached in place of a user for emails that don't exist.
+MISSING = 'missing'
+
+# Shared key (after KEY_PREFIX) of the current generation.
+GENERATION_KEY = 'generation'
+
+
+class UserCache:
+    """Process-local LRU in front of a shared Django cache."""
+
+    def __init__(self, local_max_size=10000, local_ttl=5, ttl=300,
+                 negative_ttl=30, cache_alias='default', key_prefix='user:'):
+        self.local_max_size = local_max_size
+        self.local_ttl = local_ttl
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.cache_alias = cache_alias
+        self.key_prefix = key_prefix
+        self._entries = OrderedDict()
+        self._generation = (None, 0.0)
+        self._lock = threading.Lock()
+        self.local_hits = 0
+        self.shared_hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+
+    @property
+    def shared(self):
+        return caches[self.cache_alias]
+
+    def get_by_pk(self, pk, load):
+        """Return the user with pk, calling load(pk) on a miss."""
+        key = f'pk:{pk}'
+        user = self._get(key)
+        if user is None:
+            user = load(pk)
+            self._set(key, user, self.ttl)
+        return _copy_user(user)
+
+    def get_by_email(self, email, load):
+        """Return the user with email (or None), calling load on a miss."""
+        key = f'email:{email}'
+        pk = self._get(key)
+        if pk == MISSING:
+            return None
+        if pk is not None:
+            user = self._get(f'pk:{pk}')
+            # The address may have moved to another user since.
+            if user is not None and user.email == email:
+                return _copy_user(user)
+            self._delete(key)
+
+        user = load(email)
+        if user is None:
+            self._set(key, MISSING, self.negative_ttl)
+            return None
+        self._set(key, user.pk, self.ttl)
+        self._set(f'pk:{user.pk}', user, self.ttl)
+        return _copy_user(user)
+
+    def invalidate(self, pks=(), emails=()):
+        """Drop users by pk and email lookups, now and again on commit."""
+        keys = [f'pk:{pk}' for pk in pks]
+        keys += [f'email:{email}' for email in emails if email]
+        if not keys:
+            return
+        self._delete(*keys)
+        # A reader may refill the cache from the old row before the
+        # transaction commits; drop the keys again once it has.
+        transaction.on_commit(lambda: self._delete(*keys))
+
+    def invalidate_all(self):
+        """Drop every cached user, now and again on commit."""
+        self._bump_generation()
+        transaction.on_commit(self._bump_generation)
+
+    def clear(self):
+        """Drop all local entries and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self._generation = (None, 0.0)
+            self.local_hits = 0
+            self.shared_hits = 0
+            self.negative_hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """Return hit/miss counters for monitoring."""
+        with self._lock:
+            hits = self.local_hits + self.shared_hits + self.negative_hits
+            lookups = hits + self.misses
+            return {
+                'local_hits': self.local_hits,
+                'shared_hits': self.shared_hits,
+                'negative_hits': self.negative_hits,
+                'misses': self.misses,
+                'hit_ratio': hits / lookups if lookups else 0.0,
+                'local_size': len(self._entries),
+            }
+
+    def _current_generation(self):
+        # Read from the shared cache at most every LOCAL_TTL seconds; local
+        # entries from an older generation are dropped.
+        with self._lock:
+            generation, expires = self._generation
+            if expires > time.monotonic():
+                return generation
+        key = self.key_prefix + GENERATION_KEY
+        generation = self.shared.get(key)
+        if generation is None:
+            # Start above any generation an evicted key could have reached.
+            self.shared.add(key, time.time_ns() // 1000, timeout=None)
+            generation = self.shared.get(key)
+        self._set_generation(generation)
+        return generation
+
+    def _bump_generation(self):
+        key = self.key_prefix + GENERATION_KEY
+        try:
+            generation = self.shared.incr(key)
+        except ValueError:
+            self.shared.add(key, time.time_ns() // 1000, timeout=None)
+            generation = self.shared.incr(key)
+        self._set_generation(generation)
+
+    def _set_generation(self, generation):
+        with self._lock:
+            if generation != self._generation[0]:
+                self._entries.clear()
+            self._generation = (generation, time.monotonic() + self.local_ttl)
+
+    def _shared_key(self, key, generation):
+        return f'{self.key_prefix}{generation}:{key}'
+
+    def _get(self, key):
+        generation = self._current_generation()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires = entry
+                if expires > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self._count_hit(value, local=True)
+                    return value
+                del self._entries[key]
+
+        value = self.shared.get(self._shared_key(key, generation))
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self._count_hit(value, local=False)
+            self._set_local(key, value)
+        return value
+
+    def _set(self, key, value, timeout):
+        if value is not MISSING and not isinstance(value, (int, str)):
+            value = _copy_user(value)
+        generation = self._current_generation()
+        self.shared.set(
+            self._shared_key(key, generation), value, timeout=timeout)
+        with self._lock:
+            self._set_local(key, value)
+
+    def _set_local(self, key, value):
+        self._entries[key] = (value, time.monotonic() + self.local_ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.local_max_size:
+            self._entries.popitem(last=False)
+
+    def _delete(self, *keys):
+        generation = self._current_generation()
+        self.shared.delete_many(
+            [self._shared_key(key, generation) for key in keys])
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def _count_hit(self, value, local):
+        if value == MISSING:
+            self.negative_hits += 1
+        elif local:
+            self.local_hits += 1
+        else:
+            self.shared_hits += 1
+
+
+def _copy_user(user):
+    # Cached instances are shared between requests; never hand them out.
+    return copy.copy(user)
+
+
+_user_cache = None
+_user_cache_lock = threading.Lock()
+
+
+def get_user_cache():
+    """Return the process-wide user cache built from settings."""
+    global _user_cache
+    if _user_cache is None:
+        with _user_cache_lock:
+            if _user_cache is None:
+                config = {
+                    **DEFAULT_USER_CACHE,
+                    **getattr(settings, 'USER_CACHE', {}),
+                }
+                _user_cache = UserCache(
+                    local_max_size=config['LOCAL_MAX_SIZE'],
+                    local_ttl=config['LOCAL_TTL'],
+                    ttl=config['TTL'],
+                    negative_ttl=config['NEGATIVE_TTL'],
+                    cache_alias=config['CACHE_ALIAS'],
+                    key_prefix=config['KEY_PREFIX'],
+                )
+    return _user_cache
+
+
+def reset_user_cache():
+    """Forget the process-wide user cache (used when settings change)."""
+    global _user_cache
+    with _user_cache_lock:
+        _user_cache = None
+
+
+@receiver(setting_changed)
+def reload_user_cache(setting, **kwargs):
+    """Rebuild the user cache when its settings are overridden."""
+    if setting == 'USER_CACHE':
+        reset_user_cache()
@@ -0,0 +1,46 @@
+"""
+Views for the core app.
+"""
+from django.utils.translation import gettext_lazy as _
+
+from rest_framework import exceptions, permissions, status, views
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import extend_schema
+
+from core.admission import get_registry
+from core.hashing import HashingPoolBusy
+
+
+class ServiceBusy(exceptions.APIException):
+    """Raised when a shared resource of the server has no free capacity."""
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = _('Server is busy, please retry shortly.')
+    default_code = 'service_busy'
+
+    def __init__(self, wait=1, detail=None, code=None):
+        super().__init__(detail, code)
+        # DRF's exception handler turns ``wait`` into a Retry-After header.
+        self.wait = wait
+
+
+def exception_handler(exc, context):
+    """DRF's exception handler, with HashingPoolBusy answered by a 503."""
+    if isinstance(exc, HashingPoolBusy):
+        exc = ServiceBusy(wait=exc.wait)
+    return views.exception_handler(exc, context)
+
+
+class AdmissionStatsView(APIView):
+    """Current admission limits and rejection counts, per route."""
+    permission_classes = [permissions.IsAdminUser]
+
+    @extend_schema(responses=OpenApiTypes.OBJECT)
+    def get(self, request):
+        registry = get_registry()
+        return Response({
+            'enabled': registry.enabled,
+            'routes': registry.stats(),
+        })
@@ -0,0 +1,202 @@
+"""
+Async views for the user API, for running under ASGI.
+
+These mirror CreateUserView, CreateTokenView and ManageUserView, but use
+the async ORM and hash passwords off the event loop, so a single ASGI worker
+can keep many requests in flight.
+"""
+import json
+
+from django.contrib.auth import get_user_model
+from django.http import HttpResponse, JsonResponse
+from django.utils.translation import gettext as _
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_http_methods
+
+from rest_framework import exceptions, status
+from rest_framework.authtoken.models import Token
+
+from core import hashing
+from user.authentication import AsyncTokenAuthentication
+from user.serializers import (
+    AuthCredentialsSerializer,
+    UserFieldsSerializer,
+    user_read_serializer,
+)
+from user.views import etag_matches, user_etag
+
+
+USER = get_user_model()
+
+
+def _error(detail, status_code):
+    return JsonResponse({'detail': detail}, status=status_code)
+
+
+def _parse_json(request):
+    try:
+        data = json.loads(request.body or b'{}')
+    except ValueError:
+        raise exceptions.ParseError()
+    if not isinstance(data, dict):
+        raise exceptions.ParseError()
+    return data
+
+
+async def _email_taken(email, exclude_pk=None):
+    queryset = USER.objects.filter(email=email)
+    if exclude_pk is not None:
+        queryset = queryset.exclude(pk=exclude_pk)
+    return await queryset.aexists()
+
+
+def _duplicate_email_errors():
+    email_field = USER._meta.get_field('email')
+    return {'email': [email_field.error_messages['unique'] % {
+        'model_name': USER._meta.verbose_name,
+        'field_label': email_field.verbose_name,
+    }]}
+
+
+@csrf_exempt
+@require_http_methods(['POST'])
+async def create_user(request):
+    """Async version of CreateUserView."""
+    try:
+        data = _parse_json(request)
+    except exceptions.ParseError as exc:
+        return _error(exc.detail, exc.status_code)
+
+    serializer = UserFieldsSerializer(data=data)
+    if not serializer.is_valid():
+        return JsonResponse(serializer.errors, status=400)
+    validated_data = dict(serializer.validated_data)
+    validated_data['email'] = USER.objects.normalize_email(
+        validated_data['email'])
+    if await _email_taken(validated_data['email']):
+        return JsonResponse(_duplicate_email_errors(), status=400)
+
+    password = validated_data.pop('password')
+    user = USER(**validated_data)
+    try:
+        user.password = await hashing.amake_password(password)
+    except hashing.HashingPoolBusy as exc:
+        return _busy(exc)
+    await user.asave()
+
+    return JsonResponse(
+        user_read_serializer.to_representation(user), status=201)
+
+
+@csrf_exempt
+@require_http_methods(['POST'])
+async def create_token(request):
+    """Async version of CreateTokenView."""
+    try:
+        data = _parse_json(request)
+    except exceptions.ParseError as exc:
+        return _error(exc.detail, exc.status_code)
+
+    serializer = AuthCredentialsSerializer(data=data)
+    if not serializer.is_valid():
+        return JsonResponse(serializer.errors, status=400)
+    email = serializer.validated_data['email']
+    password = serializer.validated_data['password']
+
+    user = await USER.objects.filter(email=email).afirst()
+    upgrade = []
+    try:
+        if user is None:
+            # Hash anyway so missing and existing emails take as long.
+            await hashing.amake_password(password)
+            valid = False
+        else:
+            valid = await hashing.acheck_password(
+                password, user.password, setter=upgrade.append)
+    except hashing.HashingPoolBusy as exc:
+        return _busy(exc)
+
+    if not valid or not user.is_active:
+        msg = _('Unable to authenticate with provided credentials.')
+        return JsonResponse({'non_field_errors': [msg]}, status=400)
+    if upgrade:
+        user.password = await hashing.amake_password(password)
+        await user.asave(update_fields=['password'])
+
+    token, _created = await Token.objects.aget_or_create(user=user)
+    return JsonResponse({'token': token.key})
+
+
+@csrf_exempt
+@require_http_methods(['GET', 'PUT', 'PATCH'])
+async def manage_user(request):
+    """Async version of ManageUserView."""
+    auth = AsyncTokenAuthentication()
+    try:
+        credentials = await auth.authenticate(request)
+    except exceptions.AuthenticationFailed as exc:
+        return _unauthorized(auth, request, exc.detail)
+    if credentials is None:
+        return _unauthorized(auth, request, exceptions.NotAuthenticated(
+        ).detail)
+    user = credentials[0]
+
+    if request.method == 'GET':
+        etag = user_etag(user)
+        if_none_match = request.headers.get('If-None-Match')
+        if if_none_match and etag_matches(if_none_match, etag, weak=True):
+            response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = JsonResponse(
+                user_read_serializer.to_representation(user))
+        response['ETag'] = etag
+        return response
+
+    try:
+        data = _parse_json(request)
+    except exceptions.ParseError as exc:
+        return _error(exc.detail, exc.status_code)
+
+    # There are no async transactions to lock the row in, so If-Match is
+    # checked against a fresh read just before saving.
+    user = await USER.objects.aget(pk=user.pk)
+    if_match = request.headers.get('If-Match')
+    if if_match and not etag_matches(if_match, user_etag(user)):
+        return _error(
+            _('The user was modified since it was last fetched.'),
+            status.HTTP_412_PRECONDITION_FAILED)
+
+    serializer = UserFieldsSerializer(
+        user, data=data, partial=request.method == 'PATCH')
+    if not serializer.is_valid():
+        return JsonResponse(serializer.errors, status=400)
+    validated_data = dict(serializer.validated_data)
+    if 'email' in validated_data and await _email_taken(
+            validated_data['email'], exclude_pk=user.pk):
+        return JsonResponse(_duplicate_email_errors(), status=400)
+
+    password = validated_data.pop('password', None)
+    try:
+        if password:
+            user.password = await hashing.amake_password(password)
+    except hashing.HashingPoolBusy as exc:
+        return _busy(exc)
+    for attr, value in validated_data.items():
+        setattr(user, attr, value)
+    await user.asave()
+
+    response = JsonResponse(user_read_serializer.to_representation(user))
+    response['ETag'] = user_etag(user)
+    return response
+
+
+def _unauthorized(auth, request, detail):
+    response = _error(detail, status.HTTP_401_UNAUTHORIZED)
+    response['WWW-Authenticate'] = auth.authenticate_header(request)
+    return response
+
+
+def _busy(exc):
+    response = _error(str(exc), status.HTTP_503_SERVICE_UNAVAILABLE)
+    response['Retry-After'] = str(exc.wait)
+    return response
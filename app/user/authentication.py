@@ -0,0 +1,299 @@
+"""
+Authentication classes for the user API.
+"""
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.translation import gettext as _
+
+from rest_framework import authentication, exceptions
+
+
+DEFAULT_TOKEN_CACHE = {
+    'MAX_SIZE': 10000,
+    'TTL': 60,
+    'CACHE_ALIAS': None,
+    'KEY_PREFIX': 'auth-token:',
+}
+
+
+class TokenCache:
+    """
+    Cache of token key -> token (with its user already joined).
+
+    By default entries live in an in-process LRU with a TTL. When
+    ``cache_alias`` is set, entries are stored in that Django cache instead
+    so that invalidation reaches every worker process.
+    """
+
+    def __init__(self, max_size=10000, ttl=60, cache_alias=None,
+                 key_prefix='auth-token:'):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.cache_alias = cache_alias
+        self.key_prefix = key_prefix
+        self._entries = OrderedDict()
+        self._keys_by_user = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def shared(self):
+        return self.cache_alias is not None
+
+    def get(self, key):
+        """Return the cached token for key, or None."""
+        if self.shared:
+            token = caches[self.cache_alias].get(self.key_prefix + key)
+        else:
+            token = self._get_local(key)
+
+        with self._lock:
+            if token is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return token
+
+    async def aget(self, key):
+        """Async version of get()."""
+        if not self.shared:
+            return self.get(key)
+        token = await caches[self.cache_alias].aget(self.key_prefix + key)
+        with self._lock:
+            if token is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return token
+
+    async def aset(self, token):
+        """Async version of set()."""
+        if not self.shared:
+            return self.set(token)
+        await caches[self.cache_alias].aset(
+            self.key_prefix + token.key, token, timeout=self.ttl)
+
+    def set(self, token):
+        """Cache a token fetched with ``select_related('user')``."""
+        if self.shared:
+            caches[self.cache_alias].set(
+                self.key_prefix + token.key, token, timeout=self.ttl)
+            return
+
+        token = _copy_token(token)
+        with self._lock:
+            self._entries[token.key] = (token, time.monotonic() + self.ttl)
+            self._entries.move_to_end(token.key)
+            self._keys_by_user.setdefault(token.user_id, set()).add(token.key)
+            while len(self._entries) > self.max_size:
+                key, (evicted, _expires) = self._entries.popitem(last=False)
+                self._forget_user_key(evicted.user_id, key)
+
+    def invalidate(self, key):
+        """Drop a single token key."""
+        if self.shared:
+            caches[self.cache_alias].delete(self.key_prefix + key)
+            return
+
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._forget_user_key(entry[0].user_id, key)
+
+    def invalidate_user(self, user_pk):
+        """Drop every cached token belonging to a user."""
+        if self.shared:
+            from rest_framework.authtoken.models import Token
+
+            keys = Token.objects.filter(
+                user_id=user_pk).values_list('key', flat=True)
+            caches[self.cache_alias].delete_many(
+                [self.key_prefix + key for key in keys])
+            return
+
+        with self._lock:
+            for key in self._keys_by_user.pop(user_pk, ()):
+                self._entries.pop(key, None)
+
+    def keys_for_users(self, users):
+        """Return the token keys of a user queryset, before a bulk write.
+
+        Only the shared cache needs them; the local cache returns None and
+        ``invalidate_keys`` then drops every local entry without a query.
+        """
+        if not self.shared:
+            return None
+        from rest_framework.authtoken.models import Token
+
+        return list(Token.objects.filter(
+            user__in=users).values_list('key', flat=True))
+
+    def invalidate_keys(self, keys):
+        """Drop token keys from ``keys_for_users``; None drops all local ones."""
+        if keys is None:
+            with self._lock:
+                self._entries.clear()
+                self._keys_by_user.clear()
+            return
+        if self.shared:
+            caches[self.cache_alias].delete_many(
+                [self.key_prefix + key for key in keys])
+            return
+        for key in keys:
+            self.invalidate(key)
+
+    def clear(self):
+        """Drop all local entries and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_user.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """Return hit/miss counters for monitoring."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+                'size': len(self._entries),
+            }
+
+    def _get_local(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            token, expires = entry
+            if expires <= time.monotonic():
+                del self._entries[key]
+                self._forget_user_key(token.user_id, key)
+                return None
+            self._entries.move_to_end(key)
+
+        return _copy_token(token)
+
+    def _forget_user_key(self, user_pk, key):
+        keys = self._keys_by_user.get(user_pk)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_user[user_pk]
+
+
+def _copy_token(token):
+    # Local entries are shared between requests, so callers never get (or
+    # hand over) the cached instances themselves.
+    token = copy.copy(token)
+    token.user = copy.copy(token.user)
+    return token
+
+
+_token_cache = None
+_token_cache_lock = threading.Lock()
+
+
+def get_token_cache():
+    """Return the process-wide token cache built from settings."""
+    global _token_cache
+    if _token_cache is None:
+        with _token_cache_lock:
+            if _token_cache is None:
+                config = {
+                    **DEFAULT_TOKEN_CACHE,
+                    **getattr(settings, 'TOKEN_AUTH_CACHE', {}),
+                }
+                _token_cache = TokenCache(
+                    max_size=config['MAX_SIZE'],
+                    ttl=config['TTL'],
+                    cache_alias=config['CACHE_ALIAS'],
+                    key_prefix=config['KEY_PREFIX'],
+                )
+    return _token_cache
+
+
+def reset_token_cache():
+    """Forget the process-wide token cache (used when settings change)."""
+    global _token_cache
+    with _token_cache_lock:
+        _token_cache = None
+
+
+class CachedTokenAuthentication(authentication.TokenAuthentication):
+    """Token authentication that skips the token/user join on cache hits."""
+
+    def authenticate_credentials(self, key):
+        token_cache = get_token_cache()
+        token = token_cache.get(key)
+        if token is None:
+            model = self.get_model()
+            try:
+                token = model.objects.select_related('user').get(key=key)
+            except model.DoesNotExist:
+                raise exceptions.AuthenticationFailed(_('Invalid token.'))
+            token_cache.set(token)
+
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed(
+                _('User inactive or deleted.'))
+
+        return (token.user, token)
+
+
+class AsyncTokenAuthentication:
+    """Cached token authentication for async views, using the async ORM."""
+    keyword = 'Token'
+
+    async def authenticate(self, request):
+        """Return (user, token) for the request, or None if no token."""
+        auth = authentication.get_authorization_header(request).split()
+
+        if not auth or auth[0].lower() != self.keyword.lower().encode():
+            return None
+
+        if len(auth) == 1:
+            msg = _('Invalid token header. No credentials provided.')
+            raise exceptions.AuthenticationFailed(msg)
+        elif len(auth) > 2:
+            msg = _('Invalid token header. '
+                    'Token string should not contain spaces.')
+            raise exceptions.AuthenticationFailed(msg)
+
+        try:
+            key = auth[1].decode()
+        except UnicodeError:
+            msg = _('Invalid token header. '
+                    'Token string should not contain invalid characters.')
+            raise exceptions.AuthenticationFailed(msg)
+
+        return await self.authenticate_credentials(key)
+
+    async def authenticate_credentials(self, key):
+        from rest_framework.authtoken.models import Token
+
+        token_cache = get_token_cache()
+        token = await token_cache.aget(key)
+        if token is None:
+            try:
+                token = await Token.objects.select_related('user').aget(
+                    key=key)
+            except Token.DoesNotExist:
+                raise exceptions.AuthenticationFailed(_('Invalid token.'))
+            await token_cache.aset(token)
+
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed(
+                _('User inactive or deleted.'))
+
+        return (token.user, token)
+
+    def authenticate_header(self, request):
+        return self.keyword
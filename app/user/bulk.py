@@ -0,0 +1,181 @@
+"""
+Bulk user import.
+"""
+import codecs
+import csv
+import json
+import time
+from functools import partial
+from itertools import islice
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils.translation import gettext as _
+
+from core import hashing
+from user.serializers import USER, UserFieldsSerializer
+
+
+DEFAULT_USER_IMPORT = {
+    'CHUNK_SIZE': 1000,
+}
+
+
+def iter_ndjson(stream):
+    """Yield (row number, data) for each line of a byte stream of NDJSON."""
+    row_number = 0
+    for line in stream:
+        if not line.strip():
+            continue
+        row_number += 1
+        try:
+            data = json.loads(line)
+        except ValueError:
+            data = None
+        yield row_number, data if isinstance(data, dict) else None
+
+
+def iter_csv(stream):
+    """Yield (row number, data) for each row of a byte stream of CSV."""
+    reader = csv.DictReader(codecs.iterdecode(stream, 'utf-8-sig'))
+    for row_number, row in enumerate(reader, 1):
+        yield row_number, row
+
+
+def _chunks(rows, size):
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class ImportResult:
+    """Outcome of an import: created count, per-row errors and throughput."""
+
+    def __init__(self):
+        self.created = 0
+        self.errors = []
+        self.elapsed = 0.0
+
+    def add_error(self, row_number, errors):
+        self.errors.append({'row': row_number, 'errors': errors})
+
+    @property
+    def users_per_sec(self):
+        return self.created / self.elapsed if self.elapsed else 0.0
+
+    def as_dict(self):
+        return {
+            'created': self.created,
+            'failed': len(self.errors),
+            'errors': self.errors,
+            'elapsed': round(self.elapsed, 3),
+            'users_per_sec': round(self.users_per_sec, 1),
+        }
+
+
+class UserImporter:
+    """
+    Create users from (row number, data) pairs in chunks.
+
+    Rows are validated with the UserSerializer rules, passwords are hashed
+    in the bulk processes of the shared hashing pool when it is enabled,
+    inline otherwise (or across ``workers`` processes of a pool of the
+    import's own, or inline with ``workers=1``) and each chunk is written
+    with one ``bulk_create``. Invalid rows and duplicate emails are reported
+    per row instead of aborting the import.
+    """
+
+    def __init__(self, chunk_size=None, workers=None):
+        config = {
+            **DEFAULT_USER_IMPORT,
+            **getattr(settings, 'USER_IMPORT', {}),
+        }
+        self.chunk_size = chunk_size or config['CHUNK_SIZE']
+        self.workers = workers
+        email_field = USER._meta.get_field('email')
+        self.duplicate_message = email_field.error_messages['unique'] % {
+            'model_name': USER._meta.verbose_name,
+            'field_label': email_field.verbose_name,
+        }
+
+    def run(self, rows):
+        """Import every row and return an ImportResult."""
+        result = ImportResult()
+        start = time.perf_counter()
+        executor = None
+        if self.workers is None and hashing.pool_enabled():
+            hash_passwords = hashing.get_pool().hash_passwords
+        elif self.workers is None or self.workers == 1:
+            hash_passwords = hashing.hash_passwords
+        else:
+            executor = hashing.hashing_executor(self.workers)
+            hash_passwords = partial(hashing.hash_passwords, executor=executor)
+        try:
+            for chunk in _chunks(rows, self.chunk_size):
+                self._import_chunk(chunk, result, hash_passwords)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+        result.elapsed = time.perf_counter() - start
+        return result
+
+    def _import_chunk(self, chunk, result, hash_passwords):
+        valid = []
+        seen = set()
+        for row_number, data in chunk:
+            if data is None:
+                result.add_error(row_number, {
+                    'non_field_errors': [_('Malformed row.')],
+                })
+                continue
+            serializer = UserFieldsSerializer(data=data)
+            if not serializer.is_valid():
+                result.add_error(row_number, serializer.errors)
+                continue
+            validated_data = dict(serializer.validated_data)
+            validated_data['email'] = USER.objects.normalize_email(
+                validated_data['email'])
+            if validated_data['email'] in seen:
+                self._add_duplicate(result, row_number)
+                continue
+            seen.add(validated_data['email'])
+            valid.append((row_number, validated_data))
+
+        existing = set(USER.objects.filter(
+            email__in=seen).values_list('email', flat=True))
+        rows = []
+        for row_number, validated_data in valid:
+            if validated_data['email'] in existing:
+                self._add_duplicate(result, row_number)
+            else:
+                rows.append((row_number, validated_data))
+        if not rows:
+            return
+
+        passwords = hash_passwords(
+            [validated_data.pop('password') for _row, validated_data in rows])
+        users = [
+            USER(password=password, **validated_data)
+            for (_row, validated_data), password in zip(rows, passwords)
+        ]
+        try:
+            with transaction.atomic():
+                USER.objects.bulk_create(users)
+            result.created += len(users)
+        except IntegrityError:
+            # Someone else inserted one of these emails since the check
+            # above; fall back to row-by-row so only that row fails.
+            for (row_number, _data), user in zip(rows, users):
+                user.pk = None
+                try:
+                    with transaction.atomic():
+                        user.save(force_insert=True)
+                    result.created += 1
+                except IntegrityError:
+                    self._add_duplicate(result, row_number)
+
+    def _add_duplicate(self, result, row_number):
+        result.add_error(row_number, {'email': [self.duplicate_message]})
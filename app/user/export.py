@@ -0,0 +1,86 @@
+"""
+Streaming user export.
+"""
+import csv
+import json
+
+from django.conf import settings
+
+from user.serializers import USER, UserSerializer
+
+
+DEFAULT_USER_EXPORT = {
+    'CHUNK_SIZE': 2000,
+}
+
+
+def export_fields():
+    """Return the readable field names of UserSerializer."""
+    return [
+        name for name, field in UserSerializer().fields.items()
+        if not field.write_only
+    ]
+
+
+def iter_user_rows(fields, chunk_size=None):
+    """Yield value tuples for every user, reading chunk_size rows at a time."""
+    chunk_size = chunk_size or {
+        **DEFAULT_USER_EXPORT,
+        **getattr(settings, 'USER_EXPORT', {}),
+    }['CHUNK_SIZE']
+    queryset = USER.objects.order_by('pk').values_list(*fields)
+    # iterator() uses a server-side cursor on PostgreSQL and fetchmany()
+    # elsewhere, so only one chunk of rows is held in memory.
+    return queryset.iterator(chunk_size=chunk_size)
+
+
+class _Echo:
+    """File-like object whose write() returns what it was given."""
+
+    def write(self, value):
+        return value
+
+
+def _batched(lines, batch_size):
+    batch = []
+    for line in lines:
+        batch.append(line)
+        if len(batch) >= batch_size:
+            yield ''.join(batch)
+            batch = []
+    if batch:
+        yield ''.join(batch)
+
+
+def render_ndjson(fields, rows, batch_size=500):
+    """Yield NDJSON text for rows, a batch of lines per chunk."""
+    encoder = json.JSONEncoder(ensure_ascii=False)
+    return _batched(
+        (encoder.encode(dict(zip(fields, row))) + '\n' for row in rows),
+        batch_size,
+    )
+
+
+def render_csv(fields, rows, batch_size=500):
+    """Yield CSV text (with a header row) for rows."""
+    writer = csv.writer(_Echo())
+
+    def lines():
+        yield writer.writerow(fields)
+        for row in rows:
+            yield writer.writerow(row)
+
+    return _batched(lines(), batch_size)
+
+
+RENDERERS = {
+    'ndjson': (render_ndjson, 'application/x-ndjson'),
+    'csv': (render_csv, 'text/csv'),
+}
+
+
+def export_users(file_format='ndjson', chunk_size=None):
+    """Return (content chunks, content type) for a full user export."""
+    render, content_type = RENDERERS[file_format]
+    fields = export_fields()
+    return render(fields, iter_user_rows(fields, chunk_size)), content_type
@@ -0,0 +1,85 @@
+"""
+Django command to measure requests/sec per worker at rising concurrency.
+
+Start one server worker at a time and point this command at it, e.g.
+
+    gunicorn --workers 1 app.wsgi:application            (WSGI, sync)
+    gunicorn --workers 1 -k uvicorn.workers.UvicornWorker app.asgi:application
+
+then compare /api/user/me/ (sync view) under WSGI with /api/user/async/me/
+under ASGI.
+"""
+import json
+import threading
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+
+from core.bench import format_summary, http_request
+
+
+class Command(BaseCommand):
+    """Django command to load test one endpoint at several concurrencies."""
+
+    help = 'Report throughput and latency of a GET endpoint per concurrency.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+        parser.add_argument('--path', default='/api/user/me/')
+        parser.add_argument('--concurrency', default='1,8,32,128')
+        parser.add_argument('--duration', type=float, default=10.0)
+        parser.add_argument('--email', default='bench@example.com')
+        parser.add_argument('--password', default='bench-password-123')
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        base = options['base_url'].rstrip('/')
+        credentials = {
+            'email': options['email'],
+            'password': options['password'],
+        }
+        http_request(base + '/api/user/create/', {
+            **credentials, 'name': 'Bench'})
+        status, body = http_request(base + '/api/user/token/', credentials)
+        if status != 200:
+            self.stderr.write(f'Could not obtain a token (HTTP {status}).')
+            return
+        token = json.loads(body)['token']
+        url = base + options['path']
+
+        for concurrency in map(int, options['concurrency'].split(',')):
+            latencies, statuses = self._run(
+                url, token, concurrency, options['duration'])
+            self.stdout.write(
+                f'c={concurrency:<4} '
+                f'{len(latencies) / options["duration"]:8.1f} req/s  '
+                + format_summary('latency', latencies)
+                + '  status ' + ', '.join(
+                    f'{code or "error"}={count}'
+                    for code, count in sorted(statuses.items())))
+
+    def _run(self, url, token, concurrency, duration):
+        stop = threading.Event()
+        lock = threading.Lock()
+        latencies = []
+        statuses = Counter()
+
+        def worker():
+            while not stop.is_set():
+                start = time.perf_counter()
+                status, _body = http_request(url, token=token)
+                elapsed = time.perf_counter() - start
+                with lock:
+                    latencies.append(elapsed)
+                    statuses[status] += 1
+
+        threads = [threading.Thread(target=worker)
+                   for _ in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        time.sleep(duration)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        return latencies, statuses
@@ -0,0 +1,82 @@
+"""
+Django command to measure /api/user/me/ latency during a login burst.
+
+Run it against a live server (gunicorn as in scripts/gunicorn.service, with
+``--threads`` so cheap requests can be served while a hash is in flight) once
+with PASSWORD_HASHING_POOL=0 and once with PASSWORD_HASHING_POOL=1, and
+compare the reported p99 of /me/.
+"""
+import json
+import threading
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+
+from core.bench import format_summary, http_request
+
+
+class Command(BaseCommand):
+    """Django command to benchmark logins against /me/ polling."""
+
+    help = 'Hammer /api/user/token/ and report /api/user/me/ latency.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+        parser.add_argument('--duration', type=float, default=20.0)
+        parser.add_argument('--login-threads', type=int, default=16)
+        parser.add_argument('--probe-threads', type=int, default=2)
+        parser.add_argument('--email', default='bench@example.com')
+        parser.add_argument('--password', default='bench-password-123')
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        base = options['base_url'].rstrip('/') + '/api/user/'
+        credentials = {
+            'email': options['email'],
+            'password': options['password'],
+        }
+        http_request(base + 'create/', {**credentials, 'name': 'Bench'})
+        status, body = http_request(base + 'token/', credentials)
+        if status != 200:
+            self.stderr.write(f'Could not obtain a token (HTTP {status}).')
+            return
+        token = json.loads(body)['token']
+
+        stop = threading.Event()
+        lock = threading.Lock()
+        login_status = Counter()
+        probe_latencies = []
+
+        def login_loop():
+            while not stop.is_set():
+                status, _body = http_request(base + 'token/', credentials)
+                with lock:
+                    login_status[status] += 1
+
+        def probe_loop():
+            while not stop.is_set():
+                start = time.perf_counter()
+                http_request(base + 'me/', token=token)
+                elapsed = time.perf_counter() - start
+                with lock:
+                    probe_latencies.append(elapsed)
+
+        threads = [
+            threading.Thread(target=login_loop)
+            for _ in range(options['login_threads'])
+        ] + [
+            threading.Thread(target=probe_loop)
+            for _ in range(options['probe_threads'])
+        ]
+        for thread in threads:
+            thread.start()
+        time.sleep(options['duration'])
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+        self.stdout.write(format_summary('GET /me/', probe_latencies))
+        self.stdout.write('POST /token/ status counts: ' + ', '.join(
+            f'{status or "error"}={count}'
+            for status, count in sorted(login_status.items())))
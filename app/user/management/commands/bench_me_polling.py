@@ -0,0 +1,56 @@
+"""
+Django command to measure the cost of polling /api/user/me/.
+
+Compares full 200 responses with conditional 304 responses on a throwaway
+test database, reporting bytes and CPU time per poll.
+"""
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.urls import reverse
+
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core.bench import temporary_database
+
+
+class Command(BaseCommand):
+    """Django command to benchmark conditional GETs of /me/."""
+
+    help = 'Compare bytes and CPU per poll of /me/ with and without ETags.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--polls', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        with temporary_database():
+            user = get_user_model().objects.create_user(
+                email='bench@example.com', password='!', name='Bench')
+            token = Token.objects.create(user=user)
+            client = APIClient()
+            client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+            url = reverse('user:me')
+            etag = client.get(url)['ETag']
+
+            for label, headers in (
+                ('unconditional', {}),
+                ('If-None-Match', {'HTTP_IF_NONE_MATCH': etag}),
+            ):
+                total_bytes, cpu = self._poll(
+                    client, url, headers, options['polls'])
+                self.stdout.write(
+                    f'{label:>14}: {total_bytes / options["polls"]:.0f} '
+                    f'bytes/poll, {cpu / options["polls"] * 1e6:.0f}us '
+                    f'CPU/poll')
+
+    def _poll(self, client, url, headers, polls):
+        total_bytes = 0
+        start = time.process_time()
+        for _ in range(polls):
+            res = client.get(url, **headers)
+            total_bytes += len(res.content) + sum(
+                len(key) + len(value) + 4 for key, value in res.items())
+        return total_bytes, time.process_time() - start
@@ -0,0 +1,101 @@
+"""
+Django command to compare keyset and offset pagination at deep pages.
+
+Runs against a throwaway test database seeded with synthetic users.
+"""
+import time
+from urllib.parse import parse_qs, urlsplit
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from rest_framework.pagination import Cursor, LimitOffsetPagination
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from core.bench import percentile, temporary_database
+from user.pagination import UserCursorPagination
+from user.serializers import UserListSerializer
+from user.views import UserListView
+
+
+class Command(BaseCommand):
+    """Django command to benchmark user list pagination."""
+
+    help = 'Compare per-page latency of keyset and offset pagination.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=200000)
+        parser.add_argument('--page-size', type=int, default=50)
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        with temporary_database():
+            self._seed(options['rows'])
+            self._run(options['rows'], options['page_size'],
+                      options['repeat'])
+
+    def _seed(self, rows):
+        self.stdout.write(f'Seeding {rows} users...')
+        user_model = get_user_model()
+        batch = 10000
+        for start in range(0, rows, batch):
+            user_model.objects.bulk_create([
+                user_model(email=f'user{i:09d}@example.com',
+                           name=f'User {i}', password='!')
+                for i in range(start, min(start + batch, rows))
+            ])
+
+    def _run(self, rows, page_size, repeat):
+        factory = APIRequestFactory()
+        view = UserListView()
+        queryset = view.get_queryset()
+        ids = list(get_user_model().objects.order_by('id').values_list(
+            'id', flat=True))
+
+        self.stdout.write(
+            f'{"depth":>10} {"offset p50":>12} {"keyset p50":>12}')
+        for fraction in (0, 0.1, 0.5, 0.9, 0.99):
+            depth = int(rows * fraction)
+
+            def offset_page():
+                request = Request(factory.get('/', {
+                    'limit': page_size, 'offset': depth}))
+                paginator = LimitOffsetPagination()
+                page = paginator.paginate_queryset(queryset, request, view)
+                return UserListSerializer(page, many=True).data
+
+            cursor_request = self._cursor_request(
+                factory, view, queryset, ids[depth - 1] if depth else None)
+
+            def keyset_page():
+                paginator = UserCursorPagination()
+                paginator.page_size = page_size
+                page = paginator.paginate_queryset(
+                    queryset, cursor_request, view)
+                return UserListSerializer(page, many=True).data
+
+            offset_p50 = self._time(offset_page, repeat)
+            keyset_p50 = self._time(keyset_page, repeat)
+            self.stdout.write(
+                f'{depth:>10} {offset_p50 * 1000:>10.2f}ms '
+                f'{keyset_p50 * 1000:>10.2f}ms')
+
+    def _cursor_request(self, factory, view, queryset, position):
+        params = {}
+        if position is not None:
+            paginator = UserCursorPagination()
+            paginator.base_url = 'http://testserver/'
+            url = paginator.encode_cursor(
+                Cursor(offset=0, reverse=False, position=str(position)))
+            params['cursor'] = parse_qs(urlsplit(url).query)['cursor'][0]
+        return Request(factory.get('/', params))
+
+    def _time(self, page_fn, repeat):
+        samples = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            page_fn()
+            samples.append(time.perf_counter() - start)
+        return percentile(samples, 50)
@@ -0,0 +1,59 @@
+"""
+Django command to compare UserSerializer with the compiled read path.
+"""
+import timeit
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from rest_framework.renderers import JSONRenderer
+
+from user.serializers import (
+    UserListSerializer,
+    UserSerializer,
+    user_list_read_serializer,
+    user_read_serializer,
+)
+
+
+class Command(BaseCommand):
+    """Django command to microbenchmark user serialization."""
+
+    help = 'Time per-object and per-1000-objects user serialization.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--number', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        user_model = get_user_model()
+        user = user_model(id=1, email='bench@example.com', name='Bench User')
+        users = [
+            user_model(id=i, email=f'user{i}@example.com', name=f'User {i}')
+            for i in range(1000)
+        ]
+        renderer = JSONRenderer()
+        number = options['number']
+        cases = [
+            ('1 object    UserSerializer',
+             lambda: UserSerializer(user).data, number),
+            ('1 object    compiled',
+             lambda: user_read_serializer.to_representation(user), number),
+            ('1 object    UserSerializer+JSON',
+             lambda: renderer.render(UserSerializer(user).data), number),
+            ('1 object    compiled+JSON',
+             lambda: renderer.render(
+                 user_read_serializer.to_representation(user)), number),
+            ('1000 objects UserListSerializer',
+             lambda: UserListSerializer(users, many=True).data,
+             max(1, number // 1000)),
+            ('1000 objects compiled',
+             lambda: user_list_read_serializer.many(users),
+             max(1, number // 1000)),
+        ]
+        for label, fn, loops in cases:
+            best = min(timeit.repeat(
+                fn, repeat=options['repeat'], number=loops)) / loops
+            unit, scale = ('ms', 1e3) if best > 1e-3 else ('us', 1e6)
+            self.stdout.write(f'{label:<34} {best * scale:10.2f}{unit}')
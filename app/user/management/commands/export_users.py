@@ -0,0 +1,33 @@
+"""
+Django command to export every user as NDJSON or CSV.
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from user.export import RENDERERS, export_users
+
+
+class Command(BaseCommand):
+    """Django command to stream the user table to a file."""
+
+    help = 'Export users as NDJSON or CSV to a file ("-" for stdout).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=RENDERERS, default='ndjson')
+        parser.add_argument('--chunk-size', type=int)
+        parser.add_argument('--output', default='-')
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        content, _content_type = export_users(
+            options['format'], options['chunk_size'])
+        if options['output'] == '-':
+            for chunk in content:
+                self.stdout.write(chunk, ending='')
+            return
+
+        try:
+            with open(options['output'], 'w', newline='') as stream:
+                for chunk in content:
+                    stream.write(chunk)
+        except OSError as exc:
+            raise CommandError(exc)
@@ -0,0 +1,53 @@
+"""
+Django command to import users from an NDJSON or CSV file.
+"""
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from user.bulk import UserImporter, iter_csv, iter_ndjson
+
+
+READERS = {
+    'ndjson': iter_ndjson,
+    'csv': iter_csv,
+}
+
+
+class Command(BaseCommand):
+    """Django command to bulk-create users."""
+
+    help = 'Import users from an NDJSON or CSV file ("-" for stdin).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=READERS)
+        parser.add_argument('--chunk-size', type=int)
+        parser.add_argument('--workers', type=int)
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        path = options['path']
+        fmt = options['format']
+        if fmt is None:
+            fmt = 'csv' if path.endswith('.csv') else 'ndjson'
+
+        importer = UserImporter(
+            chunk_size=options['chunk_size'],
+            workers=options['workers'],
+        )
+        if path == '-':
+            result = importer.run(READERS[fmt](sys.stdin.buffer))
+        else:
+            try:
+                with open(path, 'rb') as stream:
+                    result = importer.run(READERS[fmt](stream))
+            except OSError as exc:
+                raise CommandError(exc)
+
+        for error in result.errors:
+            self.stderr.write(f"Row {error['row']}: {error['errors']}")
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {result.created} users, {len(result.errors)} failed, '
+            f'in {result.elapsed:.2f}s ({result.users_per_sec:.1f} users/sec).'
+        ))
@@ -0,0 +1,18 @@
+"""
+Pagination classes for the user API.
+"""
+from rest_framework import pagination
+
+
+class UserCursorPagination(pagination.CursorPagination):
+    """
+    Keyset pagination over a unique column (``id`` or ``email``).
+
+    Each page is a ``WHERE col > <cursor> ORDER BY col LIMIT n`` index range
+    scan, so deep pages cost the same as the first one, and no COUNT(*) is
+    run.
+    """
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+    ordering = 'id'
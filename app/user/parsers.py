@@ -0,0 +1,22 @@
+"""
+Parsers for streamed user uploads.
+"""
+from rest_framework.parsers import BaseParser
+
+from user.bulk import iter_csv, iter_ndjson
+
+
+class NDJSONParser(BaseParser):
+    """Parse newline-delimited JSON lazily into (row number, data) pairs."""
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        return iter_ndjson(stream if stream is not None else [])
+
+
+class CSVParser(BaseParser):
+    """Parse CSV with a header row lazily into (row number, data) pairs."""
+    media_type = 'text/csv'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        return iter_csv(stream if stream is not None else [])
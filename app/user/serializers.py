@@ -1,3 +1,5 @@
+import operator
+
 from django.contrib.auth import get_user_model, authenticate
 
 from django.utils.translation import gettext as _ #common syntax for doing translation with django. 
@@ -5,6 +7,7 @@ from django.utils.translation import gettext as _ #common syntax for doing trans
 
 
 from rest_framework import serializers
+from rest_framework.relations import PKOnlyObject
 USER = get_user_model()
 
 
@@ -25,21 +28,45 @@ class UserSerializer(serializers.ModelSerializer):
         return USER.objects.create_user(**validated_data)
     
     def update(self, instance, validated_data):
+        "update user, saving (and bumping its version) once"
         password = validated_data.pop('password', None)
-        user = super().update(instance, validated_data)
         if password:
-            user.set_password(password)
-            user.save()
-        return user
+            instance.set_password(password)
+        return super().update(instance, validated_data)
 
-class AuthTokenSerializer(serializers.Serializer):
-    """Serializer for the user auth token."""
+
+class UserFieldsSerializer(UserSerializer):
+    """UserSerializer rules without the email uniqueness query.
+
+    Callers check uniqueness themselves (per chunk, or with the async ORM).
+    """
+    class Meta(UserSerializer.Meta):
+        extra_kwargs = {
+            **UserSerializer.Meta.extra_kwargs,
+            'email': {'validators': []},
+        }
+
+
+class UserListSerializer(serializers.ModelSerializer):
+    """Read-only serializer for the staff user listing."""
+    class Meta:
+        model = USER
+        fields = ['id', 'email', 'name']
+        read_only_fields = fields
+
+
+class AuthCredentialsSerializer(serializers.Serializer):
+    """Serializer for login credentials, without authenticating them."""
     email = serializers.EmailField()
     password = serializers.CharField(
         style={'input_type': 'password'},
         trim_whitespace=False,
     )
 
+
+class AuthTokenSerializer(AuthCredentialsSerializer):
+    """Serializer for the user auth token."""
+
     def validate(self, attrs):
         """Validate and authenticate the user."""
         email = attrs.get('email')
@@ -55,3 +82,75 @@ class AuthTokenSerializer(serializers.Serializer):
 
         attrs['user'] = user
         return attrs
+
+
+class CompiledReadSerializer:
+    """
+    Read-only fast path for a ModelSerializer.
+
+    The serializer's readable fields are introspected once, into
+    (name, getter, converter) triples. Serializing an instance is then a
+    loop of attribute reads, with the same output as
+    ``serializer_class(instance).data``.
+    """
+
+    def __init__(self, serializer_class):
+        self.serializer_class = serializer_class
+        model = serializer_class.Meta.model
+        concrete = {field.attname for field in model._meta.concrete_fields}
+        self.fields = []
+        for field in serializer_class().fields.values():
+            if field.write_only:
+                continue
+            if len(field.source_attrs) == 1 and field.source in concrete:
+                getter = operator.attrgetter(field.source)
+            else:
+                getter = _field_getter(field)
+            self.fields.append(
+                (field.field_name, getter, _field_converter(field)))
+        self.field_names = tuple(name for name, _g, _c in self.fields)
+
+    def to_representation(self, instance):
+        """Return a plain dict for instance."""
+        ret = {}
+        for name, getter, converter in self.fields:
+            value = getter(instance)
+            ret[name] = None if value is None else converter(value)
+        return ret
+
+    def to_tuple(self, instance):
+        """Return the field values for instance, in field_names order."""
+        return tuple(
+            None if (value := getter(instance)) is None else converter(value)
+            for _name, getter, converter in self.fields
+        )
+
+    def many(self, instances):
+        """Return a list of plain dicts for instances."""
+        to_representation = self.to_representation
+        return [to_representation(instance) for instance in instances]
+
+
+def _field_getter(field):
+    def getter(instance):
+        try:
+            attribute = field.get_attribute(instance)
+        except serializers.SkipField:
+            return None
+        if isinstance(attribute, PKOnlyObject):
+            return attribute if attribute.pk is not None else None
+        return attribute
+    return getter
+
+
+def _field_converter(field):
+    to_representation = type(field).to_representation
+    if to_representation is serializers.CharField.to_representation:
+        return str
+    if to_representation is serializers.IntegerField.to_representation:
+        return int
+    return field.to_representation
+
+
+user_read_serializer = CompiledReadSerializer(UserSerializer)
+user_list_read_serializer = CompiledReadSerializer(UserListSerializer)
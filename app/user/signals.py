@@ -0,0 +1,30 @@
+"""
+Signal handlers for the user app.
+"""
+from django.contrib.auth import get_user_model
+from django.core.signals import setting_changed
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from rest_framework.authtoken.models import Token
+
+from user.authentication import get_token_cache, reset_token_cache
+
+
+@receiver([post_save, post_delete], sender=Token)
+def invalidate_cached_token(sender, instance, **kwargs):
+    """Drop a token from the auth cache when it is rotated or deleted."""
+    get_token_cache().invalidate(instance.key)
+
+
+@receiver([post_save, post_delete], sender=get_user_model())
+def invalidate_cached_user_tokens(sender, instance, **kwargs):
+    """Drop a user's tokens from the auth cache when the user changes."""
+    get_token_cache().invalidate_user(instance.pk)
+
+
+@receiver(setting_changed)
+def reload_token_cache(setting, **kwargs):
+    """Rebuild the auth cache when its settings are overridden."""
+    if setting == 'TOKEN_AUTH_CACHE':
+        reset_token_cache()
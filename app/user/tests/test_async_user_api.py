@@ -0,0 +1,142 @@
+"""
+Tests for the async user API.
+"""
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+
+from user.authentication import reset_token_cache
+
+
+CREATE_USER_URL = reverse('user:async-create')
+TOKEN_URL = reverse('user:async-token')
+ME_URL = reverse('user:async-me')
+
+
+class AsyncPublicUserApiTests(TestCase):
+    """Test the public async user endpoints."""
+
+    async def test_create_user_success(self):
+        """Test creating a user is successful."""
+        payload = {
+            'email': 'test@Example.com',
+            'password': 'testpass123',
+            'name': 'Test Name',
+        }
+        res = await self.async_client.post(
+            CREATE_USER_URL, payload, content_type='application/json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(res.json(), {
+            'email': 'test@example.com',
+            'name': 'Test Name',
+        })
+        user = await get_user_model().objects.aget(email='test@example.com')
+        self.assertTrue(user.check_password(payload['password']))
+
+    async def test_create_user_errors(self):
+        """Test duplicate emails and short passwords are rejected."""
+        await get_user_model().objects.acreate(
+            email='test@example.com', name='Taken')
+
+        res = await self.async_client.post(CREATE_USER_URL, {
+            'email': 'test@example.com', 'password': 'testpass123',
+            'name': 'Test',
+        }, content_type='application/json')
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('email', res.json())
+
+        res = await self.async_client.post(CREATE_USER_URL, {
+            'email': 'new@example.com', 'password': 'pw', 'name': 'Test',
+        }, content_type='application/json')
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('password', res.json())
+
+    async def test_create_token(self):
+        """Test a token is issued for valid credentials only."""
+        user = get_user_model()(email='test@example.com', name='Test')
+        user.set_password('testpass123')
+        await user.asave()
+
+        res = await self.async_client.post(TOKEN_URL, {
+            'email': 'test@example.com', 'password': 'testpass123',
+        }, content_type='application/json')
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        token = await Token.objects.aget(user=user)
+        self.assertEqual(res.json(), {'token': token.key})
+
+        for password in ('wrong-password', ''):
+            res = await self.async_client.post(TOKEN_URL, {
+                'email': 'test@example.com', 'password': password,
+            }, content_type='application/json')
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertNotIn('token', res.json())
+
+    async def test_me_unauthorized(self):
+        """Test authentication is required for the me endpoint."""
+        res = await self.async_client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(res['WWW-Authenticate'], 'Token')
+
+        res = await self.async_client.get(
+            ME_URL, headers={'Authorization': 'Token bad-token'})
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class AsyncPrivateUserApiTests(TestCase):
+    """Test the async me endpoint for an authenticated user."""
+
+    def setUp(self):
+        reset_token_cache()
+        self.user = get_user_model().objects.create_user(
+            email='test@example.com',
+            password='testpass123',
+            name='Test Name',
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.headers = {'Authorization': f'Token {self.token.key}'}
+
+    async def test_retrieve_profile(self):
+        """Test retrieving the profile, then a 304 with its ETag."""
+        res = await self.async_client.get(ME_URL, headers=self.headers)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.json(), {
+            'email': 'test@example.com',
+            'name': 'Test Name',
+        })
+
+        res = await self.async_client.get(ME_URL, headers={
+            **self.headers, 'If-None-Match': res['ETag']})
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    async def test_update_profile(self):
+        """Test updating the profile and the If-Match precondition."""
+        etag = (await self.async_client.get(
+            ME_URL, headers=self.headers))['ETag']
+        headers = {**self.headers, 'If-Match': etag}
+
+        res = await self.async_client.patch(
+            ME_URL, {'name': 'Updated', 'password': 'newpassword123'},
+            content_type='application/json', headers=headers)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.json()['name'], 'Updated')
+
+        res = await self.async_client.patch(
+            ME_URL, {'name': 'Stale'}, content_type='application/json',
+            headers=headers)
+        self.assertEqual(res.status_code, status.HTTP_412_PRECONDITION_FAILED)
+
+        user = await get_user_model().objects.aget(pk=self.user.pk)
+        self.assertEqual(user.name, 'Updated')
+        self.assertTrue(user.check_password('newpassword123'))
+
+    async def test_post_not_allowed(self):
+        """Test POST is not allowed for the me endpoint."""
+        res = await self.async_client.post(ME_URL, {}, headers=self.headers)
+
+        self.assertEqual(res.status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
@@ -0,0 +1,164 @@
+"""
+Tests for the cached token authentication.
+"""
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from user.authentication import get_token_cache, reset_token_cache
+
+
+ME_URL = reverse('user:me')
+
+
+def create_user(**params):
+    """Create and return a new user."""
+    return get_user_model().objects.create_user(**params)
+
+
+class CachedTokenAuthenticationTests(TestCase):
+    """Test authenticating with the token cache."""
+
+    def setUp(self):
+        reset_token_cache()
+        self.user = create_user(
+            email='test@example.com',
+            password='testpass123',
+            name='Test Name',
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_repeat_requests_hit_cache(self):
+        """Test the token lookup only hits the database once."""
+        res = self.client.get(ME_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        with self.assertNumQueries(0):
+            res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['email'], self.user.email)
+        stats = get_token_cache().stats()
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 1)
+
+    def test_deleted_token_rejected(self):
+        """Test a deleted token stops authenticating immediately."""
+        self.client.get(ME_URL)
+        self.token.delete()
+
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_rotated_token_rejected(self):
+        """Test the old key of a rotated token stops authenticating."""
+        self.client.get(ME_URL)
+        self.token.delete()
+        new_token = Token.objects.create(user=self.user)
+
+        res = self.client.get(ME_URL)
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {new_token.key}')
+        res = self.client.get(ME_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_deactivated_user_rejected(self):
+        """Test deactivating a user invalidates the cached token."""
+        self.client.get(ME_URL)
+        self.user.is_active = False
+        self.user.save()
+
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_user_update_visible(self):
+        """Test saving the user refreshes the cached user."""
+        self.client.get(ME_URL)
+        self.user.name = 'New Name'
+        self.user.save()
+
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.data['name'], 'New Name')
+
+    def test_queryset_update_rejects_cached_token(self):
+        """Test a bulk update drops the tokens of the users it changed."""
+        self.client.get(ME_URL)
+
+        get_user_model().objects.filter(
+            is_active=True).update(is_active=False)
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_queryset_delete_rejects_cached_token(self):
+        """Test a bulk delete drops the tokens of the users it removed."""
+        self.client.get(ME_URL)
+
+        get_user_model().objects.filter(pk=self.user.pk).delete()
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_lru_evicts_oldest(self):
+        """Test the cache never grows past its maximum size."""
+        token_cache = get_token_cache()
+        token_cache.max_size = 1
+        other = create_user(email='other@example.com', password='pass123')
+        other_token = Token.objects.create(user=other)
+
+        self.client.get(ME_URL)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {other_token.key}')
+        self.client.get(ME_URL)
+
+        self.assertEqual(token_cache.stats()['size'], 1)
+        self.assertIsNone(token_cache.get(self.token.key))
+
+
+@override_settings(
+    CACHES={
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+    },
+    TOKEN_AUTH_CACHE={'CACHE_ALIAS': 'default', 'TTL': 60},
+)
+class SharedTokenCacheTests(TestCase):
+    """Test the token cache backed by the Django cache framework."""
+
+    def setUp(self):
+        self.user = create_user(email='test@example.com', password='pass123')
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_shared_cache_hit_and_invalidate(self):
+        """Test shared entries are served and dropped on user change."""
+        self.client.get(ME_URL)
+        with self.assertNumQueries(0):
+            self.client.get(ME_URL)
+
+        self.user.is_active = False
+        self.user.save()
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_shared_cache_queryset_update(self):
+        """Test a bulk update drops shared entries of the users it changed."""
+        self.client.get(ME_URL)
+
+        get_user_model().objects.filter(
+            is_active=True).update(is_active=False)
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
@@ -0,0 +1,158 @@
+"""
+Tests for the bulk user import API and command.
+"""
+import json
+import tempfile
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core import hashing
+
+
+BULK_URL = reverse('user:bulk-create')
+
+
+def create_user(**params):
+    """Create and return a new user."""
+    return get_user_model().objects.create_user(**params)
+
+
+def ndjson(*rows):
+    """Encode rows as newline-delimited JSON."""
+    return '\n'.join(json.dumps(row) for row in rows) + '\n'
+
+
+@override_settings(USER_IMPORT={'CHUNK_SIZE': 2},
+                   PASSWORD_HASHING_POOL={'WORKERS': 2})
+class BulkImportApiTests(TestCase):
+    """Test the bulk user import endpoint."""
+
+    def setUp(self):
+        self.admin = get_user_model().objects.create_superuser(
+            'admin@example.com', 'adminpass123')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.admin)
+
+    def tearDown(self):
+        hashing.reset_pool()
+
+    def test_import_ndjson(self):
+        """Test creating users from NDJSON with hashed passwords."""
+        body = ndjson(
+            {'email': 'one@Example.com', 'password': 'password-one', 'name': 'One'},
+            {'email': 'two@example.com', 'password': 'password-two', 'name': 'Two'},
+            {'email': 'three@example.com', 'password': 'password-3', 'name': '3'},
+        )
+        res = self.client.post(
+            BULK_URL, body, content_type='application/x-ndjson')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['created'], 3)
+        self.assertEqual(res.data['errors'], [])
+        user = get_user_model().objects.get(email='one@example.com')
+        self.assertTrue(user.check_password('password-one'))
+
+    def test_import_csv(self):
+        """Test creating users from CSV with a header row."""
+        body = (
+            'email,password,name\n'
+            'one@example.com,password-one,One\n'
+            'two@example.com,password-two,Two\n'
+        )
+        res = self.client.post(BULK_URL, body, content_type='text/csv')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['created'], 2)
+        self.assertEqual(get_user_model().objects.count(), 3)
+
+    def test_imports_hash_inline_when_pool_disabled(self):
+        """Test no process pool is started while the pool is disabled."""
+        res = self.client.post(BULK_URL, ndjson(
+            {'email': 'one@example.com', 'password': 'password-one', 'name': 'One'},
+        ), content_type='application/x-ndjson')
+
+        self.assertEqual(res.data['created'], 1)
+        self.assertIsNone(hashing.get_pool()._executor)
+        self.assertIsNone(hashing.get_pool()._bulk_executor)
+
+    @override_settings(PASSWORD_HASHING_POOL={
+        'ENABLED': True, 'WORKERS': 2, 'BULK_WORKERS': 1})
+    def test_imports_use_bulk_processes(self):
+        """Test imports share bulk processes apart from signup and login."""
+        self.client.post(BULK_URL, ndjson(
+            {'email': 'one@example.com', 'password': 'password-one', 'name': 'One'},
+        ), content_type='application/x-ndjson')
+        pool = hashing.get_pool()
+        executor = pool._bulk_executor
+        res = self.client.post(BULK_URL, ndjson(
+            {'email': 'two@example.com', 'password': 'password-two', 'name': 'Two'},
+        ), content_type='application/x-ndjson')
+
+        self.assertEqual(res.data['created'], 1)
+        self.assertIsNotNone(executor)
+        self.assertIs(pool._bulk_executor, executor)
+        self.assertIsNone(pool._executor)
+        self.assertTrue(get_user_model().objects.get(
+            email='two@example.com').check_password('password-two'))
+
+    def test_duplicates_and_invalid_rows_reported(self):
+        """Test bad rows are reported per row without aborting the batch."""
+        create_user(email='taken@example.com', password='password-x')
+        body = ndjson(
+            {'email': 'taken@example.com', 'password': 'password-1', 'name': 'A'},
+            {'email': 'new@example.com', 'password': 'password-2', 'name': 'B'},
+            {'email': 'new@example.com', 'password': 'password-3', 'name': 'C'},
+            {'email': 'short@example.com', 'password': 'short', 'name': 'D'},
+        ) + 'not json\n'
+        res = self.client.post(
+            BULK_URL, body, content_type='application/x-ndjson')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['created'], 1)
+        errors = {error['row']: error['errors'] for error in res.data['errors']}
+        self.assertEqual(sorted(errors), [1, 3, 4, 5])
+        self.assertIn('email', errors[1])
+        self.assertIn('email', errors[3])
+        self.assertIn('password', errors[4])
+        self.assertIn('non_field_errors', errors[5])
+        self.assertTrue(
+            get_user_model().objects.filter(email='new@example.com').exists())
+
+    def test_non_staff_forbidden(self):
+        """Test only staff users can bulk import."""
+        user = create_user(email='user@example.com', password='password-x')
+        self.client.force_authenticate(user=user)
+
+        res = self.client.post(
+            BULK_URL, ndjson({}), content_type='application/x-ndjson')
+
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class ImportUsersCommandTests(TestCase):
+    """Test the import_users management command."""
+
+    def test_import_from_file(self):
+        """Test importing an NDJSON file reports throughput."""
+        with tempfile.NamedTemporaryFile('w', suffix='.ndjson') as stream:
+            stream.write(ndjson(
+                {'email': 'a@example.com', 'password': 'password-a', 'name': 'A'},
+                {'email': 'a@example.com', 'password': 'password-b', 'name': 'B'},
+            ))
+            stream.flush()
+            out = StringIO()
+            err = StringIO()
+            call_command('import_users', stream.name, '--workers', '1',
+                         stdout=out, stderr=err)
+
+        self.assertIn('Imported 1 users, 1 failed', out.getvalue())
+        self.assertIn('users/sec', out.getvalue())
+        self.assertIn('Row 2', err.getvalue())
+        self.assertEqual(get_user_model().objects.count(), 1)
@@ -0,0 +1,128 @@
+"""
+Tests for the streaming user export.
+"""
+import csv
+import json
+import tracemalloc
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from user.export import export_users
+
+
+EXPORT_URL = reverse('user:export')
+
+
+def create_synthetic_users(start, count):
+    """Bulk insert count users without hashing passwords."""
+    get_user_model().objects.bulk_create(
+        [
+            get_user_model()(
+                email=f'user{i}@example.com',
+                name=f'User {i} ' + 'x' * 100,
+                password='!',
+            )
+            for i in range(start, start + count)
+        ],
+        batch_size=1000,
+    )
+
+
+def peak_export_memory(chunk_size=500):
+    """Return peak bytes allocated while consuming a full export."""
+    tracemalloc.start()
+    try:
+        content, _content_type = export_users('ndjson', chunk_size)
+        rows = 0
+        for chunk in content:
+            rows += chunk.count('\n')
+        return rows, tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+class ExportApiTests(TestCase):
+    """Test the user export endpoint."""
+
+    def setUp(self):
+        self.admin = get_user_model().objects.create_superuser(
+            'admin@example.com', 'adminpass123')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.admin)
+
+    def test_export_ndjson(self):
+        """Test exporting users as NDJSON with the serializer fields."""
+        res = self.client.get(EXPORT_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(res.streaming_content).decode().splitlines()
+        self.assertEqual(
+            [json.loads(line) for line in lines],
+            [{'email': 'admin@example.com', 'name': ''}],
+        )
+
+    def test_export_csv(self):
+        """Test exporting users as CSV with a header row."""
+        res = self.client.get(EXPORT_URL, {'type': 'csv'})
+
+        content = b''.join(res.streaming_content).decode()
+        self.assertEqual(res['Content-Type'], 'text/csv')
+        self.assertEqual(
+            list(csv.reader(StringIO(content))),
+            [['email', 'name'], ['admin@example.com', '']],
+        )
+
+    def test_export_unknown_type(self):
+        """Test an unknown export type is rejected."""
+        res = self.client.get(EXPORT_URL, {'type': 'xml'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_export_requires_staff(self):
+        """Test only staff users can export."""
+        user = get_user_model().objects.create_user(
+            email='user@example.com', password='password-x')
+        self.client.force_authenticate(user=user)
+
+        res = self.client.get(EXPORT_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class ExportMemoryTests(TestCase):
+    """Test the export memory use does not grow with the table."""
+
+    def test_memory_flat_on_large_table(self):
+        """Test exporting 10x the rows does not use 10x the memory."""
+        create_synthetic_users(0, 2000)
+        small_rows, small_peak = peak_export_memory()
+
+        create_synthetic_users(2000, 18000)
+        large_rows, large_peak = peak_export_memory()
+
+        self.assertEqual(small_rows, 2000)
+        self.assertEqual(large_rows, 20000)
+        self.assertLess(large_peak, small_peak * 2)
+
+
+class ExportUsersCommandTests(TestCase):
+    """Test the export_users management command."""
+
+    def test_export_csv_to_stdout(self):
+        """Test the command writes every user as CSV."""
+        create_synthetic_users(0, 3)
+        out = StringIO()
+
+        call_command('export_users', '--format', 'csv', stdout=out)
+
+        rows = list(csv.reader(StringIO(out.getvalue())))
+        self.assertEqual(rows[0], ['email', 'name'])
+        self.assertEqual(len(rows), 4)
@@ -0,0 +1,71 @@
+"""
+Tests for the compiled read-only user serializer.
+"""
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase
+
+from rest_framework.renderers import JSONRenderer
+
+from user.serializers import (
+    CompiledReadSerializer,
+    UserListSerializer,
+    UserSerializer,
+)
+
+
+SAMPLE_USERS = [
+    {'id': 1, 'email': 'test@example.com', 'name': 'Test Name'},
+    {'id': 2, 'email': 'uni@example.com', 'name': 'Zoë “quoted” \\ name'},
+    {'id': 3, 'email': 'blank@example.com', 'name': ''},
+]
+
+
+class CompiledReadSerializerTests(SimpleTestCase):
+    """Test the compiled serializer matches the DRF serializer."""
+
+    def setUp(self):
+        self.users = [
+            get_user_model()(password='secret', **params)
+            for params in SAMPLE_USERS
+        ]
+        self.renderer = JSONRenderer()
+
+    def test_output_identical(self):
+        """Test rendered bytes match the ModelSerializer for each class."""
+        for serializer_class in (UserSerializer, UserListSerializer):
+            compiled = CompiledReadSerializer(serializer_class)
+            for user in self.users:
+                self.assertEqual(
+                    self.renderer.render(compiled.to_representation(user)),
+                    self.renderer.render(serializer_class(user).data),
+                )
+
+    def test_many_identical(self):
+        """Test serializing many users matches many=True."""
+        compiled = CompiledReadSerializer(UserListSerializer)
+
+        self.assertEqual(
+            self.renderer.render(compiled.many(self.users)),
+            self.renderer.render(
+                UserListSerializer(self.users, many=True).data),
+        )
+
+    def test_write_only_fields_skipped(self):
+        """Test the password never appears in the output."""
+        compiled = CompiledReadSerializer(UserSerializer)
+
+        self.assertEqual(compiled.field_names, ('email', 'name'))
+        self.assertEqual(
+            compiled.to_tuple(self.users[0]),
+            ('test@example.com', 'Test Name'),
+        )
+
+    def test_none_values(self):
+        """Test None values are passed through like DRF does."""
+        compiled = CompiledReadSerializer(UserListSerializer)
+        user = get_user_model()(email='x@example.com', name=None)
+
+        self.assertEqual(
+            compiled.to_representation(user),
+            dict(UserListSerializer(user).data),
+        )
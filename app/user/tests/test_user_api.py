@@ -154,4 +154,40 @@ class PrivateUserApiTests(TestCase):
         self.user.refresh_from_db()
         self.assertEqual(self.user.name, payload['name'])
         self.assertTrue(self.user.check_password(payload['password']))
-        self.assertEqual(res.status_code, status.HTTP_200_OK)
\ No newline at end of file
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_retrieve_profile_etag(self):
+        """Test the profile carries an ETag and 304s when unchanged."""
+        res = self.client.get(ME_URL)
+        etag = res['ETag']
+
+        with self.assertNumQueries(0):
+            res = self.client.get(ME_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(res.content, b'')
+        self.assertEqual(res['ETag'], etag)
+
+    def test_etag_changes_after_update(self):
+        """Test updating the profile invalidates the old ETag."""
+        etag = self.client.get(ME_URL)['ETag']
+
+        res = self.client.patch(ME_URL, {'name': 'Updated name'})
+        self.assertNotEqual(res['ETag'], etag)
+
+        # force_authenticate hands the view this same (now stale) instance.
+        self.user.refresh_from_db()
+        res = self.client.get(ME_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_update_if_match(self):
+        """Test If-Match rejects updates based on a stale version."""
+        etag = self.client.get(ME_URL)['ETag']
+
+        res = self.client.patch(ME_URL, {'name': 'First'}, HTTP_IF_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        res = self.client.patch(ME_URL, {'name': 'Second'}, HTTP_IF_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.name, 'First')
@@ -0,0 +1,85 @@
+"""
+Tests for the staff user listing API.
+"""
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+
+LIST_URL = reverse('user:list')
+
+
+class UserListApiTests(TestCase):
+    """Test the keyset-paginated user list."""
+
+    def setUp(self):
+        self.admin = get_user_model().objects.create_superuser(
+            'admin@example.com', 'adminpass123')
+        get_user_model().objects.bulk_create([
+            get_user_model()(email=f'{name}@example.com', name=name,
+                             password='!')
+            for name in ['delta', 'alpha', 'echo', 'charlie', 'bravo']
+        ])
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.admin)
+
+    def _collect(self, params):
+        """Follow next links and return every listed email."""
+        emails = []
+        res = self.client.get(LIST_URL, params)
+        while True:
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            emails.extend(user['email'] for user in res.data['results'])
+            if not res.data['next']:
+                return emails
+            res = self.client.get(res.data['next'])
+
+    def test_list_by_id(self):
+        """Test paging through users in id order."""
+        emails = self._collect({'page_size': 2})
+
+        expected = list(get_user_model().objects.order_by('id').values_list(
+            'email', flat=True))
+        self.assertEqual(emails, expected)
+
+    def test_list_by_email(self):
+        """Test paging through users in email order, both directions."""
+        self.assertEqual(
+            self._collect({'page_size': 2, 'ordering': 'email'}),
+            sorted(get_user_model().objects.values_list('email', flat=True)),
+        )
+        self.assertEqual(
+            self._collect({'page_size': 4, 'ordering': '-email'}),
+            sorted(get_user_model().objects.values_list('email', flat=True),
+                   reverse=True),
+        )
+
+    def test_page_without_count_query(self):
+        """Test a page is one query with no COUNT(*) and no count field."""
+        with self.assertNumQueries(1) as queries:
+            res = self.client.get(LIST_URL, {'page_size': 2})
+
+        self.assertNotIn('count', res.data)
+        sql = queries.captured_queries[0]['sql']
+        self.assertNotIn('COUNT', sql.upper())
+        self.assertNotIn('password', sql)
+        self.assertEqual(set(res.data['results'][0]), {'id', 'email', 'name'})
+
+    def test_invalid_cursor(self):
+        """Test a tampered cursor is rejected."""
+        res = self.client.get(LIST_URL, {'cursor': 'not-a-cursor'})
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_list_requires_staff(self):
+        """Test non-staff users can't list users."""
+        user = get_user_model().objects.create_user(
+            email='user@example.com', password='password-x')
+        self.client.force_authenticate(user=user)
+
+        res = self.client.get(LIST_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
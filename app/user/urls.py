@@ -3,13 +3,19 @@ URL mappings for the user API.
 """
 from django.urls import path
 
-from user import views
+from user import async_views, views
 
 
 app_name = 'user' # needed for reverse mapping we used in our tests
 
 urlpatterns = [
+    path('', views.UserListView.as_view(), name='list'),
     path('create/', views.CreateUserView.as_view(), name='create'),
     path('token/', views.CreateTokenView.as_view(), name='token'),
     path('me/', views.ManageUserView.as_view(), name='me'),
+    path('bulk/', views.BulkCreateUserView.as_view(), name='bulk-create'),
+    path('export/', views.ExportUsersView.as_view(), name='export'),
+    path('async/create/', async_views.create_user, name='async-create'),
+    path('async/token/', async_views.create_token, name='async-token'),
+    path('async/me/', async_views.manage_user, name='async-me'),
 ]
\ No newline at end of file
@@ -1,12 +1,50 @@
 """views for user APIs"""
 
-from rest_framework import generics, authentication, permissions
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.http import StreamingHttpResponse
+from django.utils.http import parse_etags
+from django.utils.translation import gettext_lazy as _
+
+from rest_framework import exceptions, filters, generics, permissions, status
+from rest_framework.response import Response
 from rest_framework.settings import api_settings
 from rest_framework.authtoken.views import ObtainAuthToken
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import extend_schema
+from rest_framework.views import APIView
+from user.authentication import CachedTokenAuthentication
+from user.bulk import UserImporter
+from user.export import RENDERERS, export_users
+from user.pagination import UserCursorPagination
+from user.parsers import CSVParser, NDJSONParser
 from user.serializers import AuthTokenSerializer
+from user.serializers import (
+    UserListSerializer,
+    UserSerializer,
+    user_list_read_serializer,
+    user_read_serializer,
+)
+
+
+class PreconditionFailed(exceptions.APIException):
+    status_code = status.HTTP_412_PRECONDITION_FAILED
+    default_detail = _('The user was modified since it was last fetched.')
+    default_code = 'precondition_failed'
+
+
+def user_etag(user):
+    """Return the strong ETag of a user's representation."""
+    return f'"{user.pk}-{user.version}"'
 
 
-from user.serializers import UserSerializer
+def etag_matches(header, etag, weak=False):
+    """Return True if an If-Match/If-None-Match header matches etag."""
+    etags = parse_etags(header)
+    if weak:
+        etags = [value.removeprefix('W/') for value in etags]
+    return '*' in etags or etag in etags
+
 
 class CreateUserView(generics.CreateAPIView):
     serializer_class = UserSerializer
@@ -18,8 +56,93 @@ class CreateTokenView(ObtainAuthToken):
 
 class ManageUserView(generics.RetrieveUpdateAPIView):
     serializer_class = UserSerializer
-    authentication_classes = [authentication.TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [permissions.IsAuthenticated]
 
     def get_object(self):
-        return self.request.user
\ No newline at end of file
+        if self.request.method in permissions.SAFE_METHODS:
+            return self.request.user
+        # Writes lock and work on the current row, so If-Match is checked
+        # against the latest version, not the copy loaded at authentication.
+        return get_user_model().objects.select_for_update().get(
+            pk=self.request.user.pk)
+
+    def retrieve(self, request, *args, **kwargs):
+        """Return the user, or 304 if the client's copy is current."""
+        user = self.get_object()
+        etag = user_etag(user)
+        if_none_match = request.headers.get('If-None-Match')
+        if if_none_match and etag_matches(if_none_match, etag, weak=True):
+            return Response(
+                status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
+        response = Response(user_read_serializer.to_representation(user))
+        response['ETag'] = etag
+        return response
+
+    def update(self, request, *args, **kwargs):
+        """Update the user, honouring If-Match for optimistic concurrency."""
+        partial = kwargs.pop('partial', False)
+        with transaction.atomic():
+            user = self.get_object()
+            if_match = request.headers.get('If-Match')
+            if if_match and not etag_matches(if_match, user_etag(user)):
+                raise PreconditionFailed()
+            serializer = self.get_serializer(
+                user, data=request.data, partial=partial)
+            serializer.is_valid(raise_exception=True)
+            self.perform_update(serializer)
+
+        response = Response(serializer.data)
+        response['ETag'] = user_etag(user)
+        return response
+
+
+class BulkCreateUserView(APIView):
+    """Create many users from a streamed NDJSON or CSV upload."""
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [permissions.IsAdminUser]
+    parser_classes = [NDJSONParser, CSVParser]
+
+    @extend_schema(request=OpenApiTypes.BINARY, responses=OpenApiTypes.OBJECT)
+    def post(self, request):
+        result = UserImporter().run(request.data)
+        return Response(result.as_dict())
+
+
+class ExportUsersView(APIView):
+    """Stream every user as NDJSON (default) or CSV (``?type=csv``)."""
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [permissions.IsAdminUser]
+
+    @extend_schema(responses=OpenApiTypes.BINARY)
+    def get(self, request):
+        file_format = request.query_params.get('type', 'ndjson')
+        if file_format not in RENDERERS:
+            raise exceptions.ValidationError(
+                {'type': f'Must be one of: {", ".join(RENDERERS)}.'})
+        content, content_type = export_users(file_format)
+        response = StreamingHttpResponse(content, content_type=content_type)
+        response['Content-Disposition'] = (
+            f'attachment; filename="users.{file_format}"')
+        return response
+
+
+class UserListView(generics.ListAPIView):
+    """List users for staff, keyset-paginated by ``id`` or ``email``."""
+    serializer_class = UserListSerializer
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [permissions.IsAdminUser]
+    pagination_class = UserCursorPagination
+    filter_backends = [filters.OrderingFilter]
+    ordering_fields = ['id', 'email']
+    ordering = 'id'
+
+    def get_queryset(self):
+        return get_user_model().objects.only(*UserListSerializer.Meta.fields)
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        return self.get_paginated_response(
+            user_list_read_serializer.many(page))
@@ -0,0 +1,259 @@
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+from collections import defaultdict, deque
+
+
+class AdmissionError(Exception):
+    """
+    Base class of the reasons a task was not admitted.
+    """
+
+
+class AdmissionRejected(AdmissionError):
+    """
+    Raised when a task name already has ``max_queue`` tasks waiting.
+    """
+
+
+class AdmissionTimeout(AdmissionError):
+    """
+    Raised when a task waited longer than its timeout for a slot.
+    """
+
+
+class AdmissionCancelled(AdmissionError):
+    """
+    Raised to a waiter whose ticket was cancelled.
+    """
+
+
+WAITING, ADMITTED, RELEASED, CANCELLED = "waiting", "admitted", "released", "cancelled"
+
+
+class Ticket:
+    """
+    A task's place in the admission queue, then its concurrency slot.
+
+    Call ``release`` once the admitted work has finished.
+    """
+
+    def __init__(self, queue, task_name, priority, sequence):
+        self.queue = queue
+        self.task_name = task_name
+        self.priority = priority
+        self.sequence = sequence
+        self.state = WAITING
+        self.enqueued_at = time.monotonic()
+        self.admitted_at = None
+        self._event = threading.Event()
+        self._waiters = []
+
+    def __lt__(self, other):
+        # Higher priority first, then first come first served.
+        return (-self.priority, self.sequence) < (-other.priority, other.sequence)
+
+    @property
+    def admitted(self):
+        return self.state == ADMITTED
+
+    def wait(self, timeout=None):
+        """
+        Block the calling thread until the ticket is admitted.
+
+        :param timeout: Seconds to wait, None for no limit
+        :raises AdmissionTimeout: if not admitted in time; the ticket is
+            cancelled
+        :raises AdmissionCancelled: if the ticket was cancelled
+        """
+        if not self._event.wait(timeout) and self.cancel():
+            raise AdmissionTimeout(
+                f"{self.task_name} was not admitted within {timeout}s.")
+        if self.state == CANCELLED:
+            raise AdmissionCancelled(f"{self.task_name} was cancelled.")
+        return self
+
+    async def wait_async(self, timeout=None):
+        """
+        Wait for admission without blocking the event loop.
+
+        Cancelling the awaiting task cancels the ticket.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self.queue._lock:
+            if self.state == WAITING:
+                self._waiters.append((loop, future))
+            elif not future.done():
+                future.set_result(None)
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            if self.cancel():
+                raise AdmissionTimeout(
+                    f"{self.task_name} was not admitted within {timeout}s.") from None
+        except asyncio.CancelledError:
+            if not self.cancel():
+                self.release()
+            raise
+        if self.state == CANCELLED:
+            raise AdmissionCancelled(f"{self.task_name} was cancelled.")
+        return self
+
+    def cancel(self):
+        """
+        Give up the place in the queue.
+
+        :return: True if the ticket was still waiting, False if it had
+            already been admitted (it then holds a slot until released)
+        """
+        return self.queue._cancel(self)
+
+    def release(self):
+        """
+        Free the slot of an admitted ticket; does nothing otherwise.
+        """
+        self.queue._release(self)
+
+    def _notify(self):
+        self._event.set()
+        for loop, future in self._waiters:
+            loop.call_soon_threadsafe(_resolve, future)
+        self._waiters = []
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class AdmissionQueue:
+    """
+    Bounded, fair admission control for at most ``max_concurrency`` tasks.
+
+    Each task name has its own queue of at most ``max_queue`` waiting
+    tickets, ordered by priority then arrival. When a slot frees up, task
+    names with waiting tickets take turns (round robin), so a burst of one
+    task can't starve the others. Safe to use from any number of threads and
+    event loops at once; nothing blocks while holding the lock.
+    """
+
+    def __init__(self, max_concurrency, max_queue=1000):
+        """
+        :param max_concurrency: Tasks admitted at the same time
+        :param max_queue: Tickets waiting per task name before rejecting
+        """
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.in_flight = 0
+        self._lock = threading.Lock()
+        self._queues = defaultdict(list)
+        self._waiting = defaultdict(int)
+        self._turns = deque()
+        self._sequence = itertools.count()
+        self._counters = defaultdict(lambda: defaultdict(int))
+
+    def submit(self, task_name, priority=0):
+        """
+        Queue a ticket without waiting; it may be admitted right away.
+
+        :param task_name: Name the fairness and queue bound apply to
+        :param priority: Higher is admitted earlier within the task name
+        :return: Ticket
+        :raises AdmissionRejected: if the task name's queue is full
+        """
+        with self._lock:
+            if self._waiting[task_name] >= self.max_queue:
+                self._counters[task_name]["rejected"] += 1
+                raise AdmissionRejected(
+                    f"{self._waiting[task_name]} {task_name} tasks already waiting.")
+            ticket = Ticket(self, task_name, priority, next(self._sequence))
+            heapq.heappush(self._queues[task_name], ticket)
+            self._waiting[task_name] += 1
+            if self._waiting[task_name] == 1:
+                self._turns.append(task_name)
+            admitted = self._dispatch()
+        _notify_all(admitted)
+        return ticket
+
+    def acquire(self, task_name, priority=0, timeout=None):
+        """
+        Wait in the calling thread until a slot is free.
+
+        :return: Admitted Ticket; release it when the work is done
+        """
+        return self.submit(task_name, priority).wait(timeout)
+
+    async def acquire_async(self, task_name, priority=0, timeout=None):
+        """
+        Wait in the event loop until a slot is free.
+
+        :return: Admitted Ticket; release it when the work is done
+        """
+        return await self.submit(task_name, priority).wait_async(timeout)
+
+    def stats(self):
+        """
+        Return queue depth and counters per task name.
+        """
+        with self._lock:
+            return {
+                "in_flight": self.in_flight,
+                "max_concurrency": self.max_concurrency,
+                "tasks": {
+                    name: {"waiting": self._waiting[name], **counters}
+                    for name, counters in self._counters.items()
+                },
+            }
+
+    def _dispatch(self):
+        # Called with the lock held; returns the tickets to notify.
+        admitted = []
+        while self.in_flight < self.max_concurrency and self._turns:
+            task_name = self._turns.popleft()
+            queue = self._queues[task_name]
+            ticket = heapq.heappop(queue)
+            while ticket.state != WAITING:
+                ticket = heapq.heappop(queue)
+            self._waiting[task_name] -= 1
+            if self._waiting[task_name]:
+                self._turns.append(task_name)
+            else:
+                # Drop cancelled tickets still in the heap.
+                queue.clear()
+            ticket.state = ADMITTED
+            ticket.admitted_at = time.monotonic()
+            self.in_flight += 1
+            self._counters[task_name]["admitted"] += 1
+            admitted.append(ticket)
+        return admitted
+
+    def _cancel(self, ticket):
+        with self._lock:
+            if ticket.state != WAITING:
+                return False
+            ticket.state = CANCELLED
+            self._waiting[ticket.task_name] -= 1
+            self._counters[ticket.task_name]["cancelled"] += 1
+            if not self._waiting[ticket.task_name]:
+                self._turns.remove(ticket.task_name)
+                self._queues[ticket.task_name].clear()
+        ticket._notify()
+        return True
+
+    def _release(self, ticket):
+        with self._lock:
+            if ticket.state != ADMITTED:
+                return
+            ticket.state = RELEASED
+            self.in_flight -= 1
+            self._counters[ticket.task_name]["completed"] += 1
+            admitted = self._dispatch()
+        _notify_all(admitted)
+
+
+def _notify_all(tickets):
+    for ticket in tickets:
+        ticket._notify()
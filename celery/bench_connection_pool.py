@@ -0,0 +1,78 @@
+"""
+Benchmark task throughput with and without the shared connection pool.
+
+Each simulated task runs the statement the index/shard tasks run (an
+idempotent DDL statement plus commit), either on a fresh psycopg2
+connection, as the managers used to, or on one checked out of
+``connection_pool.get_pool``. Run it from this directory:
+
+    python bench_connection_pool.py "dbname=app user=app host=db" --tasks 2000
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import psycopg2
+
+from connection_pool import get_pool
+
+
+SETUP = "CREATE TABLE IF NOT EXISTS bench_pool (id integer, value text);"
+STATEMENT = "CREATE INDEX IF NOT EXISTS bench_pool_value ON bench_pool (value);"
+
+
+def task_without_pool(dsn):
+    start = time.perf_counter()
+    conn = psycopg2.connect(dsn)
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(STATEMENT)
+        conn.commit()
+    finally:
+        conn.close()
+    return time.perf_counter() - start
+
+
+def task_with_pool(dsn):
+    start = time.perf_counter()
+    with get_pool(dsn).connection() as conn, conn.cursor() as cursor:
+        cursor.execute(STATEMENT)
+        conn.commit()
+    return time.perf_counter() - start
+
+
+def run(task, dsn, tasks, concurrency):
+    with ThreadPoolExecutor(concurrency) as executor:
+        start = time.perf_counter()
+        latencies = sorted(executor.map(lambda _: task(dsn), range(tasks)))
+        elapsed = time.perf_counter() - start
+    return {
+        'tasks_per_second': tasks / elapsed,
+        'p50_ms': latencies[len(latencies) // 2] * 1000,
+        'p95_ms': latencies[int(len(latencies) * 0.95)] * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('dsn')
+    parser.add_argument('--tasks', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=8)
+    args = parser.parse_args()
+
+    get_pool(args.dsn, min_size=args.concurrency, max_size=args.concurrency)
+    with get_pool(args.dsn).connection() as conn, conn.cursor() as cursor:
+        cursor.execute(SETUP)
+        cursor.execute(STATEMENT)
+        conn.commit()
+
+    for name, task in (('connect per task', task_without_pool),
+                       ('pooled', task_with_pool)):
+        result = run(task, args.dsn, args.tasks, args.concurrency)
+        print(f"{name:<17} {result['tasks_per_second']:>9.1f} tasks/s  "
+              f"p50 {result['p50_ms']:.2f}ms  p95 {result['p95_ms']:.2f}ms")
+    print(f"pool: {get_pool(args.dsn).stats()}")
+
+
+if __name__ == '__main__':
+    main()
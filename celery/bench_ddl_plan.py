@@ -0,0 +1,88 @@
+"""
+Benchmark provisioning a tenant's DDL per task versus with a DDL plan.
+
+A tenant here is ``--objects`` objects: shard tables of ``bench_ddl``,
+one index on each shard, and LIST partitions of ``bench_ddl_events``. The
+per-task path runs each statement the way the Celery tasks used to, on its
+own connection with its own commit. The plan path runs the same statements
+through ``DDLPlan.execute``, then once more to show the cost of a re-run in
+which every object already exists. Run it from this directory:
+
+    python bench_ddl_plan.py "dbname=app user=app host=db" --objects 1000
+"""
+import argparse
+import time
+
+import psycopg2
+
+from connection_pool import get_pool
+from ddl_plan import DDLPlan
+
+
+SETUP = """
+DROP TABLE IF EXISTS bench_ddl_events CASCADE;
+CREATE TABLE IF NOT EXISTS bench_ddl (id bigint PRIMARY KEY, tenant integer, value text);
+CREATE TABLE bench_ddl_events (tenant integer, payload text) PARTITION BY LIST (tenant);
+"""
+
+
+def build_plan(objects):
+    plan = DDLPlan()
+    shards = objects // 3
+    for key in range(shards):
+        plan.create_shard("bench_ddl", f"t{key}")
+        # The shard is new and empty, so there are no writes to keep going.
+        plan.create_index(f"bench_ddl_t{key}", f"bench_ddl_t{key}_value_idx", "value",
+                          concurrently=False)
+    for key in range(objects - 2 * shards):
+        plan.create_partition("bench_ddl_events", key)
+    return plan
+
+
+def cleanup(dsn, plan):
+    with get_pool(dsn).connection() as conn, conn.cursor() as cursor:
+        for op in plan.operations.values():
+            if op.parent == "bench_ddl":
+                cursor.execute(f"DROP TABLE IF EXISTS {op.name};")
+        cursor.execute(SETUP)
+        conn.commit()
+
+
+def per_task(dsn, plan):
+    start = time.perf_counter()
+    for op in plan.operations.values():
+        conn = psycopg2.connect(dsn)
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(op.sql)
+            conn.commit()
+        finally:
+            conn.close()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('dsn')
+    parser.add_argument('--objects', type=int, default=1000)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--batch-size', type=int, default=200)
+    args = parser.parse_args()
+
+    pool = get_pool(args.dsn, max_size=max(args.workers, 1))
+    plan = build_plan(args.objects)
+
+    cleanup(args.dsn, plan)
+    seconds = per_task(args.dsn, plan)
+    print(f"{'per task':<22}{seconds:>8.2f}s  {len(plan)} transactions")
+
+    cleanup(args.dsn, plan)
+    for name in ('plan', 'plan, all existing'):
+        result = plan.execute(pool, args.workers, args.batch_size)
+        print(f"{name:<22}{result['seconds']:>8.2f}s  {result['transactions']} transactions, "
+              f"{len(result['created'])} created, {result['skipped']} skipped, "
+              f"{len(result['failed'])} failed")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""
+Benchmark query planning time against a partitioned table.
+
+Builds ``bench_events`` with one daily partition per day of the last
+``--partitions`` days, then measures the planning time PostgreSQL reports
+for a lookup with and without the partition-key predicate from
+``PartitionPolicy.predicate``. It measures again after
+``maintain_partitions`` has dropped the partitions past a
+``--retention``-day window. Run it from this directory:
+
+    python bench_partition_planning.py "dbname=app user=app host=db" --partitions 1000
+"""
+import argparse
+import re
+import statistics
+from datetime import date, timedelta
+
+from connection_pool import get_pool
+from partition_maintenance import PartitionPolicy, maintain_partitions
+
+
+QUERY = "SELECT count(*) FROM bench_events WHERE id = %s"
+PLANNING_TIME = re.compile(r"Planning Time: ([\d.]+) ms")
+
+
+def setup(dsn, partitions):
+    today = date.today()
+    with get_pool(dsn).connection() as conn, conn.cursor() as cursor:
+        cursor.execute("DROP TABLE IF EXISTS bench_events CASCADE;")
+        cursor.execute("CREATE TABLE bench_events (id bigint, created_at date, payload text) "
+                       "PARTITION BY RANGE (created_at);")
+        for offset in range(partitions, -1, -1):
+            start = today - timedelta(days=offset)
+            cursor.execute(f"CREATE TABLE bench_events_p{start:%Y%m%d} PARTITION OF bench_events "
+                           f"FOR VALUES FROM (%s) TO (%s);", [start, start + timedelta(days=1)])
+        conn.commit()
+
+
+def planning_ms(dsn, sql, params, repeat):
+    timings = []
+    with get_pool(dsn).connection() as conn, conn.cursor() as cursor:
+        for _ in range(repeat):
+            cursor.execute("EXPLAIN (SUMMARY ON) " + sql, params)
+            plan = "\n".join(row[0] for row in cursor.fetchall())
+            timings.append(float(PLANNING_TIME.search(plan)[1]))
+        conn.rollback()
+    return statistics.median(timings)
+
+
+def measure(dsn, policy, repeat):
+    predicate, params = policy.predicate(date.today(), date.today() + timedelta(days=1))
+    return (planning_ms(dsn, QUERY, [1], repeat),
+            planning_ms(dsn, f"{QUERY} AND {predicate}", [1, *params], repeat))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('dsn')
+    parser.add_argument('--partitions', type=int, default=1000)
+    parser.add_argument('--retention', type=int, default=30)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    policy = PartitionPolicy('bench_events', 'created_at', interval='day', premake=7,
+                             retention=args.retention, expire='drop')
+    setup(args.dsn, args.partitions)
+    before = measure(args.dsn, policy, args.repeat)
+    result = maintain_partitions(get_pool(args.dsn), policy)
+    after = measure(args.dsn, policy, args.repeat)
+
+    print(f"maintenance: {len(result['created'])} created, "
+          f"{len(result['dropped'])} dropped")
+    print(f"{'':<24}{'no predicate':>14}{'with predicate':>16}")
+    for name, (plain, pruned) in ((f'{args.partitions + 1} partitions', before),
+                                  ('after maintenance', after)):
+        print(f"{name:<24}{plain:>12.3f}ms{pruned:>14.3f}ms")
+
+
+if __name__ == '__main__':
+    main()
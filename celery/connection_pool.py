@@ -0,0 +1,275 @@
+import os
+import threading
+import time
+import weakref
+from collections import deque
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import extensions
+
+
+class PoolTimeout(Exception):
+    """
+    Raised when no connection could be checked out in time.
+    """
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of psycopg2 connections to a single database.
+
+    Connections are checked out LIFO so the warmest ones are reused, pinged
+    before being handed out, and replaced once they are older than
+    ``max_lifetime`` seconds. After a fork the child never touches the
+    parent's sockets; it starts with an empty pool of its own.
+    """
+
+    def __init__(self, dsn, min_size=1, max_size=10, max_lifetime=1800,
+                 timeout=30, health_check_after=5, connect=psycopg2.connect):
+        self.dsn = dsn
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_lifetime = max_lifetime
+        self.timeout = timeout
+        self.health_check_after = health_check_after
+        self._connect = connect
+        self._cond = threading.Condition()
+        self._reset_state()
+        _pools.add(self)
+
+    def _reset_state(self):
+        self._pid = os.getpid()
+        self._idle = deque()
+        self._created = {}
+        self._size = 0
+        # Connections inherited over a fork. Dropping them would let the
+        # garbage collector run PQfinish and end the parent's sessions.
+        self._orphans = getattr(self, '_orphans', [])
+        self.connects = 0
+
+    def getconn(self, timeout=None):
+        """
+        Check a healthy connection out of the pool.
+
+        :param timeout: Seconds to wait for a free connection
+        :return: psycopg2 connection
+        :raises PoolTimeout: if max_size connections stay checked out
+        """
+        self._check_pid()
+        deadline = time.monotonic() + (self.timeout if timeout is None else timeout)
+        while True:
+            with self._cond:
+                conn = self._take_idle()
+                if conn is None and self._size < self.max_size:
+                    self._size += 1
+                    conn = False
+                elif conn is None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise PoolTimeout(
+                            f"No connection available within "
+                            f"{self.timeout}s (max_size={self.max_size}).")
+                    self._cond.wait(remaining)
+                    continue
+
+            if conn is False:
+                return self._open()
+            conn, last_used = conn
+            if self._healthy(conn, last_used):
+                return conn
+            self._discard(conn)
+
+    def putconn(self, conn, close=False):
+        """
+        Return a connection to the pool.
+
+        :param conn: Connection obtained from ``getconn``
+        :param close: Close it instead of keeping it for reuse
+        """
+        if self._pid != os.getpid() or id(conn) not in self._created:
+            # Checked out before a fork; it belongs to the parent.
+            return
+        if not close and not conn.closed:
+            try:
+                if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except psycopg2.Error:
+                close = True
+        if close or conn.closed or self._expired(conn):
+            self._discard(conn)
+            return
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self, timeout=None):
+        """
+        Check out a connection for the duration of a ``with`` block.
+
+        The transaction is rolled back if the block raises.
+        """
+        conn = self.getconn(timeout)
+        try:
+            yield conn
+        except BaseException:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                self.putconn(conn, close=True)
+                raise
+            self.putconn(conn)
+            raise
+        else:
+            self.putconn(conn)
+
+    def fill(self):
+        """
+        Open connections until ``min_size`` are idle or checked out.
+        """
+        self._check_pid()
+        while True:
+            with self._cond:
+                if self._size >= self.min_size:
+                    return
+                self._size += 1
+            conn = self._open()
+            self.putconn(conn)
+
+    def close(self):
+        """
+        Close every idle connection; checked-out ones close when returned.
+        """
+        if self._pid != os.getpid():
+            return
+        with self._cond:
+            idle, self._idle = list(self._idle), deque()
+        for conn, _last_used in idle:
+            self._discard(conn)
+
+    def stats(self):
+        """
+        Return pool counters for monitoring.
+        """
+        with self._cond:
+            return {
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self._size - len(self._idle),
+                'connects': self.connects,
+            }
+
+    def _open(self):
+        try:
+            conn = self._connect(self.dsn)
+        except BaseException:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+        self._created[id(conn)] = time.monotonic()
+        self.connects += 1
+        return conn
+
+    def _take_idle(self):
+        while self._idle:
+            conn, last_used = self._idle.pop()
+            if conn.closed or self._expired(conn):
+                self._created.pop(id(conn), None)
+                self._size -= 1
+                _close_quietly(conn)
+                continue
+            return conn, last_used
+        return None
+
+    def _healthy(self, conn, last_used):
+        if time.monotonic() - last_used < self.health_check_after:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _expired(self, conn):
+        created = self._created.get(id(conn))
+        return created is None or time.monotonic() - created > self.max_lifetime
+
+    def _discard(self, conn):
+        _close_quietly(conn)
+        with self._cond:
+            if self._created.pop(id(conn), None) is not None:
+                self._size -= 1
+            self._cond.notify()
+
+    def _check_pid(self):
+        if self._pid != os.getpid():
+            self._after_fork()
+
+    def _after_fork(self):
+        self._orphans.extend(conn for conn, _last_used in self._idle)
+        self._cond = threading.Condition()
+        self._reset_state()
+
+
+def _close_quietly(conn):
+    try:
+        conn.close()
+    except psycopg2.Error:
+        pass
+
+
+_pools = weakref.WeakSet()
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+def get_pool(dsn, **options):
+    """
+    Return the process-wide pool for a connection string.
+
+    Options only apply when the pool is first created.
+
+    :param dsn: psycopg2 connection string
+    :return: ConnectionPool shared by every caller with the same dsn
+    """
+    pool = _registry.get(dsn)
+    if pool is None:
+        with _registry_lock:
+            pool = _registry.get(dsn)
+            if pool is None:
+                pool = _registry[dsn] = ConnectionPool(dsn, **options)
+                created = True
+            else:
+                created = False
+        if created:
+            pool.fill()
+    return pool
+
+
+def close_all():
+    """
+    Close the idle connections of every pool in this process.
+    """
+    for pool in list(_pools):
+        pool.close()
+
+
+def _before_fork():
+    # Idle connections can't be shared with a child; closing them here means
+    # neither process inherits a socket the other is still using.
+    close_all()
+
+
+def _after_fork_in_child():
+    global _registry_lock
+    _registry_lock = threading.Lock()
+    for pool in list(_pools):
+        pool._after_fork()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(before=_before_fork, after_in_child=_after_fork_in_child)
@@ -0,0 +1,216 @@
+import time
+from collections import defaultdict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import psycopg2
+
+
+DDLOperation = namedtuple("DDLOperation", "name parent sql concurrent cleanup",
+                          defaults=(None,))
+
+
+def shard_sql(table_name, shard_key):
+    """
+    :return: Name and statement of a shard table
+    """
+    name = f"{table_name}_{shard_key}"
+    return name, f"CREATE TABLE IF NOT EXISTS {name} (LIKE {table_name} INCLUDING ALL);"
+
+
+def index_sql(table_name, index_name, column_name, concurrently=True):
+    """
+    :return: Name and statement of an index
+    """
+    return index_name, (f"CREATE INDEX {'CONCURRENTLY ' if concurrently else ''}"
+                        f"IF NOT EXISTS {index_name} ON {table_name} ({column_name});")
+
+
+def partition_sql(table_name, partition_key):
+    """
+    :return: Name and statement of a LIST partition
+    """
+    name = f"{table_name}_p{partition_key}"
+    return name, (f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table_name} "
+                  f"FOR VALUES IN ({partition_key});")
+
+
+class DDLPlan:
+    """
+    Collects DDL operations and applies the missing ones in few round trips.
+
+    ``execute`` reads the catalog once for every object in the plan and drops
+    the operations whose object already exists. What remains runs level by
+    level: objects whose parent is created by the same plan wait for the
+    level before. An index left INVALID by a failed concurrent build counts
+    as missing and is dropped before it's built again. Within a level, all operations on one parent table go to
+    the same worker, so workers don't queue on each other's locks; each
+    worker sends its operations in batches of ``batch_size`` statements with
+    one commit each.
+    """
+
+    def __init__(self):
+        self.operations = {}
+
+    def __len__(self):
+        return len(self.operations)
+
+    def add(self, name, sql, parent=None, concurrent=False):
+        """
+        Add a statement creating ``name``; later duplicates are ignored.
+
+        :param name: Name of the object the statement creates
+        :param sql: Idempotent statement (``IF NOT EXISTS``)
+        :param parent: Table the object belongs to
+        :param concurrent: The statement can't run inside a transaction
+        """
+        self.operations.setdefault(name, DDLOperation(name, parent, sql, concurrent))
+        return self
+
+    def create_shard(self, table_name, shard_key):
+        return self.add(*shard_sql(table_name, shard_key), parent=table_name)
+
+    def create_index(self, table_name, index_name, column_name, concurrently=True):
+        return self.add(*index_sql(table_name, index_name, column_name, concurrently),
+                        parent=table_name, concurrent=concurrently)
+
+    def create_partition(self, table_name, partition_key):
+        return self.add(*partition_sql(table_name, partition_key), parent=table_name)
+
+    def pending(self, existing):
+        """
+        Return the operations whose object isn't in ``existing``.
+        """
+        return [op for op in self.operations.values() if op.name.lower() not in existing]
+
+    def levels(self, operations):
+        """
+        Split operations into levels that can run once the previous ones
+        are done, each as ``{parent: [operations]}``.
+        """
+        by_name = {op.name: op for op in operations}
+        depth = {}
+
+        def level(op):
+            if op.name not in depth:
+                parent = by_name.get(op.parent)
+                depth[op.name] = 0 if parent is None or parent is op else level(parent) + 1
+            return depth[op.name]
+
+        levels = defaultdict(lambda: defaultdict(list))
+        for op in operations:
+            levels[level(op)][op.parent].append(op)
+        return [dict(levels[index]) for index in sorted(levels)]
+
+    def execute(self, pool, workers=4, batch_size=200):
+        """
+        Apply the plan.
+
+        :param pool: ConnectionPool of the database
+        :param workers: Parallel workers, at most the pool size
+        :param batch_size: Statements per transaction
+        :return: Dict with created, skipped and failed objects, the number
+            of transactions and the elapsed seconds
+        """
+        started = time.perf_counter()
+        existing, invalid = catalog_snapshot(pool, list(self.operations))
+        pending = [_rebuild(op) if op.name.lower() in invalid else op
+                   for op in self.pending(existing)]
+        result = {"created": [], "skipped": len(self.operations) - len(pending),
+                  "failed": {}, "transactions": 0}
+        workers = max(1, min(workers, pool.max_size))
+        with ThreadPoolExecutor(workers) as executor:
+            for level in self.levels(pending):
+                jobs = [executor.submit(_apply_group, pool, bucket, batch_size)
+                        for bucket in _buckets(level.values(), workers)]
+                for job in jobs:
+                    created, failed, transactions = job.result()
+                    result["created"].extend(created)
+                    result["failed"].update(failed)
+                    result["transactions"] += transactions
+        result["seconds"] = round(time.perf_counter() - started, 3)
+        return result
+
+
+def catalog_snapshot(pool, names):
+    """
+    Return which of ``names`` already exist as relations (tables, indexes,
+    partitions) in the current schema, with one catalog query.
+
+    :return: Names of the usable relations, and names of the indexes a
+        failed ``CREATE INDEX CONCURRENTLY`` left INVALID
+    """
+    with pool.connection() as conn, conn.cursor() as cursor:
+        cursor.execute("SELECT c.relname, coalesce(i.indisvalid, true) FROM pg_class c "
+                       "LEFT JOIN pg_index i ON i.indexrelid = c.oid "
+                       "WHERE c.relnamespace = current_schema()::regnamespace "
+                       "AND c.relname = ANY(%s)", [[name.lower() for name in names]])
+        rows = cursor.fetchall()
+        conn.rollback()
+    existing = {name for name, valid in rows if valid}
+    invalid = {name for name, valid in rows if not valid}
+    return existing, invalid
+
+
+def _rebuild(op):
+    # IF NOT EXISTS would keep the invalid index, so drop it first.
+    drop = f"DROP INDEX {'CONCURRENTLY ' if op.concurrent else ''}IF EXISTS {op.name};"
+    return op._replace(cleanup=drop)
+
+
+def _statements(op):
+    return [sql for sql in (op.cleanup, op.sql) if sql]
+
+
+def _buckets(groups, count):
+    # Largest groups first, each to the least loaded worker.
+    buckets = [[] for _ in range(count)]
+    for group in sorted(groups, key=len, reverse=True):
+        min(buckets, key=len).extend(group)
+    return [bucket for bucket in buckets if bucket]
+
+
+def _apply_group(pool, operations, batch_size):
+    created, failed, transactions = [], {}, 0
+    transactional = [op for op in operations if not op.concurrent]
+    with pool.connection() as conn:
+        for start in range(0, len(transactional), batch_size):
+            batch = transactional[start:start + batch_size]
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute("\n".join(sql for op in batch for sql in _statements(op)))
+                conn.commit()
+                transactions += 1
+                created.extend(op.name for op in batch)
+                continue
+            except psycopg2.Error:
+                conn.rollback()
+            # Find the failing statements; the rest of the batch still goes in.
+            for op in batch:
+                transactions += 1
+                try:
+                    with conn.cursor() as cursor:
+                        cursor.execute("\n".join(_statements(op)))
+                    conn.commit()
+                    created.append(op.name)
+                except psycopg2.Error as exc:
+                    conn.rollback()
+                    failed[op.name] = str(exc).strip()
+
+        concurrent = [op for op in operations if op.concurrent]
+        if concurrent:
+            conn.autocommit = True
+            try:
+                for op in concurrent:
+                    transactions += 1
+                    try:
+                        with conn.cursor() as cursor:
+                            # Each statement on its own: CONCURRENTLY can't
+                            # run in a multi-statement query.
+                            for sql in _statements(op):
+                                cursor.execute(sql)
+                        created.append(op.name)
+                    except psycopg2.Error as exc:
+                        failed[op.name] = str(exc).strip()
+            finally:
+                conn.autocommit = False
+    return created, failed, transactions
@@ -0,0 +1,412 @@
+import hashlib
+import json
+import re
+from collections import defaultdict, namedtuple
+
+import sqlparse
+from sqlparse import tokens as T
+from sqlparse.sql import Identifier, IdentifierList, Where
+
+
+QueryShape = namedtuple("QueryShape", "key sql calls total_ms")
+ExistingIndex = namedtuple(
+    "ExistingIndex", "table name columns scans size unique partial")
+
+MAX_NAME_LENGTH = 63
+
+_PREDICATE = re.compile(
+    r"(?<![\w.])(?:(\w+)\.)?(\w+)\s*"
+    r"(=|<>|!=|<=|>=|<|>|\bIN\b|\bIS\b|\bLIKE\b|\bBETWEEN\b)",
+    re.IGNORECASE)
+_QUALIFIED = re.compile(r"(?<![\w.])(\w+)\.(\w+)")
+_COLUMN = re.compile(r"^(?:(\w+)\.)?(\w+)(?:\s+(?:ASC|DESC))?(?:\s+NULLS\s+\w+)?$",
+                     re.IGNORECASE)
+_EQUALITY = {"=", "IN", "IS"}
+_RANGE = {"<", ">", "<=", ">=", "BETWEEN", "LIKE"}
+_KEYWORDS = {"AND", "OR", "NOT", "NULL", "TRUE", "FALSE", "ANY", "ALL", "EXISTS"}
+_TABLE_KEYWORDS = {"FROM", "JOIN", "UPDATE", "INTO"}
+_CLAUSES = {"WHERE", "SET", "ON", "USING", "ORDER BY", "GROUP BY", "HAVING",
+            "LIMIT", "OFFSET", "VALUES", "RETURNING", "AS", "FOR"}
+
+
+class ColumnUsage:
+    """
+    How one statement filters, joins and sorts the columns of one table.
+    """
+
+    def __init__(self):
+        self.equality = []
+        self.range = []
+        self.order = []
+        self.join = []
+
+    def add(self, bucket, column):
+        columns = getattr(self, bucket)
+        if column not in columns:
+            columns.append(column)
+
+    def candidates(self, max_columns=3):
+        """
+        Return the column lists of the indexes that serve this usage best:
+        equality columns first, then one range column or the sort columns;
+        and the join columns on their own, for when this is the inner side
+        of a nested loop.
+        """
+        columns = sorted(self.equality)
+        if self.range:
+            columns.append(self.range[0])
+        else:
+            columns.extend(c for c in self.order if c not in columns)
+        candidates = [tuple(columns[:max_columns])] if columns else []
+        if self.join:
+            candidates.append(tuple(sorted(self.join)[:max_columns]))
+        return candidates
+
+
+def column_usage(sql):
+    """
+    Find the indexable columns of a statement, per table.
+
+    Only plain column references count: ``lower(email) = ?`` can't use an
+    index on ``email``. Unqualified columns are attributed to the table when
+    the statement reads a single table and ignored otherwise.
+
+    :param sql: SQL text or normalized shape
+    :return: Dict of table name to ColumnUsage
+    """
+    statement = sqlparse.parse(sql)[0]
+    aliases = {}
+    filters = []
+    joins = []
+    order = []
+    clause = None
+    for token in statement.tokens:
+        if token.is_whitespace:
+            continue
+        if token.ttype in T.Keyword and not (
+                clause == "table" and token.normalized not in _CLAUSES
+                and token.value.isidentifier()):
+            keyword = token.normalized
+            clause = ("table" if keyword.split()[-1] in _TABLE_KEYWORDS
+                      else keyword)
+            continue
+        if isinstance(token, Where):
+            filters.append(str(token))
+        elif clause == "table":
+            if token.ttype in T.Keyword:
+                # Table names sqlparse knows as keywords, e.g. events.
+                aliases[token.value] = token.value
+            for identifier in _identifiers(token):
+                name = identifier.get_real_name()
+                if name:
+                    aliases[identifier.get_alias() or name] = name
+                    aliases[name] = name
+        elif clause == "ORDER BY":
+            order.extend(str(identifier) for identifier in _identifiers(token))
+        elif clause == "ON":
+            joins.append(str(token))
+        clause = None if clause == "table" else clause
+
+    tables = set(aliases.values())
+    usage = defaultdict(ColumnUsage)
+
+    def resolve(qualifier, column):
+        if qualifier:
+            return aliases.get(qualifier)
+        return next(iter(tables)) if len(tables) == 1 else None
+
+    for text in filters:
+        for qualifier, column, operator in _PREDICATE.findall(text.replace('"', "")):
+            table = resolve(qualifier, column)
+            operator = operator.upper()
+            if table is None or column.upper() in _KEYWORDS:
+                continue
+            if operator in _EQUALITY:
+                usage[table].add("equality", column)
+            elif operator in _RANGE:
+                usage[table].add("range", column)
+    for text in joins:
+        for qualifier, column in _QUALIFIED.findall(text.replace('"', "")):
+            table = aliases.get(qualifier)
+            if table is not None:
+                usage[table].add("join", column)
+    for text in order:
+        match = _COLUMN.match(text.replace('"', "").strip())
+        if match:
+            table = resolve(match[1], match[2])
+            if table is not None:
+                usage[table].add("order", match[2])
+    return dict(usage)
+
+
+def _identifiers(token):
+    if isinstance(token, IdentifierList):
+        return [t for t in token.get_identifiers() if isinstance(t, Identifier)]
+    if isinstance(token, Identifier):
+        return [token]
+    return []
+
+
+class Recommendation:
+    """
+    An index the advisor proposes, with the queries it should speed up.
+    """
+
+    def __init__(self, table, columns):
+        self.table = table
+        self.columns = tuple(columns)
+        self.benefit_ms = 0.0
+        self.queries = {}
+
+    @property
+    def name(self):
+        name = f"{self.table}_{'_'.join(self.columns)}_idx"
+        if len(name) > MAX_NAME_LENGTH:
+            digest = hashlib.md5(name.encode()).hexdigest()[:8]
+            name = f"{name[:MAX_NAME_LENGTH - 13]}_{digest}_idx"
+        return name
+
+    def covers(self, columns):
+        return self.columns[:len(columns)] == tuple(columns)
+
+    def as_dict(self):
+        return {
+            "table": self.table,
+            "columns": list(self.columns),
+            "name": self.name,
+            "benefit_ms": round(self.benefit_ms, 3),
+            "queries": self.queries,
+        }
+
+
+class IndexAdvisor:
+    """
+    Proposes indexes for a captured workload and flags wasteful ones.
+
+    The benefit of an index is the time its queries spent in total, scaled
+    by how selective the indexed columns are (from ``pg_stats`` when known):
+    an index on a column with two distinct values saves little even on a
+    slow query.
+    """
+
+    def __init__(self, existing=(), n_distinct=None, table_rows=None,
+                 min_rows=1000, max_columns=3):
+        """
+        :param existing: ExistingIndex of every current index
+        :param n_distinct: ``{(table, column): n_distinct}`` as in pg_stats
+        :param table_rows: ``{table: estimated rows}``; smaller tables than
+            ``min_rows`` are skipped, a sequential scan is as good
+        :param min_rows: Smallest table worth indexing
+        :param max_columns: Most columns in a composite index
+        """
+        self.existing = list(existing)
+        self.n_distinct = n_distinct or {}
+        self.table_rows = table_rows or {}
+        self.min_rows = min_rows
+        self.max_columns = max_columns
+
+    def recommend(self, shapes, limit=10):
+        """
+        Rank the indexes that would serve the workload.
+
+        :param shapes: QueryShape of each captured statement
+        :param limit: Number of recommendations to return
+        :return: List of Recommendation, highest benefit first
+        """
+        candidates = {}
+        for shape in shapes:
+            try:
+                usages = column_usage(shape.sql)
+            except Exception:
+                continue
+            for table, usage in usages.items():
+                if self.table_rows.get(table, self.min_rows) < self.min_rows:
+                    continue
+                for columns in usage.candidates(self.max_columns):
+                    if self._covered(table, columns):
+                        continue
+                    key = (table, columns)
+                    if key not in candidates:
+                        candidates[key] = Recommendation(table, columns)
+                    recommendation = candidates[key]
+                    recommendation.benefit_ms += shape.total_ms * self._gain(table, columns)
+                    recommendation.queries[shape.key] = round(
+                        shape.total_ms / max(shape.calls, 1), 3)
+
+        # An index also serves every query using a prefix of its columns.
+        ranked = sorted(candidates.values(), key=lambda r: len(r.columns), reverse=True)
+        merged = []
+        for recommendation in ranked:
+            wider = next((r for r in merged if r.table == recommendation.table
+                          and r.covers(recommendation.columns)), None)
+            if wider is None:
+                merged.append(recommendation)
+            else:
+                wider.benefit_ms += recommendation.benefit_ms
+                wider.queries.update(recommendation.queries)
+        merged.sort(key=lambda r: r.benefit_ms, reverse=True)
+        return merged[:limit]
+
+    def unused(self):
+        """
+        Return the indexes never scanned, except unique and primary keys.
+        """
+        return [index for index in self.existing
+                if index.scans == 0 and not index.unique]
+
+    def duplicates(self):
+        """
+        Return ``(redundant, kept)`` pairs where the redundant index's columns
+        equal or are a prefix of the kept one's.
+        """
+        pairs = []
+        plain = [index for index in self.existing if not index.partial and index.columns]
+        for index in plain:
+            if index.unique:
+                continue
+            for other in plain:
+                if other is index or other.table != index.table:
+                    continue
+                prefix = tuple(other.columns[:len(index.columns)]) == tuple(index.columns)
+                if prefix and (len(other.columns) > len(index.columns)
+                               or other.unique or other.name < index.name):
+                    pairs.append((index, other))
+                    break
+        return pairs
+
+    def _covered(self, table, columns):
+        return any(index.table == table and not index.partial
+                   and tuple(index.columns[:len(columns)]) == columns
+                   for index in self.existing)
+
+    def _gain(self, table, columns):
+        rows = self.table_rows.get(table)
+        matched = None
+        for column in columns:
+            distinct = self.n_distinct.get((table, column))
+            if distinct is None:
+                continue
+            if distinct < 0:
+                # Negative n_distinct is a fraction of the row count.
+                distinct = -distinct * (rows or 1)
+            matched = (1.0 if matched is None else matched) / max(distinct, 1)
+        # Without statistics, assume the index skips half the table.
+        return 0.5 if matched is None else 1 - matched
+
+
+def load_catalog(pool):
+    """
+    Read the current indexes and planner statistics of a PostgreSQL database.
+
+    :param pool: ConnectionPool of the database
+    :return: Keyword arguments for IndexAdvisor
+    """
+    with pool.connection() as conn, conn.cursor() as cursor:
+        cursor.execute(
+            "SELECT s.relname, s.indexrelname, "
+            "ARRAY(SELECT a.attname FROM unnest(i.indkey) WITH ORDINALITY k(attnum, n) "
+            "      JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = k.attnum "
+            "      ORDER BY k.n), "
+            "s.idx_scan, pg_relation_size(s.indexrelid), i.indisunique, "
+            "i.indpred IS NOT NULL OR i.indexprs IS NOT NULL "
+            "FROM pg_stat_user_indexes s JOIN pg_index i ON i.indexrelid = s.indexrelid")
+        existing = [ExistingIndex(*row) for row in cursor.fetchall()]
+        cursor.execute("SELECT tablename, attname, n_distinct FROM pg_stats "
+                       "WHERE schemaname = current_schema()")
+        n_distinct = {(table, column): value for table, column, value in cursor.fetchall()}
+        cursor.execute("SELECT relname, reltuples FROM pg_class "
+                       "WHERE relkind IN ('r', 'p') AND relnamespace = current_schema()::regnamespace")
+        table_rows = dict(cursor.fetchall())
+        conn.rollback()
+    return {"existing": existing, "n_distinct": n_distinct, "table_rows": table_rows}
+
+
+def shapes_from_pg_stat_statements(pool, limit=500, min_calls=2, keys=None):
+    """
+    Read the most expensive statements from ``pg_stat_statements``.
+
+    The extension must be installed (``CREATE EXTENSION pg_stat_statements``
+    and ``shared_preload_libraries``). Counters are cumulative; subtract two
+    readings with ``workload_delta`` to look at a window.
+
+    :param pool: ConnectionPool of the database
+    :param keys: Only read these queryids, however cheap they have become
+    :return: Dict of queryid to QueryShape
+    """
+    if keys is not None:
+        where, params = "queryid::text = ANY(%s)", [list(keys)]
+    else:
+        where, params = "calls >= %s", [min_calls]
+    with pool.connection() as conn, conn.cursor() as cursor:
+        cursor.execute(
+            "SELECT queryid::text, query, calls, total_exec_time "
+            f"FROM pg_stat_statements WHERE {where} AND dbid = "
+            "(SELECT oid FROM pg_database WHERE datname = current_database()) "
+            "ORDER BY total_exec_time DESC LIMIT %s", [*params, limit])
+        rows = cursor.fetchall()
+        conn.rollback()
+    return {key: QueryShape(key, sql, calls, total) for key, sql, calls, total in rows}
+
+
+def shapes_from_slow_log(path, since=None):
+    """
+    Aggregate the records of the app's slow query log (``SLOW_QUERY_LOG``).
+
+    :param path: JSONL file written by ``database.slowlog``
+    :param since: Only count records at or after this UNIX timestamp
+    :return: Dict of shape to QueryShape
+    """
+    totals = defaultdict(lambda: [0, 0.0])
+    try:
+        with open(path, encoding="utf-8") as log_file:
+            for line in log_file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if record.get("type") == "plan" or "shape" not in record:
+                    continue
+                if since is not None and record.get("ts", 0) < since:
+                    continue
+                totals[record["shape"]][0] += 1
+                totals[record["shape"]][1] += record.get("duration_ms", 0.0)
+    except FileNotFoundError:
+        return {}
+    return {shape: QueryShape(shape, shape, calls, total)
+            for shape, (calls, total) in totals.items()}
+
+
+def workload_delta(before, after):
+    """
+    Return the statements run between two cumulative readings.
+    """
+    delta = {}
+    for key, shape in after.items():
+        previous = before.get(key)
+        calls = shape.calls - (previous.calls if previous else 0)
+        if calls > 0:
+            total = shape.total_ms - (previous.total_ms if previous else 0.0)
+            delta[key] = QueryShape(key, shape.sql, calls, total)
+    return delta
+
+
+def improvement(baseline, shapes):
+    """
+    Compare the mean time of queries before and after an index was built.
+
+    :param baseline: ``{query key: mean ms}`` recorded before the build
+    :param shapes: QueryShape per key, measured only after the build
+    :return: Dict per query key with before/after means and the speedup;
+        ``after_ms`` is None when the query didn't run (or, for the slow
+        log, wasn't slow) since the build
+    """
+    report = {}
+    for key, before_ms in baseline.items():
+        shape = shapes.get(key)
+        after_ms = shape.total_ms / shape.calls if shape and shape.calls else None
+        report[key] = {
+            "before_ms": before_ms,
+            "after_ms": None if after_ms is None else round(after_ms, 3),
+            "speedup": round(before_ms / after_ms, 2) if after_ms else None,
+        }
+    return report
@@ -0,0 +1,267 @@
+import re
+from datetime import date, datetime, timedelta
+
+
+DEFAULT_PARTITION_MAINTENANCE = {
+    "CONNECTION_STRING": None,
+    "SCHEDULE": 3600,
+    "POLICIES": [],
+}
+
+INTERVALS = ("day", "week", "month")
+
+_RANGE_BOUND = re.compile(r"FROM \('([^']*)'\) TO \('([^']*)'\)")
+_LIST_BOUND = re.compile(r"IN \((.*)\)", re.DOTALL)
+# pg_get_expr quotes strings and dates but not numbers, and may add casts:
+# IN ('a', 'it''s'), IN (3, -4), IN ('x'::text).
+_LIST_VALUE = re.compile(r"\s*(?:'((?:[^']|'')*)'|([^,':\s]+))(?:::[\w ]+)?\s*(?:,|$)")
+
+
+class PartitionPolicy:
+    """
+    Declarative description of how one partitioned table is maintained.
+
+    RANGE tables get one partition per day, week or month, ``premake``
+    intervals ahead of today; partitions that ended more than ``retention``
+    intervals ago are detached (or dropped, with ``expire="drop"``). LIST
+    tables get one partition per value in ``values``; partitions whose values
+    were all removed from the policy expire.
+    """
+
+    def __init__(self, table, column, strategy="range", interval="month",
+                 premake=3, retention=None, expire="detach", values=(),
+                 detach_concurrently=False):
+        """
+        :param table: Partitioned (parent) table
+        :param column: Partition key column
+        :param strategy: "range" or "list"
+        :param interval: Width of a RANGE partition: "day", "week" or "month"
+        :param premake: RANGE partitions to keep ready after the current one
+        :param retention: RANGE partitions to keep before the current one,
+            None to keep all
+        :param expire: "detach" or "drop" expired partitions
+        :param values: Values that get a LIST partition each
+        :param detach_concurrently: Use DETACH PARTITION CONCURRENTLY
+            (PostgreSQL 14+) so the parent is not locked exclusively
+        """
+        if strategy not in ("range", "list"):
+            raise ValueError(f"Unknown partitioning strategy {strategy!r}.")
+        if interval not in INTERVALS:
+            raise ValueError(f"Interval must be one of {', '.join(INTERVALS)}.")
+        if expire not in ("detach", "drop"):
+            raise ValueError("expire must be 'detach' or 'drop'.")
+        self.table = table
+        self.column = column
+        self.strategy = strategy
+        self.interval = interval
+        self.premake = premake
+        self.retention = retention
+        self.expire = expire
+        self.values = list(values)
+        self.detach_concurrently = detach_concurrently
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        Build a policy from a settings dict with upper-case keys.
+        """
+        return cls(**{key.lower(): value for key, value in config.items()})
+
+    def partition_name(self, bound):
+        """
+        Return the name of the partition starting at (or holding) ``bound``.
+        """
+        if self.strategy == "range":
+            return f"{self.table}_p{bound:%Y%m%d}"
+        return f"{self.table}_p{bound}"
+
+    def wanted(self, today=None):
+        """
+        Return the partitions that should exist, as ``{name: bound}``.
+
+        A RANGE bound is a ``(start, end)`` date pair, a LIST bound its value.
+        """
+        if self.strategy == "list":
+            return {self.partition_name(value): value for value in self.values}
+        current = floor_date(today or date.today(), self.interval)
+        wanted = {}
+        start = current
+        for _ in range(self.premake + 1):
+            end = next_date(start, self.interval)
+            wanted[self.partition_name(start)] = (start, end)
+            start = end
+        return wanted
+
+    def expired(self, existing, today=None):
+        """
+        Return the names of existing partitions past retention.
+
+        :param existing: ``{name: bound expression}`` as returned by
+            ``pg_get_expr(relpartbound, oid)``
+        """
+        expired = []
+        if self.strategy == "list":
+            keep = {str(value) for value in self.values}
+            for name, bound in existing.items():
+                values = list_bound_values(bound)
+                if values and not keep.intersection(values):
+                    expired.append(name)
+            return sorted(expired)
+        if self.retention is None:
+            return []
+        cutoff = floor_date(today or date.today(), self.interval)
+        for _ in range(self.retention):
+            cutoff = previous_date(cutoff, self.interval)
+        for name, bound in existing.items():
+            match = _RANGE_BOUND.search(bound)
+            if match and date.fromisoformat(match[2][:10]) <= cutoff:
+                expired.append(name)
+        return sorted(expired)
+
+    def predicate(self, start=None, end=None, alias=None):
+        """
+        Return ``(sql, params)`` filtering on the partition key so the
+        planner can prune partitions.
+
+        Pruning at planning time only happens when the partition column is
+        compared directly (not through a function such as ``date(col)``) to
+        values of its own type, which is what this builds. For RANGE tables
+        ``start`` is inclusive and ``end`` exclusive; for LIST tables
+        ``start`` is a value or a list of values.
+
+        :param alias: Table alias to qualify the column with
+        """
+        column = f"{alias}.{self.column}" if alias else self.column
+        if self.strategy == "list":
+            values = list(start) if isinstance(start, (list, tuple, set)) else [start]
+            return f"{column} = ANY(%s)", [values]
+        clauses, params = [], []
+        if start is not None:
+            clauses.append(f"{column} >= %s")
+            params.append(start)
+        if end is not None:
+            clauses.append(f"{column} < %s")
+            params.append(end)
+        if not clauses:
+            raise ValueError("A RANGE predicate needs a start or an end.")
+        return " AND ".join(clauses), params
+
+
+def list_bound_values(bound):
+    """
+    Return the values of a LIST partition bound as strings.
+
+    :param bound: Bound expression, e.g. ``FOR VALUES IN (3, 4)``
+    :return: Values without NULL; empty for DEFAULT or unparsable bounds
+    """
+    match = _LIST_BOUND.search(bound)
+    if not match:
+        return []
+    values = []
+    for quoted, bare in _LIST_VALUE.findall(match[1]):
+        if bare:
+            if bare.upper() != "NULL":
+                values.append(bare)
+        else:
+            values.append(quoted.replace("''", "'"))
+    return values
+
+
+def existing_partitions(pool, table_name):
+    """
+    List the partitions attached to a table.
+
+    :param pool: ConnectionPool of the database
+    :param table_name: Name of the partitioned table
+    :return: Dict of partition name to its bound expression
+    """
+    with pool.connection() as conn, conn.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) "
+            "FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = %s::regclass", [table_name])
+        return dict(cursor.fetchall())
+
+
+def maintain_partitions(pool, policy, today=None):
+    """
+    Create the partitions a policy wants and expire the old ones.
+
+    :param pool: ConnectionPool of the database
+    :param policy: PartitionPolicy of the table
+    :param today: Date to plan from, defaults to today
+    :return: Dict with the created, detached and dropped partition names
+    """
+    existing = existing_partitions(pool, policy.table)
+    result = {"created": [], "detached": [], "dropped": []}
+    with pool.connection() as conn, conn.cursor() as cursor:
+        for name, bound in policy.wanted(today).items():
+            if name in existing:
+                continue
+            if policy.strategy == "range":
+                cursor.execute(f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF "
+                               f"{policy.table} FOR VALUES FROM (%s) TO (%s);", bound)
+            else:
+                cursor.execute(f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF "
+                               f"{policy.table} FOR VALUES IN (%s);", [bound])
+            conn.commit()
+            result["created"].append(name)
+
+    for name in policy.expired(existing, today):
+        detach_partition(pool, policy.table, name, policy.detach_concurrently)
+        result["detached"].append(name)
+        if policy.expire == "drop":
+            with pool.connection() as conn, conn.cursor() as cursor:
+                cursor.execute(f"DROP TABLE IF EXISTS {name};")
+                conn.commit()
+            result["dropped"].append(name)
+    return result
+
+
+def detach_partition(pool, table_name, partition_name, concurrently=False):
+    """
+    Detach a partition, leaving it as a standalone table.
+
+    :param pool: ConnectionPool of the database
+    :param table_name: Name of the partitioned table
+    :param partition_name: Name of the partition
+    :param concurrently: Use DETACH PARTITION CONCURRENTLY, which must run
+        outside a transaction but doesn't block queries on the parent
+    """
+    with pool.connection() as conn:
+        if concurrently:
+            conn.autocommit = True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(f"ALTER TABLE {table_name} DETACH PARTITION "
+                               f"{partition_name}{' CONCURRENTLY' if concurrently else ''};")
+            if not concurrently:
+                conn.commit()
+        finally:
+            conn.autocommit = False
+
+
+def floor_date(value, interval):
+    if isinstance(value, datetime):
+        value = value.date()
+    if interval == "week":
+        return value - timedelta(days=value.weekday())
+    if interval == "month":
+        return value.replace(day=1)
+    return value
+
+
+def next_date(value, interval):
+    if interval == "day":
+        return value + timedelta(days=1)
+    if interval == "week":
+        return value + timedelta(weeks=1)
+    return (value.replace(day=1) + timedelta(days=32)).replace(day=1)
+
+
+def previous_date(value, interval):
+    if interval == "day":
+        return value - timedelta(days=1)
+    if interval == "week":
+        return value - timedelta(weeks=1)
+    return (value.replace(day=1) - timedelta(days=1)).replace(day=1)
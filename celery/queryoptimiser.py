@@ -1,4 +1,29 @@
-import psycopg2
+import logging
+import time
+import uuid
+from datetime import datetime, timezone
+
+from celery import Celery
+
+from connection_pool import get_pool
+from ddl_plan import DDLPlan, index_sql, partition_sql, shard_sql
+from index_advisor import (
+    IndexAdvisor, QueryShape, improvement, load_catalog,
+    shapes_from_pg_stat_statements, shapes_from_slow_log, workload_delta,
+)
+from partition_maintenance import (
+    DEFAULT_PARTITION_MAINTENANCE, PartitionPolicy, maintain_partitions,
+)
+from rebalance import Endpoint, Rebalancer
+from scatter_gather import ScatterGather, ShardTarget
+
+
+logger = logging.getLogger(__name__)
+
+# Rebalance tasks report progress through update_state, so the app needs a
+# result backend as well as a broker.
+app = Celery("queryoptimiser", broker="pyamqp://localhost//", backend="rpc://")
+
 
 class ShardingManager:
     """
@@ -6,7 +31,7 @@ class ShardingManager:
     """
 
     def __init__(self, connection_string):
-        self.conn = psycopg2.connect(connection_string)
+        self.pool = get_pool(connection_string)
     
     def create_shard(self, table_name, shard_key):
         """
@@ -16,12 +41,38 @@ class ShardingManager:
         :param shard_key: Key to determine the shard
         :return: Shard creation result
         """
-        with self.conn.cursor() as cursor:
-            shard_table_name = f"{table_name}_{shard_key}"
-            cursor.execute(f"CREATE TABLE IF NOT EXISTS {shard_table_name} (LIKE {table_name} INCLUDING ALL);")
-            self.conn.commit()
+        with self.pool.connection() as conn, conn.cursor() as cursor:
+            shard_table_name, sql = shard_sql(table_name, shard_key)
+            cursor.execute(sql)
+            conn.commit()
             return f"Shard {shard_table_name} created."
 
+    def create_shards(self, table_name, shard_keys):
+        """
+        Create one shard table per shard in the shard map.
+
+        Table names match ``core.sharding``: ``<table>_<table suffix>``.
+
+        :param table_name: Name of the table to shard
+        :param shard_keys: Table suffixes of every shard
+        :return: List of shard creation results
+        """
+        return [self.create_shard(table_name, shard_key) for shard_key in shard_keys]
+
+    def scatter_gather(self, table_name, shard_keys, **options):
+        """
+        Query every shard table of a table concurrently.
+
+        :param table_name: Name of the sharded table
+        :param shard_keys: Table suffixes of the shards to query
+        :param options: timeout, policy, fetch_size and max_workers of
+            ScatterGather
+        :return: ScatterGather whose queries name the shard table ``{table}``
+        """
+        targets = [ShardTarget(shard_key, self.pool.dsn, f"{table_name}_{shard_key}")
+                   for shard_key in shard_keys]
+        return ScatterGather(targets, **options)
+
 
 class IndexingManager:
     """
@@ -29,22 +80,60 @@ class IndexingManager:
     """
 
     def __init__(self, connection_string):
-        self.conn = psycopg2.connect(connection_string)
+        self.pool = get_pool(connection_string)
 
-    def create_index(self, table_name, index_name, column_name):
+    def create_index(self, table_name, index_name, column_name, concurrently=True):
         """
         Create an index on a given table and column.
         
         :param table_name: Name of the table
         :param index_name: Name of the index
-        :param column_name: Column to index
+        :param column_name: Column to index, or comma-separated columns
+        :param concurrently: Build with CONCURRENTLY so writes to the table
+            aren't blocked; it can't run inside a transaction
         :return: Index creation result
         """
-        with self.conn.cursor() as cursor:
-            cursor.execute(f"CREATE INDEX IF NOT EXISTS {index_name} ON {table_name} ({column_name});")
-            self.conn.commit()
+        with self.pool.connection() as conn:
+            conn.autocommit = concurrently
+            try:
+                with conn.cursor() as cursor:
+                    if concurrently:
+                        # A failed concurrent build leaves an INVALID index
+                        # behind, which IF NOT EXISTS would silently keep.
+                        cursor.execute(
+                            "SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+                            "WHERE c.relname = %s AND NOT i.indisvalid", [index_name])
+                        if cursor.fetchone():
+                            cursor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {index_name};")
+                    cursor.execute(index_sql(table_name, index_name, column_name, concurrently)[1])
+                if not concurrently:
+                    conn.commit()
+            finally:
+                conn.autocommit = False
             return f"Index {index_name} created on {table_name}({column_name})."
 
+    def advise(self, slow_log_path=None, limit=10):
+        """
+        Recommend indexes for the captured workload and list wasteful ones.
+
+        :param slow_log_path: Read the app's slow query log instead of
+            ``pg_stat_statements``
+        :param limit: Number of recommendations
+        :return: Dict of recommendations, unused and duplicate indexes
+        """
+        advisor = IndexAdvisor(**load_catalog(self.pool))
+        if slow_log_path:
+            shapes = shapes_from_slow_log(slow_log_path)
+        else:
+            shapes = shapes_from_pg_stat_statements(self.pool)
+        return {
+            "recommendations": [r.as_dict() for r in advisor.recommend(shapes.values(), limit)],
+            "unused": [index._asdict() for index in advisor.unused()],
+            "duplicates": [{"redundant": redundant.name, "covered_by": kept.name,
+                            "table": redundant.table, "size": redundant.size}
+                           for redundant, kept in advisor.duplicates()],
+        }
+
 
 class PartitioningManager:
     """
@@ -52,7 +141,7 @@ class PartitioningManager:
     """
 
     def __init__(self, connection_string):
-        self.conn = psycopg2.connect(connection_string)
+        self.pool = get_pool(connection_string)
 
     def create_partition(self, table_name, partition_key):
         """
@@ -62,13 +151,22 @@ class PartitioningManager:
         :param partition_key: Key to determine the partition
         :return: Partition creation result
         """
-        with self.conn.cursor() as cursor:
-            # Example logic to create a partition
-            partition_table_name = f"{table_name}_p{partition_key}"
-            cursor.execute(f"CREATE TABLE IF NOT EXISTS {partition_table_name} PARTITION OF {table_name} FOR VALUES IN ({partition_key});")
-            self.conn.commit()
+        with self.pool.connection() as conn, conn.cursor() as cursor:
+            partition_table_name, sql = partition_sql(table_name, partition_key)
+            cursor.execute(sql)
+            conn.commit()
             return f"Partition {partition_table_name} created."
 
+    def maintain(self, policy, today=None):
+        """
+        Create the partitions a policy wants and expire the old ones.
+
+        :param policy: PartitionPolicy of the table
+        :param today: Date to plan from, defaults to today
+        :return: Dict with the created, detached and dropped partition names
+        """
+        return maintain_partitions(self.pool, policy, today)
+
 
 @app.task
 def shard_table_task(connection_string, table_name, shard_key):
@@ -109,3 +207,269 @@ def create_partition_task(connection_string, table_name, partition_key):
     """
     manager = PartitioningManager(connection_string)
     return manager.create_partition(table_name, partition_key)
+
+
+@app.task
+def execute_ddl_plan_task(connection_string, operations, workers=4, batch_size=200):
+    """
+    Task to create many shards, indexes and partitions at once.
+
+    Use it instead of one ``shard_table_task``/``create_index_task``/
+    ``create_partition_task`` per object when provisioning a tenant: objects
+    that already exist are skipped after a single catalog read, and the rest
+    are created in batched transactions by parallel workers.
+
+    :param connection_string: Connection string to the PostgreSQL database
+    :param operations: ``[method, *args]`` lists, e.g.
+        ``["create_index", "orders_t1", "orders_t1_customer_idx", "customer_id"]``;
+        methods are create_shard, create_index and create_partition. Indexes
+        are built CONCURRENTLY unless a fifth ``false`` argument is given
+    :param workers: Parallel workers
+    :param batch_size: Statements per transaction
+    :return: Created, skipped and failed objects
+    """
+    plan = DDLPlan()
+    for method, *args in operations:
+        if method not in ("create_shard", "create_index", "create_partition"):
+            raise ValueError(f"Unknown DDL operation {method!r}.")
+        getattr(plan, method)(*args)
+    return plan.execute(get_pool(connection_string), workers, batch_size)
+
+
+def _rebalancer(task, source_dsn, target_dsn, table_name, source_shard,
+                target_shard, shards, key_column, job_id, **options):
+    # Imported here so the managers above stay usable without Django; the
+    # worker has Django configured, and moving keys must be computed with
+    # exactly the ring the application routes with.
+    from core.sharding import HashRing, get_config, get_shard_map
+
+    vnodes = options.pop("vnodes", None) or get_config()["VNODES"]
+    ring = HashRing(shards, vnodes)
+    # The map still in use tells the target's own rows from copied ones.
+    current = get_shard_map().ring
+    reports = {}
+
+    def progress(report):
+        reports[str(report["range"][0])] = report
+        task.update_state(state="PROGRESS", meta={"job_id": job_id, "ranges": reports})
+
+    return Rebalancer(
+        Endpoint(source_dsn), Endpoint(target_dsn),
+        f"{table_name}_{shards[source_shard].get('TABLE_SUFFIX', source_shard)}",
+        f"{table_name}_{shards[target_shard].get('TABLE_SUFFIX', target_shard)}",
+        key_column, lambda key: ring.lookup(key) == target_shard, job_id,
+        progress=progress,
+        source_owns=(lambda key: current.lookup(key) == source_shard) if current else None,
+        **options)
+
+
+def _since(since):
+    # Task results go through JSON, so started_at arrives as an ISO string;
+    # the rebalancer needs a datetime to compare it with the column's values.
+    if not since:
+        return None
+    column, value = since
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return column, value
+
+
+@app.task(bind=True)
+def rebalance_shard_task(self, source_dsn, target_dsn, table_name, source_shard,
+                         target_shard, shards, key_column, job_id=None, **options):
+    """
+    Task to copy the rows of a table that move to a new shard.
+
+    The copy is resumable: re-running it with the same job_id skips the
+    ranges already copied. Progress is reported per range in the task's
+    PROGRESS state. Run ``cutover_shard_task`` afterwards to switch over.
+
+    :param source_dsn: Connection string of the source shard's database
+        (``sqlite:///path`` for SQLite)
+    :param target_dsn: Connection string of the target shard's database
+    :param table_name: Base name of the sharded table
+    :param source_shard: Name of the shard giving up keys
+    :param target_shard: Name of the shard receiving keys
+    :param shards: New shard map, same format as SHARDING["SHARDS"]
+    :param key_column: Column holding the shard key
+    :param job_id: Checkpoint namespace; a new job is started if omitted
+    :param options: order_column, chunk_size, range_size, rows_per_second, vnodes
+    :return: Job id, start time (for the cutover catch-up) and range reports
+    """
+    job_id = job_id or uuid.uuid4().hex
+    started_at = datetime.now(timezone.utc).isoformat()
+    rebalancer = _rebalancer(self, source_dsn, target_dsn, table_name, source_shard,
+                             target_shard, shards, key_column, job_id, **options)
+    try:
+        reports = rebalancer.run()
+    finally:
+        rebalancer.source.close()
+        rebalancer.target.close()
+    return {"job_id": job_id, "started_at": started_at, "ranges": reports}
+
+
+@app.task(bind=True)
+def cutover_shard_task(self, source_dsn, target_dsn, table_name, source_shard,
+                       target_shard, shards, key_column, job_id, since=None,
+                       freeze_seconds=60, delete_source=True, **options):
+    """
+    Task to switch a table's moved keys over to their new shard.
+
+    Writes to sharded models are frozen, rows written during the copy are
+    copied again, the new shard map is published and writes resume. The
+    freeze lasts as long as the catch-up pass, so pass ``since`` whenever
+    the table has a modification timestamp. Rows deleted from the source
+    during the copy are deleted from the target. If the freeze expired
+    before the catch-up finished, the map is not published.
+
+    :param since: ``(column, value)`` limiting the catch-up to rows with
+        ``column >= value``, e.g. ``("updated_at", result["started_at"])``;
+        string values are parsed as ISO datetimes
+    :param freeze_seconds: Upper bound on the write freeze if this task dies
+    :param delete_source: Delete the moved rows from the source afterwards
+    :return: Published shard map version, catch-up reports and rows deleted
+    """
+    from core import sharding
+
+    rebalancer = _rebalancer(self, source_dsn, target_dsn, table_name, source_shard,
+                             target_shard, shards, key_column, job_id, **options)
+    try:
+        sharding.freeze_writes(freeze_seconds)
+        try:
+            # Let every process notice the freeze before the last copy.
+            time.sleep(sharding.get_config()["REFRESH_INTERVAL"])
+            reports = rebalancer.catch_up(_since(since))
+            if not sharding.extend_freeze(freeze_seconds):
+                raise RuntimeError(
+                    "The write freeze expired before the catch-up finished; rows "
+                    "may have been written to the source since. Run the cutover "
+                    "again with a larger freeze_seconds.")
+            version = sharding.publish_shard_map(shards, options.get("vnodes"))
+        finally:
+            sharding.thaw_writes()
+        deleted = 0
+        if delete_source:
+            # Processes still on the old map read from the source until
+            # they refresh.
+            time.sleep(sharding.get_config()["REFRESH_INTERVAL"])
+            deleted = rebalancer.delete_moved()
+    finally:
+        rebalancer.source.close()
+        rebalancer.target.close()
+    return {"job_id": job_id, "version": version, "ranges": reports, "deleted": deleted}
+
+
+def _partition_maintenance_config():
+    from django.conf import settings
+
+    return {
+        **DEFAULT_PARTITION_MAINTENANCE,
+        **getattr(settings, "PARTITION_MAINTENANCE", {}),
+    }
+
+
+@app.task
+def maintain_partitions_task(connection_string=None, policies=None):
+    """
+    Task to roll the partitions of every table with a partition policy.
+
+    Runs periodically (see ``schedule_partition_maintenance``); one failing
+    table doesn't stop the others.
+
+    :param connection_string: Connection string to the PostgreSQL database,
+        defaults to PARTITION_MAINTENANCE["CONNECTION_STRING"]
+    :param policies: Policy dicts, defaults to PARTITION_MAINTENANCE["POLICIES"]
+    :return: Created, detached and dropped partitions per table
+    """
+    config = _partition_maintenance_config()
+    manager = PartitioningManager(connection_string or config["CONNECTION_STRING"])
+    results = {}
+    for policy in map(PartitionPolicy.from_config, policies or config["POLICIES"]):
+        try:
+            results[policy.table] = manager.maintain(policy)
+        except Exception as exc:
+            logger.exception("Partition maintenance of %s failed", policy.table)
+            results[policy.table] = {"error": str(exc)}
+        else:
+            logger.info("Partition maintenance of %s: %s", policy.table, results[policy.table])
+    return results
+
+
+@app.on_after_configure.connect
+def schedule_partition_maintenance(sender, **kwargs):
+    """
+    Run ``maintain_partitions_task`` every PARTITION_MAINTENANCE["SCHEDULE"]
+    seconds when policies are configured.
+    """
+    config = _partition_maintenance_config()
+    if config["POLICIES"]:
+        sender.add_periodic_task(config["SCHEDULE"], maintain_partitions_task.s(),
+                                 name="partition maintenance")
+
+
+@app.task
+def advise_indexes_task(connection_string, slow_log_path=None, limit=10):
+    """
+    Task to recommend indexes from the captured workload.
+
+    :param connection_string: Connection string to the PostgreSQL database
+    :param slow_log_path: Use the app's slow query log instead of
+        ``pg_stat_statements``
+    :param limit: Number of recommendations
+    :return: Recommendations ranked by estimated benefit, unused and
+        duplicate indexes
+    """
+    manager = IndexingManager(connection_string)
+    return manager.advise(slow_log_path, limit)
+
+
+@app.task
+def build_recommended_index_task(connection_string, recommendation, slow_log_path=None,
+                                 measure_after=3600):
+    """
+    Task to build an approved recommendation and schedule its measurement.
+
+    :param connection_string: Connection string to the PostgreSQL database
+    :param recommendation: Dict from ``advise_indexes_task``
+    :param slow_log_path: Measure with the slow query log the
+        recommendation came from
+    :param measure_after: Seconds of workload to wait for before measuring
+    :return: Result of the index creation
+    """
+    manager = IndexingManager(connection_string)
+    snapshot = None
+    if not slow_log_path:
+        shapes = shapes_from_pg_stat_statements(manager.pool, keys=recommendation["queries"])
+        snapshot = {key: [shape.calls, shape.total_ms] for key, shape in shapes.items()}
+    result = manager.create_index(recommendation["table"], recommendation["name"],
+                                  ", ".join(recommendation["columns"]))
+    measure_index_task.apply_async(
+        (connection_string, recommendation),
+        {"snapshot": snapshot, "built_at": time.time(), "slow_log_path": slow_log_path},
+        countdown=measure_after)
+    return result
+
+
+@app.task
+def measure_index_task(connection_string, recommendation, snapshot=None, built_at=None,
+                       slow_log_path=None):
+    """
+    Task to report how much a built index really sped up its queries.
+
+    Only statements run after the build are counted: the slow log is read
+    from ``built_at`` on, ``pg_stat_statements`` counters are diffed against
+    the snapshot taken before the build.
+
+    :return: Index name and before/after mean time per query
+    """
+    baseline = recommendation["queries"]
+    if slow_log_path:
+        after = shapes_from_slow_log(slow_log_path, since=built_at)
+    else:
+        pool = get_pool(connection_string)
+        before = {key: QueryShape(key, "", calls, total)
+                  for key, (calls, total) in (snapshot or {}).items()}
+        after = workload_delta(before, shapes_from_pg_stat_statements(pool, keys=baseline))
+    report = improvement(baseline, after)
+    logger.info("Index %s: %s", recommendation["name"], report)
+    return {"index": recommendation["name"], "queries": report}
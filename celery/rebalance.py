@@ -0,0 +1,421 @@
+import io
+import logging
+import re
+import sqlite3
+import time
+from datetime import datetime, timezone
+
+from connection_pool import get_pool
+
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_TABLE = "rebalance_checkpoint"
+INT_TYPE_CODES = {20, 21, 23}  # int8, int2, int4 OIDs
+
+
+class Endpoint:
+    """
+    Connection to one side of a rebalance.
+
+    ``sqlite:///path`` opens a SQLite file; anything else is a psycopg2
+    connection string served from the shared connection pool.
+    """
+
+    def __init__(self, dsn):
+        self.dsn = dsn
+        self.vendor = "sqlite" if dsn.startswith("sqlite:///") else "postgresql"
+        if self.vendor == "sqlite":
+            self.conn = sqlite3.connect(dsn[len("sqlite:///"):])
+        else:
+            self.pool = get_pool(dsn)
+            self.conn = self.pool.getconn()
+        self.placeholder = "?" if self.vendor == "sqlite" else "%s"
+
+    def close(self):
+        if self.vendor == "sqlite":
+            self.conn.close()
+        else:
+            self.pool.putconn(self.conn)
+
+    def quote(self, name):
+        return '"' + name.replace('"', '""') + '"'
+
+    def adapt(self, value):
+        # Django stores datetimes on SQLite as naive UTC text,
+        # "YYYY-MM-DD HH:MM:SS[.ffffff]"; an ISO string with "T" or an offset
+        # doesn't compare with it. Truncating to the second only widens a
+        # ``>=`` comparison.
+        if self.vendor == "sqlite" and isinstance(value, datetime):
+            if value.tzinfo is not None:
+                value = value.astimezone(timezone.utc).replace(tzinfo=None)
+            return value.isoformat(" ", timespec="seconds")
+        return value
+
+
+class Throttle:
+    """
+    Keeps the average copy rate at or under ``rows_per_second``.
+    """
+
+    def __init__(self, rows_per_second=None):
+        self.rows_per_second = rows_per_second
+        self.started = time.monotonic()
+        self.rows = 0
+
+    def wait(self, rows):
+        self.rows += rows
+        if not self.rows_per_second:
+            return
+        ahead = self.rows / self.rows_per_second - (time.monotonic() - self.started)
+        if ahead > 0:
+            time.sleep(ahead)
+
+
+class Rebalancer:
+    """
+    Streams the rows of ``source_table`` whose key now belongs to the target
+    shard into ``target_table``, chunk by chunk.
+
+    The source is split into ranges of ``range_size`` values of the ordering
+    column (normally the primary key). Each chunk is upserted into the target
+    in the same transaction that advances the range's checkpoint, so a job
+    restarted with the same ``job_id`` resumes where it stopped without
+    copying a row twice.
+
+    ``catch_up`` also deletes from the target the copied rows that were
+    deleted from the source since, by diffing the primary keys of each range.
+    """
+
+    def __init__(self, source, target, source_table, target_table, key_column,
+                 moves, job_id, order_column="id", chunk_size=5000,
+                 range_size=100000, rows_per_second=None, progress=None,
+                 source_owns=None):
+        """
+        :param source: Source Endpoint
+        :param target: Target Endpoint
+        :param source_table: Table rows are copied from
+        :param target_table: Table rows are copied into
+        :param key_column: Column holding the shard key
+        :param moves: Callable returning True for keys owned by the target
+        :param job_id: Checkpoint namespace of this job
+        :param order_column: Unique integer column to walk the source by
+        :param chunk_size: Rows read per chunk
+        :param range_size: Width of a reported/checkpointed range
+        :param rows_per_second: Copy rate limit, None for unthrottled
+        :param progress: Callable receiving a progress dict per chunk
+        :param source_owns: Callable returning True for keys the source owned
+            before the rebalance; only target rows of such keys are deleted by
+            ``catch_up``. None if the target table held no rows before the job
+        """
+        if source.vendor != target.vendor:
+            raise ValueError("Source and target must use the same database.")
+        self.source = source
+        self.target = target
+        self.source_table = source_table
+        self.target_table = target_table
+        self.key_column = key_column
+        self.moves = moves
+        self.job_id = job_id
+        self.order_column = order_column
+        self.chunk_size = chunk_size
+        self.range_size = range_size
+        self.throttle = Throttle(rows_per_second)
+        self.progress = progress or (lambda report: None)
+        self.source_owns = source_owns or moves
+        self.columns = self._columns()
+
+    def run(self):
+        """
+        Copy every range, resuming from checkpoints and skipping the ranges
+        a previous run finished.
+
+        :return: List of per-range reports
+        """
+        return self._copy_ranges(resume=True)
+
+    def catch_up(self, since=None):
+        """
+        Copy the moving rows again, ignoring checkpoints, and delete the
+        copies of rows since deleted from the source; used during cutover to
+        pick up rows written while the job was running.
+
+        :param since: ``(column, value)`` to only copy rows with
+            ``column >= value``, e.g. ``("updated_at", started_at)`` with
+            started_at a datetime; None copies every moving row. Deletes are
+            found whatever since is
+        :return: List of per-range reports
+        """
+        return self._copy_ranges(resume=False, since=since)
+
+    def _copy_ranges(self, resume, since=None):
+        self._ensure_checkpoints()
+        bounds = [self._bounds(self.source, self.source_table)]
+        if not resume:
+            # Rows deleted from the top of the source only remain on the target.
+            bounds.append(self._bounds(self.target, self.target_table))
+        bounds = [bound for bound in bounds if bound is not None]
+        if not bounds:
+            return []
+        low = min(bound[0] for bound in bounds)
+        high = max(bound[1] for bound in bounds)
+        reports = []
+        start = low - (low % self.range_size)
+        while start <= high:
+            end = start + self.range_size
+            reports.append(self._copy_range(start, end, resume, since))
+            start = end
+        return reports
+
+    def delete_moved(self):
+        """
+        Delete the rows now living on the target from the source.
+
+        :return: Number of rows deleted
+        """
+        order = self.source.quote(self.order_column)
+        table = self.source.quote(self.source_table)
+        deleted = 0
+        last = None
+        while True:
+            rows = self._select(last, None, None)
+            if not rows:
+                return deleted
+            last = rows[-1][self._order_index]
+            ids = [row[self._order_index] for row in rows
+                   if self.moves(row[self._key_index])]
+            if ids:
+                marks = ", ".join([self.source.placeholder] * len(ids))
+                cursor = self.source.conn.cursor()
+                cursor.execute(f"DELETE FROM {table} WHERE {order} IN ({marks})", ids)
+                self.source.conn.commit()
+                deleted += len(ids)
+            self.throttle.wait(len(rows))
+
+    def _copy_range(self, start, end, resume, since):
+        checkpoint = self._load_checkpoint(start) if resume else None
+        if checkpoint and checkpoint[2]:
+            return self._report(start, end, checkpoint[1], 0, 0.0, done=True)
+
+        last, copied = checkpoint[:2] if checkpoint else (start - 1, 0)
+        scanned = 0
+        began = time.monotonic()
+        while True:
+            rows = self._select(last, end, since)
+            if not rows:
+                break
+            last = rows[-1][self._order_index]
+            moving = [row for row in rows if self.moves(row[self._key_index])]
+            self._write(moving, start, last, copied + len(moving), done=False,
+                        checkpoint=resume)
+            copied += len(moving)
+            scanned += len(rows)
+            self.progress(self._report(start, end, copied, scanned,
+                                       time.monotonic() - began, done=False))
+            self.throttle.wait(len(rows))
+
+        if resume:
+            self._write([], start, last, copied, done=True)
+        else:
+            deleted = self._delete_missing(start, end)
+        report = self._report(start, end, copied, scanned,
+                              time.monotonic() - began, done=True)
+        if not resume:
+            report["rows_deleted"] = deleted
+        self.progress(report)
+        logger.info("Range [%s, %s) of %s: %s rows copied at %.0f rows/s",
+                    start, end, self.source_table, copied, report["rows_per_second"])
+        return report
+
+    def _report(self, start, end, copied, scanned, seconds, done):
+        return {
+            "job_id": self.job_id,
+            "range": [start, end],
+            "rows_scanned": scanned,
+            "rows_copied": copied,
+            "seconds": round(seconds, 3),
+            "rows_per_second": round(scanned / seconds, 1) if seconds else 0.0,
+            "done": done,
+        }
+
+    def _columns(self):
+        cursor = self.source.conn.cursor()
+        cursor.execute(f"SELECT * FROM {self.source.quote(self.source_table)} WHERE 1 = 0")
+        columns = [column[0] for column in cursor.description]
+        self._key_index = columns.index(self.key_column)
+        self._order_index = columns.index(self.order_column)
+        self._int_key = (self.source.vendor == "postgresql"
+                         and cursor.description[self._key_index][1] in INT_TYPE_CODES)
+        cursor.close()
+        return columns
+
+    def _bounds(self, endpoint, table):
+        cursor = endpoint.conn.cursor()
+        order = endpoint.quote(self.order_column)
+        cursor.execute(f"SELECT MIN({order}), MAX({order}) FROM {endpoint.quote(table)}")
+        low, high = cursor.fetchone()
+        cursor.close()
+        endpoint.conn.commit()
+        return None if low is None else (low, high)
+
+    def _range_keys(self, endpoint, table, start, end):
+        quote = endpoint.quote
+        order = quote(self.order_column)
+        cursor = endpoint.conn.cursor()
+        cursor.execute(f"SELECT {order}, {quote(self.key_column)} FROM {quote(table)} "
+                       f"WHERE {order} >= {int(start)} AND {order} < {int(end)}")
+        rows = cursor.fetchall()
+        cursor.close()
+        endpoint.conn.commit()
+        return rows
+
+    def _delete_missing(self, start, end):
+        # A row deleted from the source after it was copied is only found by
+        # its absence: compare the primary keys of the range on both sides.
+        present = {order for order, _key in
+                   self._range_keys(self.source, self.source_table, start, end)}
+        gone = [order for order, key in
+                self._range_keys(self.target, self.target_table, start, end)
+                if order not in present and self.source_owns(key)]
+        order = self.target.quote(self.order_column)
+        table = self.target.quote(self.target_table)
+        cursor = self.target.conn.cursor()
+        for offset in range(0, len(gone), self.chunk_size):
+            ids = gone[offset:offset + self.chunk_size]
+            marks = ", ".join([self.target.placeholder] * len(ids))
+            cursor.execute(f"DELETE FROM {table} WHERE {order} IN ({marks})", ids)
+        self.target.conn.commit()
+        cursor.close()
+        return len(gone)
+
+    def _select(self, last, end, since):
+        quote = self.source.quote
+        order = quote(self.order_column)
+        where = []
+        if last is not None:
+            where.append(f"{order} > {int(last)}")
+        if end is not None:
+            where.append(f"{order} < {int(end)}")
+        params = []
+        if since is not None:
+            where.append(f"{quote(since[0])} >= {self.source.placeholder}")
+            params.append(self.source.adapt(since[1]))
+        sql = (f"SELECT {', '.join(quote(c) for c in self.columns)} "
+               f"FROM {quote(self.source_table)}"
+               f"{' WHERE ' + ' AND '.join(where) if where else ''} "
+               f"ORDER BY {order} LIMIT {int(self.chunk_size)}")
+        if self.source.vendor == "postgresql":
+            return self._copy_out(sql, params)
+        cursor = self.source.conn.cursor()
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+        cursor.close()
+        return rows
+
+    def _copy_out(self, sql, params):
+        # COPY ... TO STDOUT streams text rows without building Python
+        # tuples server-side; only the key and ordering columns are decoded.
+        cursor = self.source.conn.cursor()
+        buffer = io.StringIO()
+        cursor.copy_expert(f"COPY ({cursor.mogrify(sql, params).decode()}) TO STDOUT", buffer)
+        cursor.close()
+        self.source.conn.rollback()
+        rows = []
+        for line in buffer.getvalue().splitlines():
+            fields = line.split("\t")
+            key = fields[self._key_index]
+            fields[self._key_index] = int(key) if self._int_key else _unescape(key)
+            fields[self._order_index] = int(fields[self._order_index])
+            rows.append(_CopyRow(fields, line))
+        return rows
+
+    def _write(self, rows, range_start, last, copied, done, checkpoint=True):
+        conn = self.target.conn
+        cursor = conn.cursor()
+        try:
+            if rows:
+                if self.target.vendor == "postgresql":
+                    self._copy_in(cursor, rows)
+                else:
+                    columns = ", ".join(self.target.quote(c) for c in self.columns)
+                    marks = ", ".join("?" * len(self.columns))
+                    cursor.executemany(
+                        f"INSERT OR REPLACE INTO {self.target.quote(self.target_table)} "
+                        f"({columns}) VALUES ({marks})", rows)
+            if checkpoint:
+                self._save_checkpoint(cursor, range_start, last, copied, done)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+
+    def _copy_in(self, cursor, rows):
+        quote = self.target.quote
+        columns = ", ".join(quote(c) for c in self.columns)
+        updates = ", ".join(f"{quote(c)} = EXCLUDED.{quote(c)}"
+                            for c in self.columns if c != self.order_column)
+        # The connection goes back to a shared pool, so the staging table
+        # must not outlive the chunk's transaction: it's created from the
+        # current target table every time and dropped on commit or rollback.
+        stage = quote(f"rebalance_stage_{self.target_table}")
+        cursor.execute(f"CREATE TEMP TABLE {stage} "
+                       f"(LIKE {quote(self.target_table)} INCLUDING DEFAULTS) "
+                       f"ON COMMIT DROP")
+        data = "".join(row.line + "\n" for row in rows)
+        cursor.copy_expert(f"COPY {stage} ({columns}) FROM STDIN", io.StringIO(data))
+        cursor.execute(f"INSERT INTO {quote(self.target_table)} ({columns}) "
+                       f"SELECT {columns} FROM {stage} "
+                       f"ON CONFLICT ({quote(self.order_column)}) DO UPDATE SET {updates}")
+
+    def _ensure_checkpoints(self):
+        cursor = self.target.conn.cursor()
+        cursor.execute(f"CREATE TABLE IF NOT EXISTS {CHECKPOINT_TABLE} ("
+                       "job_id varchar(200) NOT NULL, range_start bigint NOT NULL, "
+                       "last_key bigint NOT NULL, rows_copied bigint NOT NULL, "
+                       "done integer NOT NULL, PRIMARY KEY (job_id, range_start))")
+        self.target.conn.commit()
+        cursor.close()
+
+    def _load_checkpoint(self, range_start):
+        mark = self.target.placeholder
+        cursor = self.target.conn.cursor()
+        cursor.execute(f"SELECT last_key, rows_copied, done FROM {CHECKPOINT_TABLE} "
+                       f"WHERE job_id = {mark} AND range_start = {mark}",
+                       [self.job_id, range_start])
+        row = cursor.fetchone()
+        cursor.close()
+        self.target.conn.commit()
+        return row
+
+    def _save_checkpoint(self, cursor, range_start, last, copied, done):
+        mark = self.target.placeholder
+        cursor.execute(f"DELETE FROM {CHECKPOINT_TABLE} "
+                       f"WHERE job_id = {mark} AND range_start = {mark}",
+                       [self.job_id, range_start])
+        cursor.execute(f"INSERT INTO {CHECKPOINT_TABLE} "
+                       f"(job_id, range_start, last_key, rows_copied, done) "
+                       f"VALUES ({mark}, {mark}, {mark}, {mark}, {mark})",
+                       [self.job_id, range_start, last, copied, int(done)])
+
+
+class _CopyRow(list):
+    """
+    Decoded COPY row that remembers its original text line.
+    """
+
+    def __init__(self, fields, line):
+        super().__init__(fields)
+        self.line = line
+
+
+_UNESCAPES = {"t": "\t", "n": "\n", "r": "\r"}
+_ESCAPE = re.compile(r"\\(.)")
+
+
+def _unescape(value):
+    if "\\" not in value:
+        return value
+    return _ESCAPE.sub(lambda match: _UNESCAPES.get(match[1], match[1]), value)
+
@@ -0,0 +1,292 @@
+import heapq
+import itertools
+import uuid
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+from connection_pool import get_pool
+
+
+ShardTarget = namedtuple("ShardTarget", "name dsn table")
+
+POLICIES = ("fail", "partial")
+
+
+class ShardQueryError(Exception):
+    """
+    Raised when a shard fails or times out under the "fail" policy.
+    """
+
+    def __init__(self, shard, error):
+        super().__init__(f"Shard {shard} failed: {error}")
+        self.shard = shard
+        self.error = error
+
+
+class GatherResult:
+    """
+    Stream of merged rows from every shard.
+
+    Iterate it once. ``failed`` maps the shards skipped under the "partial"
+    policy to their error; it is only final once the iteration has finished.
+    Stopping early (e.g. after the LIMIT) closes the remaining shard cursors.
+    """
+
+    def __init__(self):
+        self.failed = {}
+        self.rows = iter(())
+        self._streams = []
+
+    def __iter__(self):
+        try:
+            yield from self.rows
+        finally:
+            self.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def complete(self):
+        return not self.failed
+
+    def close(self):
+        for stream in self._streams:
+            stream.close()
+
+
+class _ShardStream:
+    """
+    Server-side cursor on one shard, read ``fetch_size`` rows at a time.
+    """
+
+    def __init__(self, target, sql, params, fetch_size, timeout):
+        self.target = target
+        self.sql = sql.format(table=target.table)
+        self.params = params
+        self.fetch_size = fetch_size
+        self.timeout = timeout
+        self.pool = get_pool(target.dsn)
+        self.conn = None
+        self.cursor = None
+        self.done = False
+        self.pending = None
+
+    def open(self):
+        self.conn = self.pool.getconn(self.timeout)
+        with self.conn.cursor() as cursor:
+            # Stop the query on the server too, not only waiting for it.
+            cursor.execute("SET LOCAL statement_timeout = %s", [int(self.timeout * 1000)])
+        self.cursor = self.conn.cursor(name=f"scatter_{uuid.uuid4().hex}")
+        self.cursor.execute(self.sql, self.params)
+        return self.fetch()
+
+    def fetch(self):
+        rows = self.cursor.fetchmany(self.fetch_size)
+        if len(rows) < self.fetch_size:
+            self.done = True
+        return rows
+
+    def wait(self, future):
+        """
+        Return the future's rows, as a ShardQueryError if it failed or the
+        shard took longer than the timeout for this round trip.
+
+        The clock only runs while waiting on the shard, so time the caller
+        spends consuming rows between fetches doesn't count against it.
+        """
+        self.pending = future
+        try:
+            rows = future.result(timeout=self.timeout)
+        except TimeoutError:
+            raise ShardQueryError(self.target.name, f"timed out after {self.timeout}s")
+        except Exception as exc:
+            raise ShardQueryError(self.target.name, exc) from exc
+        self.pending = None
+        return rows
+
+    def close(self):
+        pending, self.pending = self.pending, None
+        if pending is not None and not pending.done():
+            # Still running in a worker; give the connection back after.
+            pending.add_done_callback(lambda _future: self.close())
+            return
+        conn, self.conn = self.conn, None
+        if conn is None:
+            return
+        try:
+            if self.cursor is not None and not self.cursor.closed:
+                self.cursor.close()
+        except Exception:
+            self.pool.putconn(conn, close=True)
+            return
+        self.pool.putconn(conn)
+
+
+class ScatterGather:
+    """
+    Runs one query on every shard concurrently and merges the results.
+
+    Queries name the shard table as ``{table}``. Each round trip to a shard
+    (running the query, then every fetch of ``fetch_size`` rows) gets
+    ``timeout`` seconds, matching the ``statement_timeout`` set on the
+    server; a slow consumer never makes a shard time out. A shard that fails or times out raises
+    ShardQueryError under the "fail" policy and is skipped, and listed in
+    ``GatherResult.failed``, under "partial".
+    """
+
+    def __init__(self, targets, timeout=5.0, policy="fail", fetch_size=500,
+                 max_workers=None):
+        """
+        :param targets: ShardTarget of every shard to query
+        :param timeout: Seconds each round trip to a shard may take
+        :param policy: "fail" or "partial"
+        :param fetch_size: Rows fetched from a shard per round trip
+        :param max_workers: Threads running shard queries, defaults to one
+            per shard
+        """
+        if policy not in POLICIES:
+            raise ValueError(f"policy must be one of {', '.join(POLICIES)}.")
+        self.targets = list(targets)
+        self.timeout = timeout
+        self.policy = policy
+        self.fetch_size = fetch_size
+        self.executor = ThreadPoolExecutor(max_workers or max(len(self.targets), 1),
+                                           thread_name_prefix="scatter-gather")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+
+    def execute(self, sql, params=None):
+        """
+        Return the rows of every shard, shard after shard.
+        """
+        result, streams = self._start(sql, params)
+        result.rows = itertools.chain.from_iterable(
+            self._iterate(stream, result) for stream in streams)
+        return result
+
+    def ordered(self, sql, params=None, key=None, limit=None, reverse=False):
+        """
+        Return the rows of every shard in one sorted stream.
+
+        Each shard must return its rows sorted the same way, so the query
+        should carry its ORDER BY and, when ``limit`` is set, a LIMIT of the
+        same size. Shards are merged with a k-way heap merge, and only as
+        many rows as ``limit`` are pulled from them.
+
+        :param key: Sort key of a row, as for ``sorted``
+        :param limit: Number of rows to return at most
+        :param reverse: Rows are sorted in descending order
+        """
+        result, streams = self._start(sql, params)
+        merged = heapq.merge(*(self._iterate(stream, result) for stream in streams),
+                             key=key, reverse=reverse)
+        result.rows = itertools.islice(merged, limit)
+        return result
+
+    def aggregate(self, sql, aggregates, params=None, group_by=0):
+        """
+        Combine per-shard partial aggregates into the final ones.
+
+        The query returns ``group_by`` group columns followed by one column
+        per aggregate, except "avg", which takes two: the shard's SUM and
+        COUNT. For example, with ``aggregates=["count", "max", "avg"]`` and
+        ``group_by=1``::
+
+            SELECT status, COUNT(*), MAX(total), SUM(total), COUNT(total)
+            FROM {table} GROUP BY status
+
+        :param aggregates: "count", "sum", "min", "max" or "avg" per column
+        :return: GatherResult of one row per group
+        """
+        unknown = set(aggregates) - set(_COMBINE)
+        if unknown:
+            raise ValueError(f"Unknown aggregates: {', '.join(sorted(unknown))}.")
+        partials = self.execute(sql, params)
+        groups = {}
+        for row in partials:
+            group, values = tuple(row[:group_by]), row[group_by:]
+            state = groups.get(group)
+            groups[group] = _combine_row(aggregates, values, state)
+        result = GatherResult()
+        result.failed = partials.failed
+        result.rows = iter([group + tuple(_finish(aggregates, state))
+                            for group, state in groups.items()])
+        return result
+
+    def _start(self, sql, params):
+        result = GatherResult()
+        streams = [_ShardStream(target, sql, params, self.fetch_size, self.timeout)
+                   for target in self.targets]
+        for stream in streams:
+            stream.first = stream.pending = self.executor.submit(stream.open)
+        result._streams = streams
+        return result, streams
+
+    def _iterate(self, stream, result):
+        try:
+            rows = stream.wait(stream.first)
+            while True:
+                yield from rows
+                if stream.done:
+                    break
+                rows = stream.wait(self.executor.submit(stream.fetch))
+        except ShardQueryError as exc:
+            if self.policy == "fail":
+                raise
+            result.failed[stream.target.name] = str(exc.error)
+        finally:
+            stream.close()
+
+
+def _add(a, b):
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return a + b
+
+
+def _least(a, b):
+    return b if a is None else a if b is None else min(a, b)
+
+
+def _greatest(a, b):
+    return b if a is None else a if b is None else max(a, b)
+
+
+_COMBINE = {"count": _add, "sum": _add, "min": _least, "max": _greatest, "avg": _add}
+
+
+def _combine_row(aggregates, values, state):
+    combined = []
+    index = 0
+    for position, name in enumerate(aggregates):
+        width = 2 if name == "avg" else 1
+        value = tuple(values[index:index + width])
+        index += width
+        if state is None:
+            combined.append(value)
+        else:
+            combined.append(tuple(_COMBINE[name](a, b)
+                                  for a, b in zip(state[position], value)))
+    return combined
+
+
+def _finish(aggregates, state):
+    for name, value in zip(aggregates, state):
+        if name == "avg":
+            total, count = value
+            yield total / count if count else None
+        else:
+            yield value[0]
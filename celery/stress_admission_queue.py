@@ -0,0 +1,159 @@
+"""
+Stress the admission queue with many producer threads and event loops.
+
+Producers submit work for a "hot" task name (most producers) and "cold"
+ones (a few producers each) at random priorities, some with timeouts and
+some cancelling. Admitted work holds its slot for a random time on a worker
+thread, the way TaskRouter holds a slot until the AsyncResult is ready. It
+checks that concurrency never exceeds the limit, that every ticket ends
+admitted, timed out, cancelled or rejected, and that no slot leaks. It also
+reports the wait per task name and priority, to show that cold task names
+aren't starved and that priorities are honoured. Run it from this directory:
+
+    python stress_admission_queue.py --threads 64 --per-thread 200
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from admission_queue import (
+    AdmissionCancelled, AdmissionQueue, AdmissionRejected, AdmissionTimeout,
+)
+
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.running = 0
+        self.peak = 0
+        self.outcomes = defaultdict(int)
+        self.waits = defaultdict(list)
+
+    def start(self, ticket):
+        with self.lock:
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+            self.outcomes['admitted'] += 1
+            self.waits[(ticket.task_name, ticket.priority)].append(
+                ticket.admitted_at - ticket.enqueued_at)
+
+    def finish(self, ticket):
+        with self.lock:
+            self.running -= 1
+        ticket.release()
+
+    def outcome(self, name):
+        with self.lock:
+            self.outcomes[name] += 1
+
+
+def run_work(recorder, ticket, work):
+    recorder.start(ticket)
+    time.sleep(random.uniform(0, work))
+    recorder.finish(ticket)
+
+
+def producer(queue, workers, recorder, task_name, count, work, rng):
+    for _ in range(count):
+        priority = rng.choice((0, 0, 0, 5))
+        try:
+            ticket = queue.submit(task_name, priority)
+        except AdmissionRejected:
+            recorder.outcome('rejected')
+            continue
+        roll = rng.random()
+        try:
+            if roll < 0.05:
+                if ticket.cancel():
+                    recorder.outcome('cancelled')
+                    continue
+                ticket.wait()
+            else:
+                ticket.wait(timeout=0.05 if roll < 0.15 else None)
+        except AdmissionTimeout:
+            recorder.outcome('timed_out')
+            continue
+        except AdmissionCancelled:
+            recorder.outcome('cancelled')
+            continue
+        workers.submit(run_work, recorder, ticket, work)
+
+
+async def async_producer(queue, recorder, task_name, count, work):
+    async def one():
+        try:
+            ticket = await queue.acquire_async(task_name, random.choice((0, 5)), timeout=1.0)
+        except AdmissionRejected:
+            recorder.outcome('rejected')
+            return
+        except AdmissionTimeout:
+            recorder.outcome('timed_out')
+            return
+        recorder.start(ticket)
+        await asyncio.sleep(random.uniform(0, work))
+        recorder.finish(ticket)
+
+    await asyncio.gather(*(one() for _ in range(count)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--threads', type=int, default=64)
+    parser.add_argument('--per-thread', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--max-queue', type=int, default=200)
+    parser.add_argument('--work', type=float, default=0.002)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    queue = AdmissionQueue(args.concurrency, args.max_queue)
+    recorder = Recorder()
+    cold = ['cold-a', 'cold-b', 'cold-c']
+    names = ['hot'] * (args.threads - 2 * len(cold)) + cold * 2
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(args.concurrency * 2) as workers:
+        threads = [threading.Thread(target=producer, args=(
+            queue, workers, recorder, name, args.per_thread, args.work,
+            random.Random(args.seed + index)))
+            for index, name in enumerate(names)]
+        loop_thread = threading.Thread(target=asyncio.run, args=(
+            async_producer(queue, recorder, 'async', args.per_thread, args.work),))
+        for thread in threads + [loop_thread]:
+            thread.start()
+        for thread in threads + [loop_thread]:
+            thread.join()
+    elapsed = time.perf_counter() - start
+
+    submitted = len(names) * args.per_thread + args.per_thread
+    accounted = sum(recorder.outcomes.values())
+    print(f"{submitted} submissions in {elapsed:.2f}s, outcomes {dict(recorder.outcomes)}")
+    print(f"peak concurrency {recorder.peak} (limit {args.concurrency}), "
+          f"in flight at the end {queue.in_flight}")
+    print(f"{'task name':<10}{'priority':>9}{'admitted':>10}{'p50 wait':>11}{'p95 wait':>11}")
+    for (name, priority), waits in sorted(recorder.waits.items()):
+        waits.sort()
+        print(f"{name:<10}{priority:>9}{len(waits):>10}"
+              f"{statistics.median(waits) * 1000:>9.2f}ms"
+              f"{waits[int(len(waits) * 0.95)] * 1000:>9.2f}ms")
+
+    problems = []
+    if recorder.peak > args.concurrency:
+        problems.append(f"concurrency {recorder.peak} exceeded {args.concurrency}")
+    if accounted != submitted:
+        problems.append(f"{submitted - accounted} submissions unaccounted for")
+    if queue.in_flight or recorder.running:
+        problems.append(f"{queue.in_flight} slots leaked")
+    for problem in problems:
+        print(f"FAIL: {problem}")
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,24 +1,64 @@
-from celery import Celery, Task
+from celery import Celery, Task, states
+from celery.backends.base import DisabledBackend
+from celery.exceptions import ImproperlyConfigured
+from celery.result import AsyncResult
 from celery.utils.log import get_task_logger
 from collections import defaultdict, deque
+import threading
 import time
 import random
 
-app = Celery('file_processing', broker='pyamqp://localhost//')
+from admission_queue import AdmissionError, AdmissionQueue
+
+app = Celery('file_processing', broker='pyamqp://localhost//', backend='rpc://')
 
 logger = get_task_logger(__name__)
 
 class TaskRouter:
     """
     Class responsible for routing file processing tasks dynamically based on performance metrics.
+
+    At most ``max_concurrency`` tasks are in flight: a task holds its slot
+    from dispatch until its AsyncResult is ready, not just while ``.delay()``
+    runs. Tasks over the limit wait in a bounded queue per task name,
+    ordered by priority, with task names taking turns for free slots.
+
+    Knowing when a task is done needs a result backend; without one the
+    router refuses to start.
     """
     
-    def __init__(self, max_concurrency=5):
+    def __init__(self, max_concurrency=5, max_queue=1000, admission_timeout=None,
+                 poll_interval=0.1, celery_app=None):
+        """
+        :param max_concurrency: Tasks in flight at the same time
+        :param max_queue: Tasks waiting per task name before rejecting
+        :param admission_timeout: Default seconds to wait for a slot
+        :param poll_interval: Seconds between checks of in-flight results
+        :param celery_app: App the routed tasks belong to, defaults to ``app``
+        :raises ImproperlyConfigured: if the app has no result backend
+        """
+        celery_app = celery_app or app
+        if isinstance(celery_app.backend, DisabledBackend):
+            raise ImproperlyConfigured(
+                f"Celery app {celery_app.main!r} has no result backend; TaskRouter "
+                f"can't tell when a task has finished. Set its backend (result_backend).")
         self.task_queues = defaultdict(list)
         self.performance_metrics = defaultdict(lambda: {'exec_time': 0, 'errors': 0, 'priority': 1})
         self.task_history = defaultdict(deque)  # Keep track of the last N executions
         self.max_concurrency = max_concurrency
-        self.current_concurrency = 0
+        self.admission = AdmissionQueue(max_concurrency, max_queue)
+        self.admission_timeout = admission_timeout
+        self.poll_interval = poll_interval
+        self._in_flight = []
+        self._lock = threading.Lock()
+        self._reaper = None
+
+    @property
+    def current_concurrency(self):
+        """
+        Number of dispatched tasks whose result isn't ready yet.
+        """
+        return self.admission.in_flight
 
     def add_task(self, task_name, task_func):
         """
@@ -32,20 +72,53 @@ class TaskRouter:
     def route_task(self, task_name, *args, **kwargs):
         """
         Route a task based on its performance metrics and priority.
+
+        Waits up to ``admission_timeout`` for a slot.
         
         :param task_name: Name of the task to route
-        :return: Result of the task execution
+        :return: Result of the task execution, None if it wasn't run
         """
-        task_list = self.task_queues.get(task_name, [])
-        
-        if not task_list:
+        return self.submit_task(task_name, args, kwargs)
+
+    def submit_task(self, task_name, args=(), kwargs=None, priority=0, timeout=None):
+        """
+        Route a task once the admission queue lets it through.
+
+        :param task_name: Name of the task to route
+        :param args: Positional arguments of the task
+        :param kwargs: Keyword arguments of the task
+        :param priority: Higher runs earlier among waiting tasks of this name
+        :param timeout: Seconds to wait for a slot, defaults to admission_timeout
+        :return: Result of the task execution, None if it wasn't run
+        """
+        if not self.task_queues.get(task_name):
             logger.error(f"No tasks found for {task_name}")
             return None
+        try:
+            ticket = self.admission.acquire(
+                task_name, priority, self.admission_timeout if timeout is None else timeout)
+        except AdmissionError as exc:
+            logger.warning(f"Task {task_name} not admitted: {exc}")
+            return None
+        return self._dispatch(ticket, task_name, args, kwargs or {})
 
-        if self.current_concurrency >= self.max_concurrency:
-            logger.warning(f"Max concurrency reached. Task {task_name} is waiting.")
-            time.sleep(1)  # Simple delay mechanism; can be replaced with a more sophisticated queue system
-        
+    async def submit_task_async(self, task_name, args=(), kwargs=None, priority=0, timeout=None):
+        """
+        Like ``submit_task``, but waits for a slot without blocking the event loop.
+        """
+        if not self.task_queues.get(task_name):
+            logger.error(f"No tasks found for {task_name}")
+            return None
+        try:
+            ticket = await self.admission.acquire_async(
+                task_name, priority, self.admission_timeout if timeout is None else timeout)
+        except AdmissionError as exc:
+            logger.warning(f"Task {task_name} not admitted: {exc}")
+            return None
+        return self._dispatch(ticket, task_name, args, kwargs or {})
+
+    def _dispatch(self, ticket, task_name, args, kwargs):
+        task_list = self.task_queues[task_name]
         # Select task based on a weighted metric (execution time, error count, and priority)
         selected_task = min(task_list, key=lambda task: 
             (self.performance_metrics[task_name]['exec_time'] * self.performance_metrics[task_name]['priority']) + 
@@ -54,25 +127,69 @@ class TaskRouter:
 
         start_time = time.time()
         try:
-            self.current_concurrency += 1
             result = selected_task(*args, **kwargs)
-            exec_time = time.time() - start_time
+        except Exception as e:
+            ticket.release()
+            with self._lock:
+                self.performance_metrics[task_name]['errors'] += 1
+            logger.error(f"Task {task_name} failed with error: {e}")
+            return None
+
+        if isinstance(result, AsyncResult):
+            # The slot is held until the worker has finished the task.
+            with self._lock:
+                self._in_flight.append((ticket, task_name, result, start_time))
+            self._ensure_reaper()
+        else:
+            ticket.release()
+            self._record(task_name, result, time.time() - start_time, failed=False)
+        return result
 
-            self.performance_metrics[task_name]['exec_time'] = exec_time
+    def _record(self, task_name, result, exec_time, failed):
+        with self._lock:
+            metrics = self.performance_metrics[task_name]
+            metrics['exec_time'] = exec_time
+            if failed:
+                metrics['errors'] += 1
             self.task_history[task_name].append((result, exec_time))
             if len(self.task_history[task_name]) > 10:  # Keep history of the last 10 executions
                 self.task_history[task_name].popleft()
+        logger.info(f"Executed {task_name} in {exec_time:.2f} seconds")
+
+    def _ensure_reaper(self):
+        with self._lock:
+            if self._reaper is None or not self._reaper.is_alive():
+                self._reaper = threading.Thread(
+                    target=self._reap, name='task-router-reaper', daemon=True)
+                self._reaper.start()
+
+    def _reap(self):
+        while True:
+            with self._lock:
+                in_flight = list(self._in_flight)
+            if not in_flight:
+                with self._lock:
+                    if not self._in_flight:
+                        self._reaper = None
+                        return
+                continue
+            for entry in in_flight:
+                ticket, task_name, result, start_time = entry
+                try:
+                    state = result.state
+                except Exception as e:
+                    # Unknown isn't finished: keep the slot and ask again.
+                    logger.warning(f"Could not check {task_name} result: {e}")
+                    continue
+                if state not in states.READY_STATES:
+                    continue
+                with self._lock:
+                    self._in_flight.remove(entry)
+                ticket.release()
+                self._record(task_name, result, time.time() - start_time,
+                             failed=state != states.SUCCESS)
+            time.sleep(self.poll_interval)
 
-            logger.info(f"Executed {task_name} in {exec_time:.2f} seconds")
-        except Exception as e:
-            self.performance_metrics[task_name]['errors'] += 1
-            logger.error(f"Task {task_name} failed with error: {e}")
-            result = None
-        finally:
-            self.current_concurrency -= 1
-        
-        return result
-    
     def get_task_history(self, task_name):
         """
         Get the history of a task's execution.
@@ -143,18 +260,18 @@ def extract_metadata(self, file_path):
 
 
 
-router = TaskRouter(max_concurrency=3)
-router.add_task('virus_scan', virus_scan.delay)
-router.add_task('resize_image', resize_image.delay)
-router.add_task('extract_metadata', extract_metadata.delay)
+if __name__ == '__main__':
+    router = TaskRouter(max_concurrency=3)
+    router.add_task('virus_scan', virus_scan.delay)
+    router.add_task('resize_image', resize_image.delay)
+    router.add_task('extract_metadata', extract_metadata.delay)
 
- 
-file1_result = router.route_task('virus_scan', '/path/to/file1')
-file2_result = router.route_task('resize_image', '/path/to/image2.jpg', size=(1024, 768))
-file3_result = router.route_task('extract_metadata', '/path/to/file3.docx')
+    file1_result = router.route_task('virus_scan', '/path/to/file1')
+    file2_result = router.route_task('resize_image', '/path/to/image2.jpg', size=(1024, 768))
+    file3_result = router.route_task('extract_metadata', '/path/to/file3.docx')
 
-print(file1_result)
-print(file2_result)
-print(file3_result)
- 
-print("Virus Scan Task History:", router.get_task_history('virus_scan'))
+    print(file1_result)
+    print(file2_result)
+    print(file3_result)
+
+    print("Virus Scan Task History:", router.get_task_history('virus_scan'))
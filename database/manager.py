@@ -1,56 +1,277 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import ExitStack
+
 from django.utils.deprecation import MiddlewareMixin
-from django.core.cache import cache
-from django.db import connection, connections
-from django.db.models.signals import pre_migrate, post_migrate
-from django.dispatch import receiver
+from django.db import connections
+
+from database.projection import get_config as get_projection_config, get_learner
+from database.query_cache import get_query_cache
+from database.slowlog import get_slow_log
+
+
+# Upper bounds of the latency histogram buckets, in milliseconds. The last
+# bucket catches everything slower.
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+class AliasQueryRecorder:
+    """
+    ``execute_wrapper`` that times every statement run on one database alias.
+
+    Only a pair of ``perf_counter`` calls and a few additions are done per
+    query, so it is cheap enough to leave installed in production.
+    """
+
+    __slots__ = ('alias', 'count', 'duration', 'slowest_duration', 'slowest_sql',
+                 'slow_log')
+
+    def __init__(self, alias, slow_log=None):
+        self.alias = alias
+        self.count = 0
+        self.duration = 0.0
+        self.slowest_duration = 0.0
+        self.slowest_sql = None
+        self.slow_log = slow_log
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.count += 1
+            self.duration += elapsed
+            if elapsed > self.slowest_duration:
+                self.slowest_duration = elapsed
+                self.slowest_sql = sql
+            if self.slow_log is not None and elapsed >= self.slow_log.threshold:
+                self.slow_log.record(self.alias, sql, params, elapsed)
+
+
+class RequestQueryStats:
+    """
+    Query counters for a single request, across every database alias.
+    """
+
+    def __init__(self, aliases, slow_log=None):
+        self.started = time.perf_counter()
+        self.recorders = {alias: AliasQueryRecorder(alias, slow_log)
+                          for alias in aliases}
+
+    @property
+    def count(self):
+        return sum(recorder.count for recorder in self.recorders.values())
+
+    @property
+    def duration(self):
+        return sum(recorder.duration for recorder in self.recorders.values())
+
+    @property
+    def slowest(self):
+        """
+        Return the slowest statement of the request.
+
+        :return: Tuple of (alias, seconds, sql); sql is None if nothing ran
+        """
+        recorder = max(self.recorders.values(),
+                       key=lambda r: r.slowest_duration)
+        return recorder.alias, recorder.slowest_duration, recorder.slowest_sql
+
+    def server_timing(self, total):
+        """
+        Build a ``Server-Timing`` header value for the request.
+
+        :param total: Total request time in seconds
+        :return: Header value with a ``db`` entry, one per used alias and ``total``
+        """
+        metrics = [f'db;dur={self.duration * 1000:.2f};desc="{self.count} queries"']
+        for alias, recorder in self.recorders.items():
+            if recorder.count:
+                metrics.append(
+                    f'db-{alias};dur={recorder.duration * 1000:.2f};'
+                    f'desc="{recorder.count} queries"'
+                )
+        metrics.append(f'total;dur={total * 1000:.2f}')
+        return ', '.join(metrics)
+
+
+class LatencyHistogram:
+    """
+    Fixed-bucket latency histogram, in milliseconds.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS_MS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0
+        self.sum_ms = 0.0
+
+    def observe(self, seconds):
+        ms = seconds * 1000
+        self.counts[bisect_left(self.buckets, ms)] += 1
+        self.total += 1
+        self.sum_ms += ms
+
+    def as_dict(self):
+        labels = [f'le_{bound}' for bound in self.buckets] + ['inf']
+        return {
+            'count': self.total,
+            'sum_ms': round(self.sum_ms, 3),
+            'buckets': dict(zip(labels, self.counts)),
+        }
+
+
+class RouteQueryMetrics:
+    """
+    Aggregated request and database latency for one URL name.
+    """
+
+    def __init__(self):
+        self.requests = LatencyHistogram()
+        self.db = LatencyHistogram()
+        self.queries = 0
+        self.slowest_duration = 0.0
+        self.slowest_sql = None
+
+    def observe(self, stats, total):
+        self.requests.observe(total)
+        self.db.observe(stats.duration)
+        self.queries += stats.count
+        _alias, duration, sql = stats.slowest
+        if duration > self.slowest_duration:
+            self.slowest_duration = duration
+            self.slowest_sql = sql
+
+    def as_dict(self):
+        return {
+            'requests': self.requests.as_dict(),
+            'db': self.db.as_dict(),
+            'queries': self.queries,
+            'slowest_ms': round(self.slowest_duration * 1000, 3),
+            'slowest_sql': self.slowest_sql,
+        }
+
+
+_route_metrics = {}
+_route_metrics_lock = threading.Lock()
+
+
+def record_request(url_name, stats, total):
+    """
+    Add a finished request to the histograms for its URL name.
+
+    :param url_name: Resolved view name of the request
+    :param stats: RequestQueryStats collected for the request
+    :param total: Total request time in seconds
+    """
+    with _route_metrics_lock:
+        metrics = _route_metrics.get(url_name)
+        if metrics is None:
+            metrics = _route_metrics[url_name] = RouteQueryMetrics()
+        metrics.observe(stats, total)
+
+
+def get_route_metrics():
+    """
+    Return a snapshot of the per-URL-name latency histograms.
+
+    :return: Dict of url name -> histogram data
+    """
+    with _route_metrics_lock:
+        return {name: metrics.as_dict()
+                for name, metrics in sorted(_route_metrics.items())}
+
+
+def reset_route_metrics():
+    """
+    Drop every aggregated histogram.
+    """
+    with _route_metrics_lock:
+        _route_metrics.clear()
+
 
 class QueryOptimizationMiddleware(MiddlewareMixin):
     """
     Middleware that optimizes query performance for dynamically generated models.
+
+    Every statement on every alias in ``connections`` is timed through
+    ``execute_wrapper``, so the metrics work with ``DEBUG=False``.
     """
 
     def process_request(self, request):
         """
         Process incoming requests to apply query optimizations.
-        
+
+        Installs a query recorder on each database alias for this request;
+        statements over the slow query threshold go to ``database.slowlog``.
+
         :param request: Django HTTP request object
         """
-        pass
+        stats = RequestQueryStats(connections, get_slow_log())
+        wrappers = ExitStack()
+        for alias, recorder in stats.recorders.items():
+            wrappers.enter_context(connections[alias].execute_wrapper(recorder))
+        request.query_stats = stats
+        request._query_wrappers = wrappers
 
     def process_response(self, request, response):
         """
         Process the response to include query performance metrics and manage cache.
-        
+
         :param request: Django HTTP request object
         :param response: Django HTTP response object
         :return: Modified response object
         """
-        if connection.queries:
-            total_time = sum(float(query['time']) for query in connection.queries)
-            response['X-Query-Time'] = f"{total_time:.2f}s"
-        
+        stats = getattr(request, 'query_stats', None)
+        if stats is None:
+            return response
+        request._query_wrappers.close()
+
+        total = time.perf_counter() - stats.started
+        response['Server-Timing'] = stats.server_timing(total)
+        if stats.count:
+            response['X-Query-Time'] = f"{stats.duration:.2f}s"
+
+        match = getattr(request, 'resolver_match', None)
+        record_request(match.view_name if match else '<unresolved>', stats, total)
         return response
 
-    def cache_query(self, key, query_function, *args, **kwargs):
+    def cache_query(self, key, query_function, *args, tags=(), timeout=None, **kwargs):
         """
         Cache the result of a database query to reduce load on repeated access.
-        
+
+        Falsy results are cached too, only one process recomputes an expired
+        key, and saving or deleting a watched model (see
+        ``database.query_cache.watch_model``) evicts the entries tagged with it.
+
         :param key: Cache key
         :param query_function: Function that executes the query
+        :param tags: Tags the result depends on, e.g. ``model_tag(User)``
+        :param timeout: Seconds the result stays fresh (QUERY_CACHE default)
         :return: Cached or freshly queried data
         """
-        result = cache.get(key)
-        if not result:
-            result = query_function(*args, **kwargs)
-            cache.set(key, result, timeout=300)  # Cache for 5 minutes
-        return result
+        return get_query_cache().get_or_compute(
+            key,
+            lambda: query_function(*args, **kwargs),
+            tags=tags,
+            timeout=timeout,
+        )
 
-    def apply_lazy_loading(self, queryset):
+    def apply_lazy_loading(self, queryset, site=None):
         """
         Apply lazy loading to the queryset to defer the loading of related data until absolutely necessary.
-        
-        :param queryset: Django QuerySet object 
-        
+
+        Only the fields the calling site has been seen to read (plus the
+        primary key) are loaded; see ``database.projection``. Any other field
+        is fetched for the whole result set on first access.
+
+        :param queryset: Django QuerySet object
+        :param site: Call site key, e.g. a view name; defaults to the caller
+
         :return: Lazy-loaded QuerySet
         """
-        return queryset.select_related(None).defer(*[f.name for f in queryset.model._meta.get_fields()])
+        if not get_projection_config()['ENABLED']:
+            return queryset
+        return get_learner().project(queryset, site=site, depth=2)
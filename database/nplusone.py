@@ -0,0 +1,382 @@
+"""
+N+1 query detection.
+
+``detect_n_plus_one()`` (or ``NPlusOneMiddleware`` for a whole request)
+installs an ``execute_wrapper`` on every alias and counts SELECTs by their
+SQL text. Django keeps parameter values out of the SQL, so the same text
+with different parameters is the same query repeated for different foreign
+keys. Once a shape reaches THRESHOLD distinct parameter sets, it is logged
+with the stack that issued it and the relation being walked (worked out from
+the related descriptor or related-manager queryset on the stack).
+
+With AUTO_FIX on, querysets evaluated inside a detection scope stamp their
+instances with the queryset's SQL; once an N+1 is traced back to such
+instances, later querysets with that SQL get the matching
+``select_related``/``prefetch_related`` before they run.
+
+In tests, wrap the code under test in ``assert_no_n_plus_one()``.
+"""
+import logging
+import sys
+import sysconfig
+import threading
+import traceback
+from contextlib import ContextDecorator, ExitStack
+
+from django.conf import settings
+from django.core.exceptions import EmptyResultSet, FullResultSet
+from django.db import connections
+from django.db.models.fields.related_descriptors import (
+    ForwardManyToOneDescriptor,
+    ReverseOneToOneDescriptor,
+)
+from django.db.models.query import ModelIterable, QuerySet
+from django.utils.deprecation import MiddlewareMixin
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_NPLUSONE = {
+    'THRESHOLD': 3,
+    'AUTO_FIX': False,
+    'STACK_LIMIT': 12,
+}
+
+# Instance attribute holding the SQL of the queryset that produced it.
+ORIGIN_ATTR = '_nplusone_origin'
+
+# Frames from these paths are Django/library internals, not the caller.
+_LIBRARY_PATHS = tuple({
+    sysconfig.get_paths()['stdlib'],
+    sysconfig.get_paths()['purelib'],
+    sysconfig.get_paths()['platlib'],
+    __file__,
+})
+
+_local = threading.local()
+_fixes = {}
+_fixes_lock = threading.Lock()
+_patch_lock = threading.Lock()
+_patch_scopes = 0
+
+
+def get_config():
+    return {**DEFAULT_NPLUSONE, **getattr(settings, 'NPLUSONE', {})}
+
+
+class NPlusOneError(AssertionError):
+    """
+    Raised by ``assert_no_n_plus_one`` when N+1 queries were detected.
+    """
+
+
+class NPlusOneEvent:
+    """
+    A query shape repeated with different parameters in one scope.
+    """
+
+    def __init__(self, alias, sql, stack, relation):
+        self.alias = alias
+        self.sql = sql
+        self.stack = stack
+        self.relation = relation
+        self.count = 0
+
+    def describe(self):
+        """
+        One-paragraph description with the stack that issued the query.
+
+        :return: Text for logs and assertion messages
+        """
+        lines = [f'N+1 on {self.alias!r}: {self.count} queries like {self.sql}']
+        if self.relation is not None:
+            model, lookup, method = self.relation
+            lines.append(
+                f'  fix: {method}({lookup!r}) on the {model._meta.label} queryset')
+        lines.extend('  ' + line.rstrip()
+                     for line in traceback.format_list(self.stack))
+        return '\n'.join(lines)
+
+
+class NPlusOneDetector:
+    """
+    ``execute_wrapper`` that spots repeated same-shape SELECTs.
+    """
+
+    def __init__(self, threshold=3, auto_fix=False, stack_limit=12):
+        self.threshold = threshold
+        self.auto_fix = auto_fix
+        self.stack_limit = stack_limit
+        self.events = []
+        self._seen = {}
+
+    def wrapper(self, alias):
+        """
+        Return an ``execute_wrapper`` callable for one alias.
+        """
+        def execute_wrapper(execute, sql, params, many, context):
+            if not many and sql.lstrip()[:6].upper() == 'SELECT':
+                self._observe(alias, sql, params)
+            return execute(sql, params, many, context)
+        return execute_wrapper
+
+    def _observe(self, alias, sql, params):
+        key = (alias, sql)
+        seen = self._seen.get(key)
+        if seen is None:
+            seen = self._seen[key] = [set(), None]
+        try:
+            param_key = tuple(params or ())
+            hash(param_key)
+        except TypeError:
+            param_key = repr(params)
+        if param_key in seen[0]:
+            return
+        seen[0].add(param_key)
+
+        event = seen[1]
+        if event is None:
+            if len(seen[0]) < self.threshold:
+                return
+            relation, origin = find_relation()
+            stack = [frame for frame in traceback.extract_stack()
+                     if not frame.filename.startswith(_LIBRARY_PATHS)]
+            event = seen[1] = NPlusOneEvent(
+                alias, sql, stack[-self.stack_limit:], relation)
+            self.events.append(event)
+            if self.auto_fix and relation is not None and origin is not None:
+                add_fix(origin, relation)
+        event.count = len(seen[0])
+
+    def report(self):
+        """
+        Log every event found so far.
+        """
+        for event in self.events:
+            logger.warning(event.describe())
+
+
+class detect_n_plus_one(ContextDecorator):
+    """
+    Detect N+1 queries on every database alias while the block runs.
+
+    The detector is available as the ``as`` target; events are logged when
+    the block exits.
+    """
+
+    def __init__(self, threshold=None, auto_fix=None, log=True):
+        config = get_config()
+        self.threshold = config['THRESHOLD'] if threshold is None else threshold
+        self.auto_fix = config['AUTO_FIX'] if auto_fix is None else auto_fix
+        self.stack_limit = config['STACK_LIMIT']
+        self.log = log
+
+    def __enter__(self):
+        self.detector = NPlusOneDetector(
+            self.threshold, self.auto_fix, self.stack_limit)
+        self._stack = ExitStack()
+        for alias in connections:
+            self._stack.enter_context(
+                connections[alias].execute_wrapper(self.detector.wrapper(alias)))
+        if self.auto_fix:
+            install_auto_fix()
+            self._previous = getattr(_local, 'stamping', False)
+            _local.stamping = True
+        return self.detector
+
+    def __exit__(self, *exc_info):
+        self._stack.close()
+        if self.auto_fix:
+            _local.stamping = self._previous
+            uninstall_auto_fix()
+        if self.log:
+            self.detector.report()
+        return False
+
+
+class assert_no_n_plus_one(detect_n_plus_one):
+    """
+    Test helper that fails when the block issues N+1 queries.
+
+    Usable as a context manager or a decorator::
+
+        with assert_no_n_plus_one():
+            self.client.get(USERS_URL)
+    """
+
+    def __init__(self, threshold=None):
+        super().__init__(threshold=threshold, auto_fix=False, log=False)
+
+    def __exit__(self, exc_type, exc_value, tb):
+        super().__exit__(exc_type, exc_value, tb)
+        if exc_type is None and self.detector.events:
+            raise NPlusOneError('\n\n'.join(
+                event.describe() for event in self.detector.events))
+        return False
+
+
+class NPlusOneMiddleware(MiddlewareMixin):
+    """
+    Middleware that reports N+1 queries issued while handling a request.
+    """
+
+    def process_request(self, request):
+        """
+        Start a detection scope for the request.
+
+        :param request: Django HTTP request object
+        """
+        scope = detect_n_plus_one()
+        request.n_plus_one = scope.__enter__()
+        request._n_plus_one_scope = scope
+
+    def process_response(self, request, response):
+        """
+        Close the request's detection scope and log what it found.
+
+        :param request: Django HTTP request object
+        :param response: Django HTTP response object
+        :return: Unmodified response object
+        """
+        scope = getattr(request, '_n_plus_one_scope', None)
+        if scope is not None:
+            scope.__exit__(None, None, None)
+        return response
+
+
+def find_relation(max_depth=40):
+    """
+    Work out which relation the current query is loading.
+
+    :return: ((model, lookup, method), origin) from the stack, where origin
+        is the SQL stamped on the parent instance (or None); (None, None) if
+        no relation access is on the stack
+    """
+    frame = sys._getframe(2)
+    to_many = None
+    depth = 0
+    while frame is not None and depth < max_depth:
+        owner = frame.f_locals.get('self')
+        if isinstance(owner, ForwardManyToOneDescriptor):
+            instance = frame.f_locals.get('instance')
+            return ((type(instance), owner.field.name, 'select_related'),
+                    _origin(instance))
+        if isinstance(owner, ReverseOneToOneDescriptor):
+            instance = frame.f_locals.get('instance')
+            return ((type(instance), owner.related.get_accessor_name(),
+                     'select_related'), _origin(instance))
+        if (to_many is None and isinstance(owner, QuerySet)
+                and owner._hints.get('instance') is not None):
+            to_many = owner
+        frame = frame.f_back
+        depth += 1
+
+    if to_many is not None:
+        instance = to_many._hints['instance']
+        lookup = _to_many_accessor(type(instance), to_many)
+        if lookup is not None:
+            return ((type(instance), lookup, 'prefetch_related'),
+                    _origin(instance))
+    return None, None
+
+
+def _to_many_accessor(model, queryset):
+    for field, _objs in queryset._known_related_objects.items():
+        if field.model is queryset.model and field.remote_field.model is model:
+            return field.remote_field.get_accessor_name()
+    for field in model._meta.get_fields():
+        if not (field.many_to_many or field.one_to_many):
+            continue
+        if field.related_model is not queryset.model:
+            continue
+        return field.get_accessor_name() if field.auto_created else field.name
+    return None
+
+
+def _origin(instance):
+    return None if instance is None else instance.__dict__.get(ORIGIN_ATTR)
+
+
+def add_fix(origin, relation):
+    """
+    Remember to apply a relation lookup to querysets with the given SQL.
+
+    :param origin: (model label, SQL) of the parent queryset
+    :param relation: (model, lookup, method) returned by ``find_relation``
+    """
+    model, lookup, method = relation
+    with _fixes_lock:
+        _fixes.setdefault(origin, set()).add((method, lookup))
+    logger.info('Applying %s(%r) to %s querysets from now on',
+                method, lookup, model._meta.label)
+
+
+def get_fixes():
+    """
+    Return the learned fixes, keyed by (model label, SQL).
+    """
+    with _fixes_lock:
+        return {origin: sorted(fixes) for origin, fixes in _fixes.items()}
+
+
+def reset_fixes():
+    """
+    Forget every learned fix.
+    """
+    with _fixes_lock:
+        _fixes.clear()
+
+
+_original_fetch_all = QuerySet._fetch_all
+
+
+def _fetch_all(self):
+    if (self._result_cache is not None or not getattr(_local, 'stamping', False)
+            or self._iterable_class is not ModelIterable):
+        return _original_fetch_all(self)
+
+    try:
+        sql, _params = self.query.get_compiler(self.db).as_sql()
+    except (EmptyResultSet, FullResultSet):
+        # Nothing to fix in a query Django answers without running it.
+        return _original_fetch_all(self)
+    origin = (self.model._meta.label, sql)
+    fixes = _fixes.get(origin)
+    if fixes:
+        for method, lookup in fixes:
+            if method == 'select_related':
+                # select_related() can't traverse a deferred foreign key.
+                if (self.query.select_related is not True
+                        and not self.query.deferred_loading[0]):
+                    self.query.add_select_related([lookup])
+            elif lookup not in self._prefetch_related_lookups:
+                self._prefetch_related_lookups += (lookup,)
+    _original_fetch_all(self)
+    for obj in self._result_cache:
+        obj.__dict__[ORIGIN_ATTR] = origin
+
+
+def install_auto_fix():
+    """
+    Patch ``QuerySet._fetch_all`` so querysets in AUTO_FIX scopes are fixed.
+
+    The patch stays until every scope that installed it has called
+    ``uninstall_auto_fix``; threads outside those scopes go straight to the
+    original method.
+    """
+    global _patch_scopes
+    with _patch_lock:
+        if not _patch_scopes:
+            QuerySet._fetch_all = _fetch_all
+        _patch_scopes += 1
+
+
+def uninstall_auto_fix():
+    """
+    Undo one ``install_auto_fix``; the last one restores ``QuerySet``.
+    """
+    global _patch_scopes
+    with _patch_lock:
+        _patch_scopes -= 1
+        if not _patch_scopes:
+            QuerySet._fetch_all = _original_fetch_all
@@ -0,0 +1,447 @@
+"""
+Learned column projection for querysets.
+
+``ProjectionLearner.project(queryset, site)`` watches which concrete fields
+the code at ``site`` (a view name, or the caller's file:line by default)
+actually reads from the instances it gets back. The first MIN_SAMPLES
+querysets at a site, and SAMPLE_RATE of them afterwards, are fetched in full
+with tracking on; every other queryset gets ``only()`` with the fields seen
+so far plus the primary key.
+
+Only the instances of those querysets are tracked: each is switched to a
+subclass of its model whose field descriptors record reads. Other instances
+of the model, and the model class itself, are left alone. A read of a field
+the projection left out is a miss: the field is loaded for every instance
+of that result set in one query, and the site's projection is widened so
+the next queryset includes it.
+"""
+import inspect
+import random
+import sys
+import threading
+import time
+from datetime import date, datetime, time as time_of_day, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db.models.query import ModelIterable
+from django.dispatch import receiver
+
+
+DEFAULT_QUERY_PROJECTION = {
+    'ENABLED': True,
+    'SAMPLE_RATE': 0.01,
+    'MIN_SAMPLES': 20,
+}
+
+# Instance attribute holding the recorder of the result set it came from.
+RECORDER_ATTR = '_projection_recorder'
+
+
+def _value_size(value):
+    """
+    Rough number of bytes a value takes on the wire.
+    """
+    if value is None:
+        return 0
+    if isinstance(value, bool):
+        return 1
+    if isinstance(value, (int, float, datetime, date, time_of_day, timedelta)):
+        return 8
+    if isinstance(value, str):
+        return len(value.encode())
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return len(value)
+    if isinstance(value, Decimal):
+        return len(str(value))
+    return sys.getsizeof(value)
+
+
+class TrackingAttribute:
+    """
+    Data descriptor that records reads of a model field.
+
+    Values stay in the instance ``__dict__`` as usual; writes go through the
+    original descriptor when it has its own ``__set__`` (foreign keys).
+    """
+
+    def __init__(self, original, field):
+        self.original = original
+        self.field = field
+        self.attname = field.attname
+        self._set = getattr(original, '__set__', None)
+
+    def __get__(self, instance, cls=None):
+        if instance is None:
+            return self.original
+        data = instance.__dict__
+        recorder = data.get(RECORDER_ATTR)
+        try:
+            value = data[self.attname]
+        except KeyError:
+            if recorder is not None:
+                recorder.miss(instance, self.attname)
+            return self.original.__get__(instance, cls)
+        if recorder is not None:
+            recorder.touched.add(self.attname)
+        return value
+
+    def __set__(self, instance, value):
+        if self._set is not None:
+            self._set(instance, value)
+        else:
+            instance.__dict__[self.attname] = value
+
+
+def _untracked(method_name):
+    def method(self, *args, **kwargs):
+        # Writes see the real model class, so signals keep their sender.
+        self.__class__ = self._projection_model
+        self.__dict__.pop(RECORDER_ATTR, None)
+        return getattr(self, method_name)(*args, **kwargs)
+
+    method.__name__ = method_name
+    return method
+
+
+def _getstate(self):
+    # Recorders hold locks and stats; keep them out of pickles and copies.
+    state = self._projection_model.__getstate__(self)
+    state.pop(RECORDER_ATTR, None)
+    return state
+
+
+_tracking_classes = {}
+_tracking_classes_lock = threading.Lock()
+
+
+def tracking_class(model):
+    """
+    Return the subclass of ``model`` that tracked instances are switched to.
+
+    It only overrides the concrete field descriptors, and is built with
+    ``type.__new__`` so Django doesn't register it as a model: ``_meta``,
+    managers and pickling are the model's own. Saving or deleting an
+    instance switches it back to ``model`` first.
+
+    :param model: Model class
+    :return: Tracking class, built once per model
+    """
+    cls = _tracking_classes.get(model)
+    if cls is None:
+        with _tracking_classes_lock:
+            cls = _tracking_classes.get(model)
+            if cls is None:
+                attrs = {
+                    field.attname: TrackingAttribute(
+                        inspect.getattr_static(model, field.attname), field)
+                    for field in model._meta.concrete_fields
+                }
+                attrs.update({
+                    '__module__': model.__module__,
+                    '__qualname__': model.__qualname__,
+                    '__getstate__': _getstate,
+                    '_projection_model': model,
+                    'save': _untracked('save'),
+                    'asave': _untracked('asave'),
+                    'delete': _untracked('delete'),
+                    'adelete': _untracked('adelete'),
+                })
+                cls = type.__new__(type(model), model.__name__, (model,), attrs)
+                _tracking_classes[model] = cls
+    return cls
+
+
+class SiteStats:
+    """
+    What one call site reads, and what projecting it has saved.
+    """
+
+    def __init__(self, site, model):
+        self.site = site
+        self.model = model
+        self.lock = threading.Lock()
+        self.touched = set()
+        self.projection = None
+        self.samples = 0
+        self.misses = 0
+        self.field_bytes = dict.fromkeys(
+            (f.attname for f in model._meta.concrete_fields), 0)
+        self.rows_full = 0
+        self.rows_projected = 0
+        self.seconds_full = 0.0
+        self.seconds_projected = 0.0
+
+    def learn(self, min_samples):
+        with self.lock:
+            self.samples += 1
+            if self.projection is None and self.samples >= min_samples:
+                self.projection = frozenset(self.touched) | {
+                    self.model._meta.pk.attname}
+
+    def widen(self, attname):
+        with self.lock:
+            self.misses += 1
+            self.touched.add(attname)
+            if self.projection is not None:
+                self.projection = self.projection | {attname}
+
+    def report(self):
+        """
+        Summarize the site for the projection report.
+
+        :return: Dict of fields, rows and estimated bytes/time saved
+        """
+        with self.lock:
+            avg = {
+                name: total / self.rows_full if self.rows_full else 0
+                for name, total in self.field_bytes.items()
+            }
+            projection = self.projection or frozenset(avg)
+            full_row = sum(avg.values())
+            projected_row = sum(avg[name] for name in projection)
+            full_us = (self.seconds_full / self.rows_full * 1e6
+                       if self.rows_full else 0.0)
+            projected_us = (self.seconds_projected / self.rows_projected * 1e6
+                            if self.rows_projected else 0.0)
+            return {
+                'site': self.site,
+                'table': self.model._meta.db_table,
+                'fields': len(avg),
+                'projected_fields': sorted(projection),
+                'samples': self.samples,
+                'misses': self.misses,
+                'rows_full': self.rows_full,
+                'rows_projected': self.rows_projected,
+                'row_bytes_full': round(full_row, 1),
+                'row_bytes_projected': round(projected_row, 1),
+                'bytes_saved': round(
+                    (full_row - projected_row) * self.rows_projected),
+                'row_us_full': round(full_us, 2),
+                'row_us_projected': round(projected_us, 2),
+                'seconds_saved': round(
+                    max(full_us - projected_us, 0.0)
+                    * self.rows_projected / 1e6, 6),
+            }
+
+
+class SampleRecorder:
+    """
+    Recorder for a fully fetched, tracked result set.
+    """
+
+    def __init__(self, stats):
+        self.touched = stats.touched
+
+    def miss(self, instance, attname):
+        pass
+
+
+class ProjectionRecorder:
+    """
+    Recorder for a projected result set; loads missed fields in bulk.
+    """
+
+    def __init__(self, stats, keep_instances=True):
+        self.stats = stats
+        self.touched = set()
+        self.instances = [] if keep_instances else None
+
+    def miss(self, instance, attname):
+        self.stats.widen(attname)
+        if not self.instances:
+            return
+        pending = {
+            obj.pk: obj for obj in self.instances
+            if attname not in obj.__dict__
+        }
+        model = instance._meta.model
+        rows = model._base_manager.using(instance._state.db).filter(
+            pk__in=list(pending)).values_list('pk', attname)
+        for pk, value in rows:
+            pending[pk].__dict__[attname] = value
+
+
+class TrackingIterable(ModelIterable):
+    """
+    ModelIterable that attaches a recorder to each instance it yields.
+    """
+    stats = None
+    sampled = False
+
+    def __iter__(self):
+        stats = self.stats
+        if self.sampled:
+            recorder = SampleRecorder(stats)
+        else:
+            recorder = ProjectionRecorder(
+                stats, keep_instances=not self.chunked_fetch)
+        rows = 0
+        seconds = 0.0
+        sizes = dict.fromkeys(stats.field_bytes, 0)
+        tracked = tracking_class(stats.model)
+        iterator = super().__iter__()
+        while True:
+            start = time.perf_counter()
+            try:
+                obj = next(iterator)
+            except StopIteration:
+                break
+            seconds += time.perf_counter() - start
+            rows += 1
+            obj.__class__ = tracked
+            obj.__dict__[RECORDER_ATTR] = recorder
+            if self.sampled:
+                data = obj.__dict__
+                for name in sizes:
+                    sizes[name] += _value_size(data.get(name))
+            elif recorder.instances is not None:
+                recorder.instances.append(obj)
+            yield obj
+
+        with stats.lock:
+            if self.sampled:
+                stats.rows_full += rows
+                stats.seconds_full += seconds
+                for name, size in sizes.items():
+                    stats.field_bytes[name] += size
+            else:
+                stats.rows_projected += rows
+                stats.seconds_projected += seconds
+
+
+class ProjectionLearner:
+    """
+    Learns and applies an ``only()`` projection per call site.
+    """
+
+    def __init__(self, sample_rate=0.01, min_samples=20):
+        self.sample_rate = sample_rate
+        self.min_samples = min_samples
+        self._sites = {}
+        self._iterables = {}
+        self._lock = threading.Lock()
+
+    def project(self, queryset, site=None, depth=1):
+        """
+        Return the queryset with the learned projection for its call site.
+
+        Querysets that already use ``only()``/``defer()``, ``values()`` or
+        a bare ``select_related()`` are returned unchanged.
+
+        :param queryset: Django QuerySet object
+        :param site: Call site key; defaults to the caller's file:line
+        :param depth: Frames to skip when working out the caller
+        :return: Tracked, possibly projected QuerySet
+        """
+        if (queryset._iterable_class is not ModelIterable
+                or queryset.query.deferred_loading != (frozenset(), True)
+                or queryset.query.select_related is True):
+            return queryset
+        if site is None:
+            frame = sys._getframe(depth)
+            site = f'{frame.f_code.co_filename}:{frame.f_lineno}'
+
+        stats = self._get_stats(site, queryset.model)
+        sampled = (stats.projection is None
+                   or random.random() < self.sample_rate)
+        queryset = queryset._chain()
+        if sampled:
+            stats.learn(self.min_samples)
+        else:
+            related = queryset.query.select_related or {}
+            queryset = queryset.only(*stats.projection, *related)
+        queryset._iterable_class = self._get_iterable(stats, sampled)
+        return queryset
+
+    def report(self):
+        """
+        Return the per-site projection report.
+
+        :return: List of dicts, most bytes saved first
+        """
+        with self._lock:
+            sites = list(self._sites.values())
+        return sorted((stats.report() for stats in sites),
+                      key=lambda row: row['bytes_saved'], reverse=True)
+
+    def format_report(self):
+        """
+        Render the report as a text table.
+
+        :return: Report text
+        """
+        lines = [
+            f"{'site':<48} {'table':<12} {'cols':>9} {'rows':>8} "
+            f"{'misses':>6} {'bytes saved':>12} {'us/row':>15}"
+        ]
+        for row in self.report():
+            lines.append(
+                f"{row['site'][-48:]:<48} {row['table']:<12} "
+                f"{len(row['projected_fields']):>4}/{row['fields']:<4} "
+                f"{row['rows_projected']:>8} {row['misses']:>6} "
+                f"{row['bytes_saved']:>12} "
+                f"{row['row_us_full']:>7}->{row['row_us_projected']:<7}"
+            )
+        return '\n'.join(lines)
+
+    def _get_stats(self, site, model):
+        stats = self._sites.get(site)
+        if stats is None:
+            with self._lock:
+                stats = self._sites.get(site)
+                if stats is None:
+                    stats = self._sites[site] = SiteStats(site, model)
+        return stats
+
+    def _get_iterable(self, stats, sampled):
+        key = (stats.site, sampled)
+        iterable = self._iterables.get(key)
+        if iterable is None:
+            iterable = type('TrackingIterable', (TrackingIterable,), {
+                'stats': stats, 'sampled': sampled})
+            self._iterables[key] = iterable
+        return iterable
+
+
+_learner = None
+_learner_lock = threading.Lock()
+
+
+def get_config():
+    return {
+        **DEFAULT_QUERY_PROJECTION,
+        **getattr(settings, 'QUERY_PROJECTION', {}),
+    }
+
+
+def get_learner():
+    """
+    Return the process-wide projection learner built from settings.
+    """
+    global _learner
+    if _learner is None:
+        with _learner_lock:
+            if _learner is None:
+                config = get_config()
+                _learner = ProjectionLearner(
+                    sample_rate=config['SAMPLE_RATE'],
+                    min_samples=config['MIN_SAMPLES'],
+                )
+    return _learner
+
+
+def reset_learner():
+    """
+    Forget every learned projection (used when settings change).
+    """
+    global _learner
+    with _learner_lock:
+        _learner = None
+
+
+@receiver(setting_changed)
+def reload_projection(setting, **kwargs):
+    if setting == 'QUERY_PROJECTION':
+        reset_learner()
@@ -0,0 +1,305 @@
+"""
+Query-result cache with single-flight locking, probabilistic early refresh
+and tag-based invalidation.
+
+Entries are stored in a Django cache wrapped in a ``CacheEntry`` so that
+falsy results (``[]``, ``0``, ``None``) are cached like anything else.
+
+Each entry records the version of every tag it depends on when it was
+computed. Bumping a tag's version (done automatically on ``post_save`` and
+``post_delete`` for watched models) makes exactly the entries carrying that
+tag stale, without having to know their keys.
+
+When an entry is about to expire, XFetch (Vattani et al., "Optimal
+Probabilistic Cache Stampede Prevention") makes one reader refresh it early
+with a probability that grows as expiry approaches. Only the process that
+wins a ``cache.add`` lock recomputes; the others keep serving the previous
+value, or wait briefly for the winner if there is none.
+"""
+import math
+import random
+import threading
+import time
+import uuid
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+
+DEFAULT_QUERY_CACHE = {
+    'CACHE_ALIAS': 'default',
+    'KEY_PREFIX': 'qc:',
+    'TIMEOUT': 300,
+    'STALE_TIMEOUT': 60,
+    'BETA': 1.0,
+    'LOCK_TIMEOUT': 30,
+    'WAIT_TIMEOUT': 5,
+    'POLL_INTERVAL': 0.05,
+    'WATCH_MODELS': [],
+}
+
+
+CacheEntry = namedtuple('CacheEntry', 'value expires delta tags')
+CacheEntry.__doc__ = """
+Cached value with its logical expiry (epoch seconds), the time it took to
+compute and the tag versions it was computed against.
+"""
+
+
+class QueryCache:
+    """
+    Stampede-safe cache for the results of expensive queries.
+    """
+
+    def __init__(self, cache_alias='default', key_prefix='qc:', timeout=300,
+                 stale_timeout=60, beta=1.0, lock_timeout=30, wait_timeout=5,
+                 poll_interval=0.05):
+        self.cache_alias = cache_alias
+        self.key_prefix = key_prefix
+        self.timeout = timeout
+        self.stale_timeout = stale_timeout
+        self.beta = beta
+        self.lock_timeout = lock_timeout
+        self.wait_timeout = wait_timeout
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.early_refreshes = 0
+        self.waits = 0
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    def get_or_compute(self, key, compute, tags=(), timeout=None):
+        """
+        Return the cached result for key, computing it at most once at a time.
+
+        :param key: Cache key of the result
+        :param compute: Zero-argument callable that runs the query
+        :param tags: Tags the result depends on, e.g. ``model_tag(User)``
+        :param timeout: Seconds the result stays fresh; defaults to TIMEOUT
+        :return: Cached or freshly computed result
+        """
+        timeout = self.timeout if timeout is None else timeout
+        cache_key = self.key_prefix + key
+        entry = self._get_valid(cache_key)
+
+        if entry is not None:
+            if not self._should_refresh(entry):
+                self._count('hits')
+                return entry.value
+            self._count('early_refreshes')
+        else:
+            self._count('misses')
+
+        lock_key = cache_key + ':lock'
+        lock_token = uuid.uuid4().hex
+        if self.cache.add(lock_key, lock_token, timeout=self.lock_timeout):
+            try:
+                return self._compute(cache_key, compute, tags, timeout)
+            finally:
+                if self.cache.get(lock_key) == lock_token:
+                    self.cache.delete(lock_key)
+
+        if entry is not None:
+            # Someone else is refreshing it; the current value is still fine.
+            return entry.value
+
+        self._count('waits')
+        deadline = time.monotonic() + self.wait_timeout
+        while time.monotonic() < deadline:
+            time.sleep(self.poll_interval)
+            entry = self._get_valid(cache_key)
+            if entry is not None:
+                return entry.value
+        # The lock holder is stuck or gone; don't wait on it forever.
+        return self._compute(cache_key, compute, tags, timeout)
+
+    def delete(self, key):
+        """
+        Drop a single cached result.
+
+        :param key: Cache key of the result
+        """
+        self.cache.delete(self.key_prefix + key)
+
+    def invalidate_tags(self, *tags):
+        """
+        Make every entry that depends on any of the tags stale.
+
+        :param tags: Tags to invalidate
+        """
+        self.cache.set_many(
+            {self._tag_key(tag): uuid.uuid4().hex for tag in tags},
+            timeout=None,
+        )
+
+    def stats(self):
+        """
+        Return counters for monitoring.
+
+        :return: Dict of hits, misses, early refreshes, waits and hit ratio
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'early_refreshes': self.early_refreshes,
+                'waits': self.waits,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+            }
+
+    def _compute(self, cache_key, compute, tags, timeout):
+        # Read the tag versions first: a write that lands while computing
+        # bumps them, so this result is already stale on the next read.
+        versions = self._tag_versions(tags)
+        start = time.time()
+        value = compute()
+        delta = time.time() - start
+        entry = CacheEntry(value, time.time() + timeout, delta, versions)
+        self.cache.set(cache_key, entry, timeout=timeout + self.stale_timeout)
+        return value
+
+    def _get_valid(self, cache_key):
+        entry = self.cache.get(cache_key)
+        if not isinstance(entry, CacheEntry):
+            return None
+        if entry.tags and self._tag_versions(entry.tags) != entry.tags:
+            return None
+        return entry
+
+    def _should_refresh(self, entry):
+        # XFetch: now - delta * beta * ln(rand) >= expiry. Expired entries
+        # (in their stale grace period) always qualify.
+        jitter = entry.delta * self.beta * math.log(1.0 - random.random())
+        return time.time() - jitter >= entry.expires
+
+    def _tag_versions(self, tags):
+        if not tags:
+            return {}
+        keys = {self._tag_key(tag): tag for tag in tags}
+        found = self.cache.get_many(keys)
+        missing = {key: uuid.uuid4().hex for key in keys if key not in found}
+        for key, version in missing.items():
+            if not self.cache.add(key, version, timeout=None):
+                version = self.cache.get(key, version)
+            found[key] = version
+        return {keys[key]: found[key] for key in keys}
+
+    def _tag_key(self, tag):
+        return f'{self.key_prefix}tag:{tag}'
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+
+def model_tag(model):
+    """
+    Tag for results that depend on any row of a model.
+
+    :param model: Model class or instance
+    :return: Tag string such as ``core.user``
+    """
+    return model._meta.label_lower
+
+
+def instance_tag(instance):
+    """
+    Tag for results that depend on a single row.
+
+    :param instance: Model instance
+    :return: Tag string such as ``core.user:42``
+    """
+    return f'{model_tag(instance)}:{instance.pk}'
+
+
+_query_cache = None
+_query_cache_lock = threading.Lock()
+
+
+def get_query_cache():
+    """
+    Return the process-wide query cache built from ``QUERY_CACHE`` settings.
+    """
+    global _query_cache
+    if _query_cache is None:
+        with _query_cache_lock:
+            if _query_cache is None:
+                config = {
+                    **DEFAULT_QUERY_CACHE,
+                    **getattr(settings, 'QUERY_CACHE', {}),
+                }
+                _query_cache = QueryCache(
+                    cache_alias=config['CACHE_ALIAS'],
+                    key_prefix=config['KEY_PREFIX'],
+                    timeout=config['TIMEOUT'],
+                    stale_timeout=config['STALE_TIMEOUT'],
+                    beta=config['BETA'],
+                    lock_timeout=config['LOCK_TIMEOUT'],
+                    wait_timeout=config['WAIT_TIMEOUT'],
+                    poll_interval=config['POLL_INTERVAL'],
+                )
+    return _query_cache
+
+
+def reset_query_cache():
+    """
+    Forget the process-wide query cache (used when settings change).
+    """
+    global _query_cache
+    with _query_cache_lock:
+        _query_cache = None
+
+
+@receiver(setting_changed)
+def reload_query_cache(setting, **kwargs):
+    if setting == 'QUERY_CACHE':
+        reset_query_cache()
+
+
+def invalidate_instance(sender, instance, using=None, **kwargs):
+    """
+    Signal receiver that invalidates the model and row tags of a write.
+
+    The tags are bumped now and again when the transaction commits, so a
+    result recomputed from the old rows before the commit doesn't survive it.
+    """
+    tags = (model_tag(instance), instance_tag(instance))
+    get_query_cache().invalidate_tags(*tags)
+    transaction.on_commit(lambda: get_query_cache().invalidate_tags(*tags),
+                          using=using)
+
+
+def watch_model(model):
+    """
+    Invalidate a model's tags whenever one of its rows is saved or deleted.
+
+    Queryset ``update()``/``delete()`` and raw SQL send no signals; call
+    ``invalidate_tags`` yourself after those.
+
+    :param model: Model class or ``"app_label.ModelName"`` string
+    """
+    uid = f'query-cache:{model}'
+    post_save.connect(invalidate_instance, sender=model, dispatch_uid=uid)
+    post_delete.connect(invalidate_instance, sender=model, dispatch_uid=uid)
+
+
+def watch_models():
+    """
+    Watch every model listed in ``QUERY_CACHE['WATCH_MODELS']``.
+
+    Called from ``CoreConfig.ready`` so every process, not only those that
+    read the cache, invalidates on writes.
+    """
+    config = {**DEFAULT_QUERY_CACHE, **getattr(settings, 'QUERY_CACHE', {})}
+    for model in config['WATCH_MODELS']:
+        watch_model(model)
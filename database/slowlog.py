@@ -0,0 +1,331 @@
+"""
+Slow query log.
+
+``QueryOptimizationMiddleware`` hands every statement slower than
+THRESHOLD_MS to ``SlowQueryLog.record``. Records are kept in a bounded ring
+buffer and aggregated by shape: the SQL with literals and IN-lists replaced
+by placeholders, so the same query with different values groups together.
+At most MAX_SHAPES shapes are kept; a new one evicts the shape with the
+least total time.
+
+Anything that touches the database or the disk is done by a single
+background thread, never on the request path. It appends each slow record
+to a JSONL file at PATH, and runs ``EXPLAIN`` (``EXPLAIN QUERY PLAN`` on
+SQLite) once for each shape that enters the EXPLAIN_TOP worst by total
+time. ``manage.py slow_queries`` reads that file. Every worker process
+appends to the same file; rotation happens under a lock file next to it.
+"""
+import fcntl
+import json
+import logging
+import math
+import os
+import queue
+import re
+import threading
+import time
+from collections import deque
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import connections
+from django.dispatch import receiver
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SLOW_QUERY_LOG = {
+    'ENABLED': True,
+    'THRESHOLD_MS': 100,
+    'BUFFER_SIZE': 1000,
+    'EXPLAIN_TOP': 20,
+    'MAX_SHAPES': 1000,
+    'PATH': None,
+    'MAX_BYTES': 50 * 1024 * 1024,
+    'QUEUE_SIZE': 1000,
+}
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'(?<![\w."])-?\b\d+(?:\.\d+)?\b')
+_IN_LIST = re.compile(r'\bIN\s*\(\s*(?:\?|%s)(?:\s*,\s*(?:\?|%s))*\s*\)',
+                      re.IGNORECASE)
+_SPACE = re.compile(r'\s+')
+
+
+def percentile(samples, pct):
+    """
+    Return a percentile of samples, nearest-rank.
+
+    :param samples: Numbers, in any order
+    :param pct: Percentile from 0 to 100
+    :return: The sample at that rank, or 0.0 if there are none
+    """
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+@lru_cache(maxsize=4096)
+def normalize(sql):
+    """
+    Reduce a statement to its shape.
+
+    :param sql: SQL text, with or without placeholders
+    :return: SQL with literals as ``?`` and IN-lists as ``IN (...)``
+    """
+    shape = _STRING.sub('?', sql)
+    shape = _NUMBER.sub('?', shape)
+    shape = shape.replace('%s', '?')
+    shape = _IN_LIST.sub('IN (...)', shape)
+    return _SPACE.sub(' ', shape).strip()
+
+
+class ShapeStats:
+    """
+    Aggregate of every slow record with the same shape.
+    """
+
+    def __init__(self, shape, alias):
+        self.shape = shape
+        self.alias = alias
+        self.count = 0
+        self.total = 0.0
+        self.durations = deque(maxlen=256)
+        self.plan = None
+        self.explain_queued = False
+
+    def as_dict(self):
+        return {
+            'shape': self.shape,
+            'alias': self.alias,
+            'count': self.count,
+            'total_ms': round(self.total * 1000, 3),
+            'p95_ms': round(percentile(self.durations, 95) * 1000, 3),
+            'plan': self.plan,
+        }
+
+
+class SlowQueryLog:
+    """
+    Ring buffer of slow queries with per-shape aggregates.
+    """
+
+    def __init__(self, threshold_ms=100, buffer_size=1000, explain_top=20,
+                 path=None, max_bytes=50 * 1024 * 1024, queue_size=1000,
+                 max_shapes=1000):
+        self.threshold = threshold_ms / 1000
+        self.records = deque(maxlen=buffer_size)
+        self.explain_top = explain_top
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_shapes = max_shapes
+        self.shapes = {}
+        self.dropped = 0
+        self.evicted = 0
+        self._lock = threading.Lock()
+        self._jobs = queue.Queue(maxsize=queue_size)
+        self._worker = None
+
+    def record(self, alias, sql, params, duration):
+        """
+        Add a statement that took at least THRESHOLD_MS.
+
+        :param alias: Database alias it ran on
+        :param sql: SQL as passed to the cursor
+        :param params: Parameters as passed to the cursor
+        :param duration: Seconds it took
+        """
+        shape = normalize(sql)
+        record = {
+            'ts': time.time(),
+            'alias': alias,
+            'shape': shape,
+            'duration_ms': round(duration * 1000, 3),
+        }
+        with self._lock:
+            self.records.append(record)
+            stats = self.shapes.get(shape)
+            if stats is None:
+                if len(self.shapes) >= self.max_shapes:
+                    self._evict()
+                stats = self.shapes[shape] = ShapeStats(shape, alias)
+            stats.count += 1
+            stats.total += duration
+            stats.durations.append(duration)
+            explain = not stats.explain_queued and self._is_worst(stats)
+            if explain:
+                stats.explain_queued = True
+
+        if self.path:
+            self._submit(('record', record))
+        if explain:
+            self._submit(('explain', (stats, alias, sql, params)))
+
+    def top(self, limit=20, sort='total_ms'):
+        """
+        Return the worst shapes seen by this process.
+
+        :param limit: Number of shapes to return
+        :param sort: ``total_ms``, ``count`` or ``p95_ms``
+        :return: List of shape dicts, worst first
+        """
+        with self._lock:
+            rows = [stats.as_dict() for stats in self.shapes.values()]
+        return sorted(rows, key=lambda row: row[sort], reverse=True)[:limit]
+
+    def flush(self, timeout=5):
+        """
+        Wait until the background thread has caught up.
+
+        :param timeout: Seconds to wait at most
+        """
+        deadline = time.monotonic() + timeout
+        while self._jobs.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def close(self, timeout=5):
+        """
+        Stop the background thread after the jobs already queued.
+
+        :param timeout: Seconds to wait for it at most
+        """
+        worker = self._worker
+        if worker is None or not worker.is_alive():
+            return
+        try:
+            self._jobs.put(('stop', None), timeout=timeout)
+        except queue.Full:
+            return
+        worker.join(timeout)
+
+    def _evict(self):
+        # Called with the lock held.
+        least = min(self.shapes.values(), key=lambda other: other.total)
+        del self.shapes[least.shape]
+        self.evicted += 1
+
+    def _is_worst(self, stats):
+        if len(self.shapes) <= self.explain_top:
+            return True
+        worse = sum(1 for other in self.shapes.values()
+                    if other.total > stats.total)
+        return worse < self.explain_top
+
+    def _submit(self, job):
+        self._ensure_worker()
+        try:
+            self._jobs.put_nowait(job)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+
+    def _ensure_worker(self):
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(
+                    target=self._run, name='slow-query-log', daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        while True:
+            kind, payload = self._jobs.get()
+            if kind == 'stop':
+                self._jobs.task_done()
+                return
+            try:
+                if kind == 'record':
+                    self._write(payload)
+                else:
+                    self._explain(*payload)
+            except Exception:
+                logger.exception('Slow query log job failed')
+            finally:
+                self._jobs.task_done()
+
+    def _explain(self, stats, alias, sql, params):
+        if sql.lstrip()[:6].upper() != 'SELECT':
+            return
+        connection = connections[alias]
+        prefix = ('EXPLAIN QUERY PLAN ' if connection.vendor == 'sqlite'
+                  else 'EXPLAIN ')
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(prefix + sql, params)
+                rows = cursor.fetchall()
+        finally:
+            connection.close()
+        stats.plan = '\n'.join(
+            ' | '.join(str(column) for column in row) for row in rows)
+        if self.path:
+            self._write({'type': 'plan', 'shape': stats.shape,
+                         'alias': alias, 'plan': stats.plan})
+
+    def _write(self, line):
+        data = json.dumps(line, default=str) + '\n'
+        # Other processes append to the same file; without the lock two of
+        # them could both rotate it and lose the first rotated half.
+        with open(f'{self.path}.lock', 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                if os.path.getsize(self.path) > self.max_bytes:
+                    os.replace(self.path, f'{self.path}.1')
+            except FileNotFoundError:
+                pass
+            with open(self.path, 'a', encoding='utf-8') as log_file:
+                log_file.write(data)
+
+
+_slow_log = None
+_slow_log_lock = threading.Lock()
+
+
+def get_config():
+    return {
+        **DEFAULT_SLOW_QUERY_LOG,
+        **getattr(settings, 'SLOW_QUERY_LOG', {}),
+    }
+
+
+def get_slow_log():
+    """
+    Return the process-wide slow query log, or None if it is disabled.
+    """
+    global _slow_log
+    if _slow_log is None:
+        with _slow_log_lock:
+            if _slow_log is None:
+                config = get_config()
+                if not config['ENABLED']:
+                    return None
+                _slow_log = SlowQueryLog(
+                    threshold_ms=config['THRESHOLD_MS'],
+                    buffer_size=config['BUFFER_SIZE'],
+                    explain_top=config['EXPLAIN_TOP'],
+                    path=config['PATH'],
+                    max_bytes=config['MAX_BYTES'],
+                    queue_size=config['QUEUE_SIZE'],
+                    max_shapes=config['MAX_SHAPES'],
+                )
+    return _slow_log
+
+
+def reset_slow_log():
+    """
+    Forget the process-wide slow query log (used when settings change).
+    """
+    global _slow_log
+    with _slow_log_lock:
+        old, _slow_log = _slow_log, None
+    if old is not None:
+        old.close()
+
+
+@receiver(setting_changed)
+def reload_slow_log(setting, **kwargs):
+    if setting == 'SLOW_QUERY_LOG':
+        reset_slow_log()
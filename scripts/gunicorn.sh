@@ -7,6 +7,7 @@ cd /var/lib/jenkins/workspace/django-cicd/app
 python3 manage.py makemigrations
 python3 manage.py migrate
 python3 manage.py collectstatic -- no-input
+python3 manage.py build_schema
 
 echo "Migrations done"
 